@@ -1,3 +1,5 @@
+from collections.abc import Callable
+
 from fastapi import APIRouter, Depends, HTTPException, Path, Query
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -24,6 +26,7 @@ def generate_crud_router(
     parameter_name: str = "tg_id",
     extra_get_by_email: bool = False,
     enabled_methods: list[str] = ("get_all", "get_one", "get_by_email", "create", "update", "delete"),
+    on_change: Callable[[], None] | None = None,
 ) -> APIRouter:
     router = APIRouter()
 
@@ -98,6 +101,8 @@ def generate_crud_router(
             session.add(obj)
             await session.commit()
             await session.refresh(obj)
+            if on_change:
+                on_change()
             return obj
 
     if "update" in enabled_methods:
@@ -121,6 +126,8 @@ def generate_crud_router(
 
             await session.commit()
             await session.refresh(obj)
+            if on_change:
+                on_change()
             return obj
 
     if "delete" in enabled_methods:
@@ -140,6 +147,8 @@ def generate_crud_router(
 
             await session.delete(obj)
             await session.commit()
+            if on_change:
+                on_change()
             return {"detail": f"{model.__name__} deleted"}
 
     return router
@@ -7,6 +7,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from api.depends import get_session, verify_admin_token
 from api.routes.base_crud import generate_crud_router
 from api.schemas.keys import KeyBase, KeyCreateRequest, KeyResponse, KeyUpdate
+from database import adjust_key_count
 from database.models import Admin, Key, Tariff
 from handlers.keys.operations import create_key_on_cluster, delete_key_from_cluster, renew_key_in_cluster
 from logger import logger
@@ -44,6 +45,7 @@ async def delete_key_by_email(
         )
         await session.delete(db_key)
         await session.commit()
+        adjust_key_count(db_key.server_id, -1)
         logger.info(f"[API] Ключ удалён: {db_key.client_id}")
         return {"message": "Ключ успешно удалён"}
 
@@ -13,7 +13,7 @@ from api.schemas import (
     TemporaryDataResponse,
     TrackingSourceResponse,
 )
-from database import get_tracking_source_stats
+from database import get_tracking_source_stats, invalidate_blocked_cache
 from database.models import (
     Admin,
     BlockedUser,
@@ -107,6 +107,7 @@ router.include_router(
         schema_update=None,
         identifier_field="tg_id",
         enabled_methods=["get_all", "get_one", "delete"],
+        on_change=invalidate_blocked_cache,
     ),
     prefix="/blocked-users",
     tags=["Bans"],
@@ -3,6 +3,7 @@ from fastapi import APIRouter
 from api.routes.base_crud import generate_crud_router
 from api.schemas import ServerBase, ServerResponse, ServerUpdate
 from database.models import Server
+from database.servers import invalidate_servers_cache
 
 
 router: APIRouter = generate_crud_router(
@@ -13,4 +14,5 @@ router: APIRouter = generate_crud_router(
     identifier_field="server_name",
     parameter_name="server_name",
     enabled_methods=["get_all", "get_one", "create", "update", "delete"],
+    on_change=invalidate_servers_cache,
 )
@@ -3,6 +3,7 @@ from fastapi import APIRouter
 from api.routes.base_crud import generate_crud_router
 from api.schemas import TariffBase, TariffResponse, TariffUpdate
 from database.models import Tariff
+from database.tariffs import invalidate_tariff_cache
 
 
 router: APIRouter = generate_crud_router(
@@ -13,4 +14,5 @@ router: APIRouter = generate_crud_router(
     identifier_field="name",
     parameter_name="name",
     enabled_methods=["get_all", "get_one", "create", "update", "delete"],
+    on_change=invalidate_tariff_cache,
 )
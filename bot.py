@@ -1,23 +1,29 @@
+import asyncio
 import traceback
 
+from datetime import datetime, timedelta
+
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
 from aiogram.filters import ExceptionTypeFilter
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import BufferedInputFile, ErrorEvent
 from aiogram.utils.markdown import hbold
 
+import config as cfg
+
 from config import ADMIN_ID, API_TOKEN
 from database import async_session_maker
 from filters.private import IsPrivateFilter
 from logger import logger
 from utils.modules_loader import load_modules_from_folder, modules_hub
+from utils.shared_storage import create_fsm_storage
+from utils.update_sharding import is_primary_worker
 
 
 bot = Bot(token=API_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-storage = MemoryStorage()
+storage = create_fsm_storage()
 dp = Dispatcher(bot=bot, storage=storage)
 
 dp.include_router(modules_hub)
@@ -27,6 +33,100 @@ load_modules_from_folder()
 dp.message.filter(IsPrivateFilter())
 dp.callback_query.filter(IsPrivateFilter())
 
+PAYMENT_SWEEP_INTERVAL = 600
+
+_periodic_tasks: list[asyncio.Task] = []
+
+
+async def _check_servers_loop():
+    from servers import check_servers
+
+    async with async_session_maker() as session:
+        await check_servers(session)
+
+
+async def _backup_loop(interval: float):
+    from utils.backup import backup_database
+
+    while True:
+        await asyncio.sleep(interval)
+        await backup_database()
+
+
+async def _payment_sweep_loop():
+    from database import cancel_expired_pending_payments
+
+    while True:
+        try:
+            async with async_session_maker() as session:
+                cancelled = await cancel_expired_pending_payments(session)
+            if cancelled:
+                logger.info(f"[Shard] Отменено просроченных платежей: {cancelled}")
+        except Exception as e:
+            logger.error(f"[Shard] Ошибка отмены просроченных платежей: {e}")
+        await asyncio.sleep(PAYMENT_SWEEP_INTERVAL)
+
+
+async def _daily_stats_loop():
+    """Ежедневный отчёт за прошедшие сутки сразу после полуночи по Москве."""
+    import pytz
+
+    from handlers.admin.stats.stats_handler import send_daily_stats_report
+
+    moscow_tz = pytz.timezone("Europe/Moscow")
+    while True:
+        now = datetime.now(moscow_tz)
+        next_midnight = moscow_tz.localize(datetime.combine(now.date() + timedelta(days=1), datetime.min.time()))
+        await asyncio.sleep((next_midnight - now).total_seconds())
+        async with async_session_maker() as session:
+            await send_daily_stats_report(session)
+
+
+async def _start_periodic_jobs(bot: Bot):
+    """
+    Уведомления, проверка серверов, бэкапы, отмена просроченных платежей и ежедневный отчёт —
+    только в воркере №0, чтобы не выполнять их N раз.
+    """
+    if not is_primary_worker() or _periodic_tasks:
+        return
+    from handlers.notifications.general_notifications import periodic_notifications
+
+    jobs = [
+        periodic_notifications(bot, sessionmaker=async_session_maker),
+        _check_servers_loop(),
+        _payment_sweep_loop(),
+        _daily_stats_loop(),
+    ]
+    backup_interval = getattr(cfg, "BACKUP_TIME", 0)
+    if backup_interval:
+        jobs.append(_backup_loop(backup_interval))
+    _periodic_tasks.extend(asyncio.create_task(job) for job in jobs)
+    logger.info(f"[Shard] Периодические задачи запущены: {len(_periodic_tasks)}")
+
+
+async def _stop_periodic_jobs():
+    for task in _periodic_tasks:
+        task.cancel()
+    await asyncio.gather(*_periodic_tasks, return_exceptions=True)
+    _periodic_tasks.clear()
+
+
+def create_worker_dispatcher() -> tuple[Dispatcher, Bot]:
+    """
+    Диспетчер воркера шардированного приёма вебхуков (utils.update_sharding): роутеры handlers
+    и fallback_router, middleware с sessionmaker — как при обычном запуске, плюс периодические задачи в воркере №0.
+    """
+    from handlers import router
+    from handlers.fallback_router import fallback_router
+    from middlewares import register_middleware
+
+    dp.include_router(router)
+    dp.include_router(fallback_router)
+    register_middleware(dp, sessionmaker=async_session_maker)
+    dp.startup.register(_start_periodic_jobs)
+    dp.shutdown.register(_stop_periodic_jobs)
+    return dp, bot
+
 
 @dp.errors(ExceptionTypeFilter(Exception))
 async def errors_handler(event: ErrorEvent, bot: Bot) -> bool:
@@ -1,11 +1,14 @@
 from .bans import *
+from .broadcasts import *
 from .coupons import *
 from .db import async_session_maker
 from .gifts import *
 from .hot_leads import *
 from .init_db import *
 from .keys import *
+from .media import *
 from .notifications import *
+from .outbox import *
 from .payments import *
 from .referrals import *
 from .servers import *
@@ -13,4 +16,5 @@ from .statistics import *
 from .tariffs import *
 from .temporary_data import *
 from .tracking_sources import *
+from .traffic import *
 from .users import *
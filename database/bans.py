@@ -1,10 +1,98 @@
+import time
+
+from sqlalchemy import select
 from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.models import BlockedUser
+from logger import logger
+from utils.shared_storage import get_invalidation_token, publish_invalidation
+
+
+BLOCKED_CACHE_TTL = 300
+BLOCKED_FLUSH_BATCH_SIZE = 1000
+
+_blocked_ids: set[int] | None = None
+_blocked_loaded_at = 0.0
+_blocked_token: str | None = None
+_pending_blocked: set[int] = set()
 
 
 async def create_blocked_user(session: AsyncSession, tg_id: int):
     stmt = insert(BlockedUser).values(tg_id=tg_id).on_conflict_do_nothing(index_elements=[BlockedUser.tg_id])
     await session.execute(stmt)
     await session.commit()
+    publish_invalidation("blocked_users")
+    if _blocked_ids is not None:
+        _blocked_ids.add(tg_id)
+
+
+async def create_blocked_users_bulk(session: AsyncSession, tg_ids) -> int:
+    """Добавляет пользователей в blocked_users пачками многострочного INSERT с одним коммитом."""
+    tg_ids = list(dict.fromkeys(tg_ids))
+    if not tg_ids:
+        return 0
+    for i in range(0, len(tg_ids), BLOCKED_FLUSH_BATCH_SIZE):
+        chunk = tg_ids[i : i + BLOCKED_FLUSH_BATCH_SIZE]
+        stmt = (
+            insert(BlockedUser)
+            .values([{"tg_id": tg_id} for tg_id in chunk])
+            .on_conflict_do_nothing(index_elements=[BlockedUser.tg_id])
+        )
+        await session.execute(stmt)
+    await session.commit()
+    publish_invalidation("blocked_users")
+    if _blocked_ids is not None:
+        _blocked_ids.update(tg_ids)
+    return len(tg_ids)
+
+
+def mark_user_blocked(tg_id: int):
+    """
+    Запоминает пользователя, заблокировавшего бота, без записи в БД.
+    Запись выполняет flush_blocked_users одним запросом на всю накопленную пачку.
+    """
+    _pending_blocked.add(tg_id)
+    if _blocked_ids is not None:
+        _blocked_ids.add(tg_id)
+
+
+async def flush_blocked_users(session: AsyncSession) -> int:
+    global _pending_blocked
+    if not _pending_blocked:
+        return 0
+    pending, _pending_blocked = _pending_blocked, set()
+    try:
+        count = await create_blocked_users_bulk(session, pending)
+    except Exception as e:
+        await session.rollback()
+        _pending_blocked |= pending
+        logger.error(f"❌ Ошибка при сохранении {len(pending)} заблокировавших пользователей: {e}")
+        return 0
+    logger.info(f"Добавлено в blocked_users: {count}")
+    return count
+
+
+async def get_blocked_user_ids(session: AsyncSession) -> frozenset[int]:
+    """
+    Множество tg_id из blocked_users вместе с ещё не записанными, кэшируется на BLOCKED_CACHE_TTL.
+    Перечитывается раньше, если другой процесс записал новых заблокировавших или сбросил кэш.
+    """
+    global _blocked_ids, _blocked_loaded_at, _blocked_token
+    token = await get_invalidation_token("blocked_users")
+    if (
+        _blocked_ids is None
+        or token != _blocked_token
+        or time.monotonic() - _blocked_loaded_at > BLOCKED_CACHE_TTL
+    ):
+        result = await session.execute(select(BlockedUser.tg_id))
+        _blocked_ids = set(result.scalars().all()) | _pending_blocked
+        _blocked_token = token
+        _blocked_loaded_at = time.monotonic()
+    return frozenset(_blocked_ids)
+
+
+def invalidate_blocked_cache():
+    global _blocked_ids
+    _blocked_ids = None
+    publish_invalidation("blocked_users")
@@ -0,0 +1,88 @@
+from datetime import datetime
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import BroadcastJob
+from logger import logger
+
+
+BROADCAST_ACTIVE_STATUSES = ("running", "paused")
+
+
+async def create_broadcast_job(
+    session: AsyncSession,
+    send_to: str,
+    cluster_name: str | None,
+    text: str,
+    photo: str | None,
+    keyboard: dict | None,
+    created_by: int,
+    total: int,
+    source_chat_id: int | None = None,
+    source_message_id: int | None = None,
+) -> BroadcastJob:
+    job = BroadcastJob(
+        status="running",
+        send_to=send_to,
+        cluster_name=cluster_name,
+        text=text,
+        photo=photo,
+        keyboard=keyboard,
+        source_chat_id=source_chat_id,
+        source_message_id=source_message_id,
+        created_by=created_by,
+        total=total,
+        cursor=None,
+        sent=0,
+        failed=0,
+        blocked=0,
+    )
+    session.add(job)
+    await session.commit()
+    logger.info(f"[Broadcast] Создана рассылка #{job.id} ({send_to}), получателей: {total}")
+    return job
+
+
+async def get_broadcast_job(session: AsyncSession, job_id: int) -> BroadcastJob | None:
+    result = await session.execute(
+        select(BroadcastJob).where(BroadcastJob.id == job_id).execution_options(populate_existing=True)
+    )
+    return result.scalar_one_or_none()
+
+
+async def get_broadcast_jobs(session: AsyncSession, statuses: tuple[str, ...]) -> list[BroadcastJob]:
+    result = await session.execute(
+        select(BroadcastJob).where(BroadcastJob.status.in_(statuses)).order_by(BroadcastJob.id)
+    )
+    return list(result.scalars().all())
+
+
+async def update_broadcast_job(session: AsyncSession, job_id: int, **values):
+    values["updated_at"] = datetime.utcnow()
+    await session.execute(update(BroadcastJob).where(BroadcastJob.id == job_id).values(**values))
+    await session.commit()
+
+
+async def checkpoint_broadcast_job(
+    session: AsyncSession, job_id: int, cursor: int, sent: int, failed: int, blocked: int
+) -> str | None:
+    """
+    Сдвигает курсор рассылки и прибавляет счётчики за обработанную страницу.
+    Возвращает актуальный статус задачи (его мог поменять администратор).
+    """
+    result = await session.execute(
+        update(BroadcastJob)
+        .where(BroadcastJob.id == job_id)
+        .values(
+            cursor=cursor,
+            sent=BroadcastJob.sent + sent,
+            failed=BroadcastJob.failed + failed,
+            blocked=BroadcastJob.blocked + blocked,
+            updated_at=datetime.utcnow(),
+        )
+        .returning(BroadcastJob.status)
+    )
+    status = result.scalar_one_or_none()
+    await session.commit()
+    return status
@@ -2,6 +2,7 @@ import json
 import sqlite3
 import time
 
+from collections import Counter
 from datetime import datetime
 from itertools import cycle
 
@@ -10,12 +11,14 @@ from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from config import USE_COUNTRY_SELECTION
+from database.keys import adjust_key_count
 from database.models import Key, Server, User
 
 
 async def import_keys_from_3xui_db(db_path: str, session: AsyncSession) -> tuple[int, int]:
     imported = 0
     skipped = 0
+    added_per_server = Counter()
 
     if USE_COUNTRY_SELECTION:
         result = await session.execute(
@@ -116,8 +119,11 @@ async def import_keys_from_3xui_db(db_path: str, session: AsyncSession) -> tuple
                 )
             )
             imported += 1
+            added_per_server[server_id] += 1
         except SQLAlchemyError:
             continue
 
     await session.commit()
+    for server_id, count in added_per_server.items():
+        adjust_key_count(server_id, count)
     return imported, skipped
@@ -8,9 +8,16 @@ from database.models import Admin, Base, User
 from database.tariffs import initialize_all_tariff_weights
 
 
+def ensure_indexes(sync_conn):
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
+
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(ensure_indexes)
 
     async with async_session_maker() as session:
         result = await session.execute(select(User).where(User.tg_id == 0))
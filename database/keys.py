@@ -1,11 +1,60 @@
+import time
+
+from collections.abc import AsyncIterator
 from datetime import datetime
 
-from sqlalchemy import delete, func, select, text, update
+from sqlalchemy import delete, func, select, text, tuple_, update
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.models import Key, User
 from logger import logger
+from utils.shared_storage import get_invalidation_token, publish_invalidation
+
+
+KEY_COUNTS_TTL = 60
+
+_key_counts: dict[str, int] | None = None
+_key_counts_loaded_at = 0.0
+_key_counts_token: str | None = None
+
+
+def invalidate_key_counts():
+    global _key_counts
+    _key_counts = None
+    publish_invalidation("key_counts")
+
+
+def adjust_key_count(server_id: str | None, delta: int):
+    """Поправляет счётчик в памяти процесса; остальные процессы перечитают счётчики по сбросу."""
+    if not server_id:
+        return
+    publish_invalidation("key_counts")
+    if _key_counts is None:
+        return
+    _key_counts[server_id] = max(0, _key_counts.get(server_id, 0) + delta)
+
+
+async def get_key_counts(session: AsyncSession) -> dict[str, int]:
+    """
+    Количество ключей по server_id (кластер или сервер). Один GROUP BY раз в KEY_COUNTS_TTL,
+    между загрузками счётчики поправляются через adjust_key_count.
+    """
+    global _key_counts, _key_counts_loaded_at, _key_counts_token
+
+    token = await get_invalidation_token("key_counts")
+    if (
+        _key_counts is not None
+        and token == _key_counts_token
+        and time.monotonic() - _key_counts_loaded_at < KEY_COUNTS_TTL
+    ):
+        return _key_counts
+
+    result = await session.execute(select(Key.server_id, func.count()).group_by(Key.server_id))
+    _key_counts = {server_id: count for server_id, count in result.all() if server_id}
+    _key_counts_token = token
+    _key_counts_loaded_at = time.monotonic()
+    return _key_counts
 
 
 async def store_key(
@@ -23,6 +72,7 @@ async def store_key(
     try:
         exists = await session.execute(select(Key).where(Key.tg_id == tg_id, Key.client_id == client_id))
         existing_key = exists.scalar_one_or_none()
+        previous_server_id = existing_key.server_id if existing_key else None
         
         if existing_key:
             await session.execute(
@@ -57,6 +107,12 @@ async def store_key(
         
         await session.commit()
 
+        if not existing_key:
+            adjust_key_count(server_id, 1)
+        elif previous_server_id != server_id:
+            adjust_key_count(previous_server_id, -1)
+            adjust_key_count(server_id, 1)
+
     except SQLAlchemyError as e:
         logger.error(f"❌ Ошибка при сохранении ключа: {e}")
         await session.rollback()
@@ -72,6 +128,78 @@ async def get_all_keys(session: AsyncSession):
     return result.scalars().all()
 
 
+KEYS_PAGE_SIZE = 1000
+
+
+async def stream_expiring_keys(
+    session: AsyncSession,
+    expiry_from: int | None = None,
+    expiry_to: int | None = None,
+    page_size: int = KEYS_PAGE_SIZE,
+) -> AsyncIterator[list[Key]]:
+    """
+    Постранично отдаёт незамороженные ключи с expiry_time в окне (expiry_from, expiry_to].
+    Пагинация по (expiry_time, client_id) идёт через индекс ix_keys_active_expiry,
+    поэтому между страницами можно коммитить и менять ключи.
+    """
+    last = None
+    while True:
+        stmt = select(Key).where(Key.is_frozen.isnot(True), Key.expiry_time.isnot(None))
+        if expiry_from is not None:
+            stmt = stmt.where(Key.expiry_time > expiry_from)
+        if expiry_to is not None:
+            stmt = stmt.where(Key.expiry_time <= expiry_to)
+        if last is not None:
+            stmt = stmt.where(tuple_(Key.expiry_time, Key.client_id) > tuple_(*last))
+        stmt = stmt.order_by(Key.expiry_time, Key.client_id).limit(page_size)
+
+        result = await session.execute(stmt)
+        page = result.scalars().all()
+        if not page:
+            return
+
+        yield page
+
+        if len(page) < page_size:
+            return
+        last = (page[-1].expiry_time, page[-1].client_id)
+
+
+async def stream_unnotified_keys(
+    session: AsyncSession,
+    created_before: int,
+    active_at: int,
+    page_size: int = KEYS_PAGE_SIZE,
+) -> AsyncIterator[list[Key]]:
+    """
+    Постранично отдаёт незамороженные ключи без отметки notified, созданные до created_before
+    и не истёкшие к active_at.
+    """
+    last_client_id = None
+    while True:
+        stmt = select(Key).where(
+            Key.is_frozen.isnot(True),
+            Key.notified.isnot(True),
+            Key.created_at.isnot(None),
+            Key.created_at <= created_before,
+            Key.expiry_time.is_(None) | (Key.expiry_time >= active_at),
+        )
+        if last_client_id is not None:
+            stmt = stmt.where(Key.client_id > last_client_id)
+        stmt = stmt.order_by(Key.client_id).limit(page_size)
+
+        result = await session.execute(stmt)
+        page = result.scalars().all()
+        if not page:
+            return
+
+        yield page
+
+        if len(page) < page_size:
+            return
+        last_client_id = page[-1].client_id
+
+
 async def get_key_by_server(session: AsyncSession, tg_id: int, client_id: str):
     stmt = select(Key).where(Key.tg_id == tg_id, Key.client_id == client_id)
     result = await session.execute(stmt)
@@ -126,8 +254,11 @@ async def get_key_count(session: AsyncSession, tg_id: int) -> int:
 
 async def delete_key(session: AsyncSession, identifier: int | str):
     stmt = delete(Key).where(Key.tg_id == identifier if str(identifier).isdigit() else Key.client_id == identifier)
-    await session.execute(stmt)
+    result = await session.execute(stmt.returning(Key.server_id))
+    deleted_server_ids = result.scalars().all()
     await session.commit()
+    for server_id in deleted_server_ids:
+        adjust_key_count(server_id, -1)
     logger.info(f"Ключ с идентификатором {identifier} удалён")
 
 
@@ -137,6 +268,37 @@ async def update_key_expiry(session: AsyncSession, client_id: str, new_expiry_ti
     logger.info(f"Срок действия ключа {client_id} обновлён до {new_expiry_time}")
 
 
+async def extend_keys_expiry(session: AsyncSession, client_ids: list[str], add_ms: int) -> int:
+    """
+    Сдвигает expiry_time ключей на add_ms одним UPDATE и сбрасывает их уведомления об окончании,
+    как это делает продление одного ключа. Возвращает число обновлённых ключей.
+    """
+    if not client_ids:
+        return 0
+    params = {"client_ids": list(client_ids), "add_ms": add_ms}
+    result = await session.execute(
+        text("UPDATE keys SET expiry_time = expiry_time + :add_ms WHERE client_id = ANY(:client_ids)"),
+        params,
+    )
+    await session.execute(
+        text(
+            """
+            DELETE FROM notifications n
+            USING keys k
+            WHERE k.client_id = ANY(:client_ids)
+              AND n.tg_id = k.tg_id
+              AND n.notification_type IN (
+                  k.email || '_key_24h', k.email || '_key_10h', k.email || '_key_expired', k.email || '_renew'
+              )
+            """
+        ),
+        {"client_ids": params["client_ids"]},
+    )
+    await session.commit()
+    logger.info(f"Срок действия {result.rowcount} ключей сдвинут на {add_ms} мс")
+    return result.rowcount or 0
+
+
 async def get_client_id_by_email(session: AsyncSession, email: str):
     result = await session.execute(select(Key.client_id).where(Key.email == email))
     return result.scalar_one_or_none()
@@ -0,0 +1,68 @@
+from datetime import datetime
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import MediaFile
+from logger import logger
+
+
+_media_file_ids: dict[str, tuple[int, str]] = {}
+
+
+async def get_media_file_id(session: AsyncSession, path: str, mtime_ns: int) -> str | None:
+    """
+    Возвращает Telegram file_id для файла, если он уже загружался в текущей версии (path + mtime).
+    Сначала смотрит в память процесса, затем в таблицу media_files.
+    """
+    cached = _media_file_ids.get(path)
+    if cached and cached[0] == mtime_ns:
+        return cached[1]
+
+    result = await session.execute(select(MediaFile.mtime_ns, MediaFile.file_id).where(MediaFile.path == path))
+    row = result.first()
+    if not row or row.mtime_ns != mtime_ns:
+        return None
+
+    _media_file_ids[path] = (row.mtime_ns, row.file_id)
+    return row.file_id
+
+
+async def save_media_file_id(session: AsyncSession, path: str, mtime_ns: int, file_id: str, media_type: str):
+    """Сохраняет file_id загруженного файла. Запись для старой версии файла перезаписывается."""
+    _media_file_ids[path] = (mtime_ns, file_id)
+    try:
+        stmt = insert(MediaFile).values(
+            path=path,
+            mtime_ns=mtime_ns,
+            file_id=file_id,
+            media_type=media_type,
+            updated_at=datetime.utcnow(),
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[MediaFile.path],
+            set_={
+                "mtime_ns": stmt.excluded.mtime_ns,
+                "file_id": stmt.excluded.file_id,
+                "media_type": stmt.excluded.media_type,
+                "updated_at": stmt.excluded.updated_at,
+            },
+        )
+        await session.execute(stmt)
+        await session.commit()
+    except SQLAlchemyError as e:
+        logger.error(f"❌ Ошибка при сохранении file_id для {path}: {e}")
+        await session.rollback()
+
+
+async def forget_media_file_id(session: AsyncSession, path: str):
+    """Удаляет file_id, который Telegram перестал принимать."""
+    _media_file_ids.pop(path, None)
+    try:
+        await session.execute(delete(MediaFile).where(MediaFile.path == path))
+        await session.commit()
+    except SQLAlchemyError as e:
+        logger.error(f"❌ Ошибка при удалении file_id для {path}: {e}")
+        await session.rollback()
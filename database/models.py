@@ -11,11 +11,13 @@ from sqlalchemy import (
     DateTime,
     Float,
     ForeignKey,
+    Index,
     Integer,
     Numeric,
     String,
     Text,
     UniqueConstraint,
+    text,
 )
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, declarative_base, mapped_column, relationship
@@ -77,6 +79,15 @@ class Key(DictLikeMixin, Base):
     notified = Column(Boolean, default=False)
     notified_24h = Column(Boolean, default=False)
 
+    __table_args__ = (
+        Index(
+            "ix_keys_active_expiry",
+            "expiry_time",
+            "client_id",
+            postgresql_where=text("is_frozen IS NOT TRUE"),
+        ),
+    )
+
 
 class Tariff(DictLikeMixin, Base):
     __tablename__ = "tariffs"
@@ -239,6 +250,72 @@ class BlockedUser(DictLikeMixin, Base):
     tg_id = Column(BigInteger, primary_key=True)
 
 
+class MediaFile(DictLikeMixin, Base):
+    __tablename__ = "media_files"
+
+    path = Column(String, primary_key=True)
+    mtime_ns = Column(BigInteger, nullable=False)
+    file_id = Column(String, nullable=False)
+    media_type = Column(String, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class BroadcastJob(DictLikeMixin, Base):
+    __tablename__ = "broadcast_jobs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    status = Column(String, nullable=False, default="running")
+    send_to = Column(String, nullable=False)
+    cluster_name = Column(String, nullable=True)
+    text = Column(Text)
+    photo = Column(String, nullable=True)
+    keyboard = Column(JSON, nullable=True)
+    source_chat_id = Column(BigInteger, nullable=True)
+    source_message_id = Column(Integer, nullable=True)
+    created_by = Column(BigInteger)
+    total = Column(Integer, default=0)
+    cursor = Column(BigInteger, nullable=True)
+    sent = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    blocked = Column(Integer, default=0)
+    progress_chat_id = Column(BigInteger, nullable=True)
+    progress_message_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class OutboxMessage(DictLikeMixin, Base):
+    __tablename__ = "outbox_messages"
+    __table_args__ = (Index("ix_outbox_pending", "priority", "id", postgresql_where=text("status = 'pending'")),)
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    chat_id = Column(BigInteger, nullable=False)
+    priority = Column(Integer, nullable=False, default=50)
+    message_class = Column(String, nullable=False, default="notification")
+    dedup_key = Column(String, unique=True, nullable=True)
+    text = Column(Text, nullable=False)
+    photo = Column(String, nullable=True)
+    keyboard = Column(JSON, nullable=True)
+    parse_mode = Column(String, nullable=True)
+    status = Column(String, nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    available_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+
+class KeyTraffic(DictLikeMixin, Base):
+    __tablename__ = "key_traffic"
+
+    client_id = Column(String, primary_key=True)
+    server_name = Column(String, primary_key=True)
+    up = Column(BigInteger, nullable=False, default=0)
+    down = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
 class TrackingSource(DictLikeMixin, Base):
     __tablename__ = "tracking_sources"
 
@@ -10,6 +10,9 @@ from database.models import Key, Notification, User
 from logger import logger
 
 
+NOTIFICATIONS_BULK_CHUNK = 5000
+
+
 async def add_notification(session: AsyncSession, tg_id: int, notification_type: str):
     try:
         stmt = (
@@ -32,6 +35,64 @@ async def add_notification(session: AsyncSession, tg_id: int, notification_type:
         await session.rollback()
 
 
+async def add_notifications_bulk(session: AsyncSession, entries: list[tuple[int, str]]) -> int:
+    """
+    Записывает время отправки для пар (tg_id, notification_type) пачками INSERT ... ON CONFLICT
+    по NOTIFICATIONS_BULK_CHUNK строк, каждая пачка коммитится отдельно. Возвращает число записанных пар.
+    """
+    unique_entries = list(dict.fromkeys(entries))
+    if not unique_entries:
+        return 0
+
+    now = datetime.utcnow()
+    saved = 0
+    for i in range(0, len(unique_entries), NOTIFICATIONS_BULK_CHUNK):
+        chunk = unique_entries[i : i + NOTIFICATIONS_BULK_CHUNK]
+        try:
+            stmt = insert(Notification).values([
+                {"tg_id": tg_id, "notification_type": notification_type, "last_notification_time": now}
+                for tg_id, notification_type in chunk
+            ])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Notification.tg_id, Notification.notification_type],
+                set_={"last_notification_time": stmt.excluded.last_notification_time},
+            )
+            await session.execute(stmt)
+            await session.commit()
+            saved += len(chunk)
+        except SQLAlchemyError as e:
+            logger.error(f"❌ Ошибка при массовом добавлении уведомлений, не записано {len(chunk)}: {e}")
+            await session.rollback()
+
+    lost = len(unique_entries) - saved
+    if lost:
+        logger.error(f"❌ Не записано {lost} из {len(unique_entries)} уведомлений — они будут отправлены повторно")
+    logger.info(f"✅ Записано {saved} уведомлений")
+    return saved
+
+
+async def get_notification_times(
+    session: AsyncSession, tg_ids: list[int], notification_types: list[str]
+) -> dict[tuple[int, str], datetime]:
+    """Загружает last_notification_time для набора пользователей и типов уведомлений одним запросом."""
+    if not tg_ids or not notification_types:
+        return {}
+
+    stmt = select(Notification.tg_id, Notification.notification_type, Notification.last_notification_time).where(
+        Notification.tg_id.in_(set(tg_ids)),
+        Notification.notification_type.in_(set(notification_types)),
+    )
+    result = await session.execute(stmt)
+    return {(row.tg_id, row.notification_type): row.last_notification_time for row in result}
+
+
+def can_notify_from(times: dict[tuple[int, str], datetime], tg_id: int, notification_type: str, hours: int) -> bool:
+    last_time = times.get((tg_id, notification_type))
+    if not last_time:
+        return True
+    return datetime.utcnow() - last_time > timedelta(hours=hours)
+
+
 async def delete_notification(session: AsyncSession, tg_id: int, notification_type: str):
     await session.execute(
         delete(Notification).where(
@@ -105,7 +166,8 @@ async def check_notifications_bulk(
 ) -> list[dict]:
     from sqlalchemy import select
 
-    from database.models import BlockedUser, Notification
+    from database.bans import get_blocked_user_ids
+    from database.models import Notification
 
     try:
         now = datetime.utcnow()
@@ -133,7 +195,6 @@ async def check_notifications_bulk(
             stmt = stmt.where(
                 and_(
                     User.trial.in_([0, -1]),
-                    ~User.tg_id.in_(select(BlockedUser.tg_id)),
                     ~User.tg_id.in_(select(Key.tg_id.distinct())),
                 )
             )
@@ -143,10 +204,13 @@ async def check_notifications_bulk(
         if emails:
             stmt = stmt.where(Key.email.in_(emails))
 
+        blocked_ids = await get_blocked_user_ids(session) if notification_type == "inactive_trial" else frozenset()
         result = await session.execute(stmt)
         users = []
 
         for row in result:
+            if row.tg_id in blocked_ids:
+                continue
             last_time = row.last_notification_time
             can_notify = not last_time or (now - last_time > timedelta(hours=hours))
 
@@ -0,0 +1,181 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import OutboxMessage
+from logger import logger
+
+
+OUTBOX_PRIORITY_TRANSACTIONAL = 0
+OUTBOX_PRIORITY_ALERT = 10
+OUTBOX_PRIORITY_NOTIFICATION = 50
+OUTBOX_PRIORITY_BULK = 100
+
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_SENDING_TIMEOUT = timedelta(minutes=5)
+
+
+async def enqueue_outbox_message(
+    session: AsyncSession,
+    chat_id: int,
+    text: str,
+    priority: int = OUTBOX_PRIORITY_NOTIFICATION,
+    message_class: str = "notification",
+    dedup_key: str | None = None,
+    photo: str | None = None,
+    keyboard: dict | None = None,
+    parse_mode: str | None = None,
+) -> bool:
+    """
+    Ставит сообщение в очередь outbox_messages в транзакции вызывающего — коммит остаётся за ним,
+    так что сообщение появится в очереди вместе с породившими его изменениями.
+    Сообщение с уже существующим dedup_key не добавляется повторно. Возвращает True, если запись создана.
+    """
+    try:
+        async with session.begin_nested():
+            stmt = (
+                insert(OutboxMessage)
+                .values(
+                    chat_id=chat_id,
+                    text=text,
+                    priority=priority,
+                    message_class=message_class,
+                    dedup_key=dedup_key,
+                    photo=photo,
+                    keyboard=keyboard,
+                    parse_mode=parse_mode,
+                    status="pending",
+                    attempts=0,
+                    created_at=datetime.utcnow(),
+                    available_at=datetime.utcnow(),
+                )
+                .on_conflict_do_nothing(index_elements=[OutboxMessage.dedup_key])
+                .returning(OutboxMessage.id)
+            )
+            result = await session.execute(stmt)
+            created = result.scalar_one_or_none() is not None
+        return created
+    except SQLAlchemyError as e:
+        logger.error(f"[Outbox] Ошибка постановки сообщения для {chat_id} в очередь: {e}")
+        return False
+
+
+async def claim_outbox_messages(session: AsyncSession, limit: int) -> list[OutboxMessage]:
+    """
+    Забирает до limit готовых к отправке сообщений в порядке приоритета и переводит их в статус sending.
+    SKIP LOCKED позволяет нескольким диспетчерам не делить одни и те же записи.
+    """
+    now = datetime.utcnow()
+    candidates = (
+        select(OutboxMessage.id)
+        .where(OutboxMessage.status == "pending", OutboxMessage.available_at <= now)
+        .order_by(OutboxMessage.priority, OutboxMessage.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    result = await session.execute(
+        update(OutboxMessage)
+        .where(OutboxMessage.id.in_(candidates))
+        .values(status="sending", attempts=OutboxMessage.attempts + 1, available_at=now)
+        .returning(OutboxMessage)
+        .execution_options(synchronize_session=False)
+    )
+    messages = sorted(result.scalars().all(), key=lambda m: (m.priority, m.id))
+    await session.commit()
+    return messages
+
+
+async def mark_outbox_sent(session: AsyncSession, message_ids: list[int]):
+    if not message_ids:
+        return
+    await session.execute(
+        update(OutboxMessage)
+        .where(OutboxMessage.id.in_(message_ids))
+        .values(status="sent", sent_at=datetime.utcnow(), last_error=None)
+    )
+    await session.commit()
+
+
+async def mark_outbox_failed(session: AsyncSession, message_id: int, error: str, retry_in: float | None = None):
+    """Откладывает повтор на retry_in секунд; без retry_in или после OUTBOX_MAX_ATTEMPTS попыток — failed."""
+    values = {"last_error": error[:1000]}
+    if retry_in is None:
+        values["status"] = "failed"
+    else:
+        values["status"] = "pending"
+        values["available_at"] = datetime.utcnow() + timedelta(seconds=retry_in)
+    await session.execute(
+        update(OutboxMessage)
+        .where(OutboxMessage.id == message_id)
+        .values(**values)
+    )
+    await session.commit()
+
+
+async def reset_stale_outbox_messages(session: AsyncSession) -> int:
+    """Возвращает в очередь сообщения, зависшие в sending после аварийной остановки."""
+    result = await session.execute(
+        update(OutboxMessage)
+        .where(
+            OutboxMessage.status == "sending",
+            OutboxMessage.available_at < datetime.utcnow() - OUTBOX_SENDING_TIMEOUT,
+        )
+        .values(status="pending")
+    )
+    await session.commit()
+    return result.rowcount or 0
+
+
+async def get_outbox_latency_stats(session: AsyncSession, since: datetime) -> list[dict]:
+    """Количество и задержка доставки (created_at → sent_at) по классам сообщений с момента since."""
+    latency = func.extract("epoch", OutboxMessage.sent_at - OutboxMessage.created_at)
+    result = await session.execute(
+        select(
+            OutboxMessage.message_class,
+            func.count().label("sent"),
+            func.avg(latency).label("avg_latency"),
+            func.max(latency).label("max_latency"),
+        )
+        .where(OutboxMessage.status == "sent", OutboxMessage.sent_at >= since)
+        .group_by(OutboxMessage.message_class)
+    )
+    pending = await session.execute(
+        select(OutboxMessage.message_class, func.count())
+        .where(OutboxMessage.status.in_(("pending", "sending")))
+        .group_by(OutboxMessage.message_class)
+    )
+    pending_by_class = dict(pending.all())
+
+    stats = []
+    for row in result:
+        stats.append({
+            "message_class": row.message_class,
+            "sent": row.sent,
+            "avg_latency": float(row.avg_latency or 0),
+            "max_latency": float(row.max_latency or 0),
+            "pending": pending_by_class.pop(row.message_class, 0),
+        })
+    for message_class, count in pending_by_class.items():
+        stats.append({
+            "message_class": message_class,
+            "sent": 0,
+            "avg_latency": 0.0,
+            "max_latency": 0.0,
+            "pending": count,
+        })
+    return stats
+
+
+async def purge_outbox(session: AsyncSession, older_than: datetime) -> int:
+    result = await session.execute(
+        delete(OutboxMessage).where(
+            OutboxMessage.status.in_(("sent", "failed")),
+            OutboxMessage.created_at < older_than,
+        )
+    )
+    await session.commit()
+    return result.rowcount or 0
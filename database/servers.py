@@ -1,9 +1,30 @@
+import asyncio
+import time
+
+from types import MappingProxyType
+
 from sqlalchemy import delete, func, insert, select, update
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from database.keys import invalidate_key_counts
 from database.models import Key, Server, ServerSpecialgroup, ServerSubgroup, Tariff
 from logger import logger
+from utils.shared_storage import get_invalidation_token, publish_invalidation
+
+
+TOPOLOGY_CACHE_TTL = 300
+
+_topology: MappingProxyType | None = None
+_topology_loaded_at = 0.0
+_topology_token: str | None = None
+_topology_lock = asyncio.Lock()
+
+
+def invalidate_servers_cache():
+    global _topology
+    _topology = None
+    publish_invalidation("topology")
 
 
 async def create_server(
@@ -24,6 +45,7 @@ async def create_server(
         )
         await session.execute(stmt)
         await session.commit()
+        invalidate_servers_cache()
         logger.info(f"✅ Сервер {server_name} добавлен в кластер {cluster_name}")
     except SQLAlchemyError as e:
         logger.error(f"❌ Ошибка при добавлении сервера {server_name}: {e}")
@@ -36,6 +58,7 @@ async def delete_server(session: AsyncSession, server_name: str):
         stmt = delete(Server).where(Server.server_name == server_name)
         await session.execute(stmt)
         await session.commit()
+        invalidate_servers_cache()
         logger.info(f"🗑 Сервер {server_name} удалён")
     except SQLAlchemyError as e:
         logger.error(f"❌ Ошибка при удалении сервера {server_name}: {e}")
@@ -43,42 +66,38 @@ async def delete_server(session: AsyncSession, server_name: str):
         raise
 
 
-async def get_servers(session: AsyncSession, include_enabled: bool = False) -> dict:
+async def _build_topology(session: AsyncSession) -> MappingProxyType:
     from handlers.utils import ALLOWED_GROUP_CODES
 
-    try:
-        stmt = select(Server)
-        result = await session.execute(stmt)
-        servers = result.scalars().all()
+    result = await session.execute(select(Server))
+    servers = result.scalars().all()
 
-        ids = [s.id for s in servers]
-        subs_map = {}
-        if ids:
-            r = await session.execute(
-                select(ServerSubgroup.server_id, ServerSubgroup.subgroup_title).where(ServerSubgroup.server_id.in_(ids))
-            )
-            for sid, sg in r.all():
-                subs_map.setdefault(sid, []).append(sg)
-
-        groups_map = {}
-        if ids:
-            r2 = await session.execute(
-                select(ServerSpecialgroup.server_id, ServerSpecialgroup.group_code).where(
-                    ServerSpecialgroup.server_id.in_(ids)
-                )
+    ids = [s.id for s in servers]
+    subs_map = {}
+    if ids:
+        r = await session.execute(
+            select(ServerSubgroup.server_id, ServerSubgroup.subgroup_title).where(ServerSubgroup.server_id.in_(ids))
+        )
+        for sid, sg in r.all():
+            subs_map.setdefault(sid, []).append(sg)
+
+    groups_map = {}
+    if ids:
+        r2 = await session.execute(
+            select(ServerSpecialgroup.server_id, ServerSpecialgroup.group_code).where(
+                ServerSpecialgroup.server_id.in_(ids)
             )
-            for sid, gc in r2.all():
-                groups_map.setdefault(sid, []).append(gc)
-
-        allowed = set(ALLOWED_GROUP_CODES)
-
-        grouped = {}
-        for s in servers:
-            if not include_enabled and not s.enabled:
-                continue
-            cluster = s.cluster_name
-            special = sorted({g for g in groups_map.get(s.id, []) if g in allowed})
-            grouped.setdefault(cluster, []).append({
+        )
+        for sid, gc in r2.all():
+            groups_map.setdefault(sid, []).append(gc)
+
+    allowed = set(ALLOWED_GROUP_CODES)
+
+    all_servers = []
+    for s in servers:
+        special = sorted({g for g in groups_map.get(s.id, []) if g in allowed})
+        all_servers.append(
+            MappingProxyType({
                 "server_name": s.server_name,
                 "api_url": s.api_url,
                 "subscription_url": s.subscription_url,
@@ -87,16 +106,91 @@ async def get_servers(session: AsyncSession, include_enabled: bool = False) -> d
                 "enabled": s.enabled,
                 "max_keys": s.max_keys,
                 "tariff_group": s.tariff_group,
-                "tariff_subgroups": subs_map.get(s.id, []),
-                "special_groups": special,
-                "cluster_name": cluster,
+                "tariff_subgroups": tuple(subs_map.get(s.id, [])),
+                "special_groups": tuple(special),
+                "cluster_name": s.cluster_name,
             })
-        return grouped
+        )
+
+    by_cluster, by_cluster_enabled, by_name = {}, {}, {}
+    for server in all_servers:
+        by_cluster.setdefault(server["cluster_name"], []).append(server)
+        if server["enabled"]:
+            by_cluster_enabled.setdefault(server["cluster_name"], []).append(server)
+            by_name.setdefault(server["server_name"].lower(), []).append(server)
+
+    def freeze(index: dict) -> MappingProxyType:
+        return MappingProxyType({k: tuple(v) for k, v in index.items()})
+
+    return MappingProxyType({
+        "by_cluster": freeze(by_cluster),
+        "by_cluster_enabled": freeze(by_cluster_enabled),
+        "by_name": freeze(by_name),
+    })
+
+
+async def get_server_topology(session: AsyncSession) -> MappingProxyType:
+    """
+    Неизменяемый снимок топологии серверов с индексами by_cluster, by_cluster_enabled
+    и by_name (включённые серверы по имени в нижнем регистре). Пересобирается после invalidate_servers_cache,
+    в том числе вызванного в другом процессе.
+    """
+    global _topology, _topology_loaded_at, _topology_token
+
+    token = await get_invalidation_token("topology")
+    topology = _topology
+    if (
+        topology is not None
+        and token == _topology_token
+        and time.monotonic() - _topology_loaded_at < TOPOLOGY_CACHE_TTL
+    ):
+        return topology
+
+    async with _topology_lock:
+        if (
+            _topology is not None
+            and token == _topology_token
+            and time.monotonic() - _topology_loaded_at < TOPOLOGY_CACHE_TTL
+        ):
+            return _topology
+
+        topology = await _build_topology(session)
+        _topology = topology
+        _topology_token = token
+        _topology_loaded_at = time.monotonic()
+        logger.debug("[Topology] Снимок серверов пересобран")
+        return topology
+
+
+async def get_servers(session: AsyncSession, include_enabled: bool = False) -> dict:
+    try:
+        topology = await get_server_topology(session)
+        index = topology["by_cluster"] if include_enabled else topology["by_cluster_enabled"]
+        return {
+            cluster: [
+                {
+                    **server,
+                    "tariff_subgroups": list(server["tariff_subgroups"]),
+                    "special_groups": list(server["special_groups"]),
+                }
+                for server in servers
+            ]
+            for cluster, servers in index.items()
+        }
     except SQLAlchemyError as e:
         logger.error(f"Ошибка при получении серверов: {e}")
         return {}
 
 
+async def get_cluster_servers(session: AsyncSession, cluster_id: str) -> tuple:
+    """
+    Включённые серверы кластера cluster_id, а если такого кластера нет — серверы с таким именем.
+    Возвращает неизменяемые записи снимка без копирования; пустой кортеж, если ничего не найдено.
+    """
+    topology = await get_server_topology(session)
+    return topology["by_cluster_enabled"].get(cluster_id) or topology["by_name"].get(cluster_id.lower(), ())
+
+
 async def get_clusters(session: AsyncSession) -> list[str]:
     stmt = select(Server.cluster_name).distinct().order_by(Server.cluster_name)
     result = await session.execute(stmt)
@@ -163,6 +257,7 @@ async def update_server_field(session: AsyncSession, server_name: str, field: st
         stmt = update(Server).where(Server.server_name == server_name).values(**{field: value})
         await session.execute(stmt)
         await session.commit()
+        invalidate_servers_cache()
         logger.info(f"✅ Поле {field} сервера {server_name} обновлено на {value}")
         return True
     except SQLAlchemyError as e:
@@ -188,6 +283,8 @@ async def update_server_name_with_keys(session: AsyncSession, old_name: str, new
         await session.execute(stmt_keys)
 
         await session.commit()
+        invalidate_servers_cache()
+        invalidate_key_counts()
         logger.info(f"✅ Сервер переименован с {old_name} на {new_name}")
         return True
     except SQLAlchemyError as e:
@@ -246,6 +343,8 @@ async def update_server_cluster(session: AsyncSession, server_name: str, new_clu
             )
 
         await session.commit()
+        invalidate_servers_cache()
+        invalidate_key_counts()
         logger.info(
             f"✅ Сервер {server_name} перемещен в кластер {new_cluster} с обновлением тарифной группы и привязок подгрупп"
         )
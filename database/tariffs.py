@@ -1,4 +1,6 @@
+import asyncio
 import hashlib
+import time
 
 from collections import defaultdict
 from datetime import datetime
@@ -9,6 +11,74 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.models import Server, Tariff
 from logger import logger
+from utils.shared_storage import get_invalidation_token, publish_invalidation
+
+
+TARIFF_CACHE_TTL = 300
+
+_tariff_catalog: dict | None = None
+_tariff_catalog_loaded_at = 0.0
+_tariff_catalog_token: str | None = None
+_tariff_catalog_lock = asyncio.Lock()
+
+
+def invalidate_tariff_cache():
+    global _tariff_catalog
+    _tariff_catalog = None
+    publish_invalidation("tariffs")
+
+
+def _tariff_to_dict(tariff: Tariff) -> dict:
+    data = dict(tariff.__dict__)
+    data.pop("_sa_instance_state", None)
+    return data
+
+
+async def get_tariff_catalog(session: AsyncSession) -> dict:
+    """
+    Каталог тарифов в памяти процесса с индексами by_id, by_group и by_subgroup.
+    Сбрасывается через invalidate_tariff_cache при записи тарифов (в том числе в другом процессе),
+    TTL — страховка от внешних изменений.
+    """
+    global _tariff_catalog, _tariff_catalog_loaded_at, _tariff_catalog_token
+
+    token = await get_invalidation_token("tariffs")
+    catalog = _tariff_catalog
+    if (
+        catalog is not None
+        and token == _tariff_catalog_token
+        and time.monotonic() - _tariff_catalog_loaded_at < TARIFF_CACHE_TTL
+    ):
+        return catalog
+
+    async with _tariff_catalog_lock:
+        if (
+            _tariff_catalog is not None
+            and token == _tariff_catalog_token
+            and time.monotonic() - _tariff_catalog_loaded_at < TARIFF_CACHE_TTL
+        ):
+            return _tariff_catalog
+
+        result = await session.execute(select(Tariff).order_by(Tariff.sort_order, Tariff.id))
+        ordered = [_tariff_to_dict(t) for t in result.scalars().all()]
+
+        by_group = defaultdict(list)
+        by_subgroup = defaultdict(list)
+        for tariff in ordered:
+            by_group[tariff["group_code"]].append(tariff)
+            if tariff.get("subgroup_title"):
+                by_subgroup[(tariff["group_code"], tariff["subgroup_title"])].append(tariff)
+
+        catalog = {
+            "all": ordered,
+            "by_id": {t["id"]: t for t in ordered},
+            "by_group": dict(by_group),
+            "by_subgroup": dict(by_subgroup),
+        }
+        _tariff_catalog = catalog
+        _tariff_catalog_token = token
+        _tariff_catalog_loaded_at = time.monotonic()
+        return catalog
 
 
 def create_subgroup_hash(subgroup_title: str, group_code: str) -> str:
@@ -21,12 +91,8 @@ def create_subgroup_hash(subgroup_title: str, group_code: str) -> str:
 
 
 async def find_subgroup_by_hash(session: AsyncSession, subgroup_hash: str, group_code: str) -> str | None:
-    result = await session.execute(
-        select(Tariff.subgroup_title)
-        .where(Tariff.group_code == group_code, Tariff.subgroup_title.isnot(None))
-        .distinct()
-    )
-    subgroups = [row[0] for row in result.fetchall()]
+    catalog = await get_tariff_catalog(session)
+    subgroups = {subgroup for code, subgroup in catalog["by_subgroup"] if code == group_code}
 
     for subgroup_title in subgroups:
         if create_subgroup_hash(subgroup_title, group_code) == subgroup_hash:
@@ -39,16 +105,14 @@ async def get_tariffs(
     session: AsyncSession, tariff_id: int = None, group_code: str = None, with_subgroup_weights: bool = False
 ):
     try:
+        catalog = await get_tariff_catalog(session)
         if tariff_id:
-            result = await session.execute(select(Tariff).where(Tariff.id == tariff_id))
+            tariff = catalog["by_id"].get(tariff_id)
+            tariffs = [dict(tariff)] if tariff else []
         elif group_code:
-            result = await session.execute(
-                select(Tariff).where(Tariff.group_code == group_code).order_by(Tariff.sort_order, Tariff.id)
-            )
+            tariffs = [dict(t) for t in catalog["by_group"].get(group_code, [])]
         else:
-            result = await session.execute(select(Tariff).order_by(Tariff.sort_order, Tariff.id))
-
-        tariffs = [dict(r.__dict__) for r in result.scalars().all()]
+            tariffs = [dict(t) for t in catalog["all"]]
 
         if with_subgroup_weights and group_code:
             tariffs_without_order = [t for t in tariffs if t.get("sort_order") is None]
@@ -57,6 +121,7 @@ async def get_tariffs(
                     tariff["sort_order"] = 1
                     await session.execute(update(Tariff).where(Tariff.id == tariff["id"]).values(sort_order=1))
                 await session.commit()
+                invalidate_tariff_cache()
 
             grouped = defaultdict(list)
             for t in tariffs:
@@ -78,9 +143,9 @@ async def get_tariffs(
 
 async def get_tariff_by_id(session: AsyncSession, tariff_id: int):
     try:
-        result = await session.execute(select(Tariff).where(Tariff.id == tariff_id))
-        tariff = result.scalar_one_or_none()
-        return dict(tariff.__dict__) if tariff else None
+        catalog = await get_tariff_catalog(session)
+        tariff = catalog["by_id"].get(tariff_id)
+        return dict(tariff) if tariff else None
     except SQLAlchemyError as e:
         logger.error(f"[TARIFF] Ошибка при получении тарифа по ID {tariff_id}: {e}")
         return None
@@ -103,12 +168,8 @@ async def get_tariffs_for_cluster(session: AsyncSession, cluster_name: str):
             return []
 
         group_code = row[0]
-        result = await session.execute(
-            select(Tariff)
-            .where(Tariff.group_code == group_code, Tariff.is_active.is_(True))
-            .order_by(Tariff.sort_order, Tariff.id)
-        )
-        return [dict(r.__dict__) for r in result.scalars().all()]
+        catalog = await get_tariff_catalog(session)
+        return [dict(t) for t in catalog["by_group"].get(group_code, []) if t.get("is_active")]
     except SQLAlchemyError as e:
         logger.error(f"[TARIFF] Ошибка при получении тарифов для кластера {cluster_name}: {e}")
         return []
@@ -137,6 +198,7 @@ async def create_tariff(session: AsyncSession, data: dict):
         stmt = insert(Tariff).values(**data).returning(Tariff)
         result = await session.execute(stmt)
         await session.commit()
+        invalidate_tariff_cache()
         return result.scalar_one()
     except SQLAlchemyError as e:
         logger.error(f"[TARIFF] Ошибка при создании тарифа: {e}")
@@ -151,6 +213,7 @@ async def update_tariff(session: AsyncSession, tariff_id: int, updates: dict):
         updates["updated_at"] = datetime.utcnow()
         await session.execute(update(Tariff).where(Tariff.id == tariff_id).values(**updates))
         await session.commit()
+        invalidate_tariff_cache()
         return True
     except SQLAlchemyError as e:
         logger.error(f"[TARIFF] Ошибка при обновлении тарифа ID={tariff_id}: {e}")
@@ -162,6 +225,7 @@ async def delete_tariff(session: AsyncSession, tariff_id: int):
     try:
         await session.execute(delete(Tariff).where(Tariff.id == tariff_id))
         await session.commit()
+        invalidate_tariff_cache()
         return True
     except SQLAlchemyError as e:
         logger.error(f"[TARIFF] Ошибка при удалении тарифа ID={tariff_id}: {e}")
@@ -171,9 +235,9 @@ async def delete_tariff(session: AsyncSession, tariff_id: int):
 
 async def check_tariff_exists(session: AsyncSession, tariff_id: int):
     try:
-        result = await session.execute(select(Tariff).where(Tariff.id == tariff_id, Tariff.is_active.is_(True)))
-        tariff = result.scalar_one_or_none()
-        if tariff:
+        catalog = await get_tariff_catalog(session)
+        tariff = catalog["by_id"].get(tariff_id)
+        if tariff and tariff.get("is_active"):
             return True
         logger.warning(f"[TARIFF] Тариф {tariff_id} не найден в БД")
         return False
@@ -190,6 +254,7 @@ async def get_tariff_sort_order(session: AsyncSession, tariff_id: int) -> int:
         if sort_order is None:
             await session.execute(update(Tariff).where(Tariff.id == tariff_id).values(sort_order=1))
             await session.commit()
+            invalidate_tariff_cache()
             return 1
 
         return sort_order
@@ -205,6 +270,7 @@ async def move_tariff_up(session: AsyncSession, tariff_id: int) -> bool:
 
         await session.execute(update(Tariff).where(Tariff.id == tariff_id).values(sort_order=new_order))
         await session.commit()
+        invalidate_tariff_cache()
         return True
     except SQLAlchemyError as e:
         logger.error(f"[TARIFF] Ошибка при перемещении тарифа {tariff_id} вверх: {e}")
@@ -219,6 +285,7 @@ async def move_tariff_down(session: AsyncSession, tariff_id: int) -> bool:
 
         await session.execute(update(Tariff).where(Tariff.id == tariff_id).values(sort_order=new_order))
         await session.commit()
+        invalidate_tariff_cache()
         return True
     except SQLAlchemyError as e:
         logger.error(f"[TARIFF] Ошибка при перемещении тарифа {tariff_id} вниз: {e}")
@@ -239,6 +306,7 @@ async def initialize_tariff_sort_orders(session: AsyncSession, group_code: str)
             await session.execute(update(Tariff).where(Tariff.id == tariff.id).values(sort_order=new_sort_order))
 
         await session.commit()
+        invalidate_tariff_cache()
         return True
     except SQLAlchemyError as e:
         logger.error(f"[TARIFF] Ошибка при инициализации sort_order для группы {group_code}: {e}")
@@ -258,6 +326,7 @@ async def initialize_all_tariff_weights(session: AsyncSession) -> bool:
             await session.execute(update(Tariff).where(Tariff.id == tariff.id).values(sort_order=1))
 
         await session.commit()
+        invalidate_tariff_cache()
         return True
 
     except SQLAlchemyError as e:
@@ -0,0 +1,70 @@
+from datetime import datetime
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import KeyTraffic
+from logger import logger
+
+
+KEY_TRAFFIC_UPSERT_CHUNK = 1000
+
+
+async def upsert_key_traffic(session: AsyncSession, rows: list[dict], collected_at: datetime) -> int:
+    """
+    Записывает счётчики {"client_id", "server_name", "up", "down"} пачками INSERT ... ON CONFLICT.
+    Возвращает число записанных строк.
+    """
+    try:
+        for i in range(0, len(rows), KEY_TRAFFIC_UPSERT_CHUNK):
+            chunk = [{**row, "updated_at": collected_at} for row in rows[i : i + KEY_TRAFFIC_UPSERT_CHUNK]]
+            stmt = insert(KeyTraffic).values(chunk)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[KeyTraffic.client_id, KeyTraffic.server_name],
+                set_={"up": stmt.excluded.up, "down": stmt.excluded.down, "updated_at": stmt.excluded.updated_at},
+            )
+            await session.execute(stmt)
+        await session.commit()
+        return len(rows)
+    except SQLAlchemyError as e:
+        logger.error(f"[Traffic] Ошибка при сохранении трафика: {e}")
+        await session.rollback()
+        return 0
+
+
+async def get_key_traffic(session: AsyncSession, client_ids: list[str]) -> list[KeyTraffic]:
+    if not client_ids:
+        return []
+    result = await session.execute(select(KeyTraffic).where(KeyTraffic.client_id.in_(client_ids)))
+    return result.scalars().all()
+
+
+async def get_key_traffic_totals(session: AsyncSession, client_ids: list[str]) -> dict[str, int]:
+    """Суммарный трафик (байты) по client_id. Ключей, по которым ещё нет данных сборщика, в ответе нет."""
+    if not client_ids:
+        return {}
+    result = await session.execute(
+        select(KeyTraffic.client_id, func.sum(KeyTraffic.up + KeyTraffic.down))
+        .where(KeyTraffic.client_id.in_(client_ids))
+        .group_by(KeyTraffic.client_id)
+    )
+    return {client_id: int(total or 0) for client_id, total in result.all()}
+
+
+async def zero_key_traffic(session: AsyncSession, client_ids: list[str]):
+    """Обнуляет счётчики ключей после сброса трафика на панелях. Коммит остаётся за вызывающим."""
+    if client_ids:
+        await session.execute(
+            update(KeyTraffic)
+            .where(KeyTraffic.client_id.in_(client_ids))
+            .values(up=0, down=0, updated_at=datetime.utcnow())
+        )
+
+
+async def purge_key_traffic(session: AsyncSession, older_than: datetime) -> int:
+    """Удаляет счётчики, которые сборщик давно не обновлял: ключ удалён или сервер выведен."""
+    result = await session.execute(delete(KeyTraffic).where(KeyTraffic.updated_at < older_than))
+    await session.commit()
+    return result.rowcount or 0
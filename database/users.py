@@ -5,6 +5,7 @@ from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from database.bans import invalidate_blocked_cache
 from database.keys import delete_key
 from database.models import (
     BlockedUser,
@@ -195,6 +196,7 @@ async def delete_user_data(session: AsyncSession, tg_id: int):
         await session.execute(delete(BlockedUser).where(BlockedUser.tg_id == tg_id))
         await session.execute(delete(User).where(User.tg_id == tg_id))
         await session.commit()
+        invalidate_blocked_cache()
         logger.info(f"[DB] Данные пользователя {tg_id} полностью удалены")
     except SQLAlchemyError as e:
         await session.rollback()
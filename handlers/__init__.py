@@ -2,13 +2,20 @@ __all__ = ("router",)
 
 from aiogram import Router
 
+from panels.remnawave_clients import close_remnawave_clients
+from utils.channel_membership import start_channel_membership_warmup, stop_channel_membership_warmup
+from utils.shared_storage import close_shared_storage
+
 from .admin import router as admin_router
 from .captcha import router as captcha_router
 from .coupons import router as coupons_router
 from .donate import router as donate_router
 from .instructions import router as instructions_router
 from .keys import router as keys_router
+from .keys.operations import start_traffic_collector, stop_traffic_collector
+from .keys.subscriptions import close_http_session
 from .notifications import router as notifications_router
+from .notifications.outbox import start_outbox_dispatcher, stop_outbox_dispatcher
 from .payments import router as payments_router
 from .profile import router as profile_router
 from .refferal import router as refferal_router
@@ -30,3 +37,13 @@ router.include_routers(
     admin_router,
     refferal_router,
 )
+
+router.startup.register(start_outbox_dispatcher)
+router.startup.register(start_channel_membership_warmup)
+router.startup.register(start_traffic_collector)
+router.shutdown.register(stop_traffic_collector)
+router.shutdown.register(stop_channel_membership_warmup)
+router.shutdown.register(stop_outbox_dispatcher)
+router.shutdown.register(close_remnawave_clients)
+router.shutdown.register(close_http_session)
+router.shutdown.register(close_shared_storage)
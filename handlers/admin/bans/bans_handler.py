@@ -11,10 +11,12 @@ from sqlalchemy import delete, text
 from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from database import delete_user_data
+from database import delete_user_data, invalidate_blocked_cache
 from database.models import ManualBan
 from filters.admin import IsAdminFilter
 from logger import logger
+from middlewares.ban_checker import invalidate_ban_cache
+from middlewares.user import invalidate_user_cache
 
 from ..panel.keyboard import AdminPanelCallback, build_admin_back_kb
 from .keyboard import build_bans_kb
@@ -89,6 +91,8 @@ async def handle_bans_delete_banned(callback_query: CallbackQuery, session: Asyn
             {"blocked_ids": blocked_ids},
         )
         await session.commit()
+        invalidate_blocked_cache()
+        await invalidate_user_cache(*blocked_ids)
 
         await callback_query.message.answer(
             text=f"🗑️ Удалены данные о {len(blocked_ids)} пользователях и связанных записях.",
@@ -134,6 +138,7 @@ async def handle_delete_manual_banned(callback_query: CallbackQuery, session: As
     try:
         await session.execute(delete(ManualBan))
         await session.commit()
+        await invalidate_ban_cache()
         await callback_query.message.edit_text(
             "🗑️ Вручную забаненные пользователи удалены.",
             reply_markup=build_bans_kb(),
@@ -196,6 +201,7 @@ async def handle_preemptive_ids_input(message: Message, state: FSMContext, sessi
 
     await session.execute(stmt)
     await session.commit()
+    await invalidate_ban_cache(*tg_ids)
 
     await message.answer(f"✅ Успешно добавлено в теневой бан: <b>{len(tg_ids)}</b> пользователей.")
     await state.clear()
@@ -1,12 +1,13 @@
-import asyncio
+import html
+import time
 
-from datetime import datetime, timezone
 from typing import Any
 
 from aiogram import F, Router, types
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.types import CallbackQuery, Message
+from aiogram.types import BufferedInputFile, CallbackQuery, Message
 from py3xui import AsyncApi
 from sqlalchemy import and_, delete, func, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -14,24 +15,25 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from config import (
     ADMIN_PASSWORD,
     ADMIN_USERNAME,
-    HAPP_CRYPTOLINK,
-    REMNAWAVE_LOGIN,
-    REMNAWAVE_PASSWORD,
     USE_COUNTRY_SELECTION,
 )
-from database import check_unique_server_name, get_servers, update_key_expiry
+from database import (
+    check_unique_server_name,
+    extend_keys_expiry,
+    get_servers,
+    invalidate_key_counts,
+)
 from database.models import Key, Server, ServerSpecialgroup, ServerSubgroup, Tariff
+from database.servers import invalidate_servers_cache
 from filters.admin import IsAdminFilter
 from handlers.keys.operations import (
-    create_client_on_server,
-    create_key_on_cluster,
-    delete_key_from_cluster,
-    renew_key_in_cluster,
+    SyncReport,
+    extend_keys_on_panels,
+    sync_keys_with_panels,
 )
-from handlers.keys.operations.aggregated_links import make_aggregated_link
 from handlers.utils import ALLOWED_GROUP_CODES
 from logger import logger
-from panels.remnawave import RemnawaveAPI
+from panels.availability import collect_cluster_online
 from utils.backup import create_backup_and_send_to_admins
 
 from ..panel.keyboard import AdminPanelCallback, build_admin_back_kb
@@ -54,6 +56,8 @@ from .keyboard import (
 
 router = Router()
 
+PROGRESS_UPDATE_INTERVAL = 5
+
 
 class AdminClusterStates(StatesGroup):
     waiting_for_cluster_name = State()
@@ -273,6 +277,7 @@ async def handle_panel_type_selection(
 
     session.add(new_server)
     await session.commit()
+    invalidate_servers_cache()
 
     await callback_query.message.edit_text(
         text=f"✅ Сервер <b>{server_name}</b> с панелью <b>{panel_type}</b> успешно добавлен в кластер <b>{cluster_name}</b>!",
@@ -367,77 +372,37 @@ async def handle_cluster_availability(
     await callback_query.message.edit_text(
         text=(
             f"🖥️ Проверка доступности серверов для кластера {cluster_name}.\n\n"
-            "Это может занять до 1 минуты, пожалуйста, подождите..."
+            "Это может занять несколько секунд, пожалуйста, подождите..."
         )
     )
 
-    total_online_users = 0
+    rows = await collect_cluster_online(cluster_name, cluster_servers)
+    total_online_users = sum(row["online"] for row in rows)
     result_text = f"<b>🖥️ Проверка доступности серверов</b>\n\n⚙️ Кластер: <b>{cluster_name}</b>\n\n"
 
-    for server in cluster_servers:
-        server_name = server["server_name"]
-        panel_type = server.get("panel_type", "3x-ui").lower()
-        prefix = "[3x]" if panel_type == "3x-ui" else "[Re]"
+    for row in rows:
+        prefix = "[3x]" if row["panel_type"] == "3x-ui" else "[Re]"
+        if row["error"]:
+            result_text += f"❌ <b>{prefix} {row['server_name']}</b> - ошибка: {html.escape(row['error'])}\n"
+            continue
 
-        try:
-            if panel_type == "3x-ui":
-                xui = AsyncApi(
-                    server["api_url"],
-                    username=ADMIN_USERNAME,
-                    password=ADMIN_PASSWORD,
-                    logger=None,
-                )
-                await xui.login()
-                inbound_id = int(server["inbound_id"])
-                online_clients = await xui.client.online()
-                online_inbound_users = 0
-
-                for client_email in online_clients:
-                    client = await xui.client.get_by_email(client_email)
-                    if client and client.inbound_id == inbound_id:
-                        online_inbound_users += 1
-
-                total_online_users += online_inbound_users
-                result_text += f"🌍 <b>{prefix} {server_name}</b> - {online_inbound_users} онлайн\n"
-
-            elif panel_type == "remnawave":
-                server_inbound_id = server.get("inbound_id")
-                if not server_inbound_id:
-                    raise Exception("Не указан inbound_id сервера")
-
-                remna = RemnawaveAPI(server["api_url"])
-                nodes_data = await remna.get_all_nodes_with_online(
-                    username=REMNAWAVE_LOGIN, password=REMNAWAVE_PASSWORD, inbound_id=server_inbound_id
-                )
-
-                if nodes_data.get("error"):
-                    raise Exception(nodes_data["error"])
-
-                online_remna_users = nodes_data["total_online"]
-                total_online_users += online_remna_users
-
-                nodes_info = nodes_data["nodes"]
-                result_text += f"🌍 <b>{prefix} {server_name}</b> - {online_remna_users} онлайн\n"
-                seen = set()
-                for node_info in nodes_info:
-                    node_name = node_info.get("name", "Unknown")
-                    if node_name in seen:
-                        continue
-                    seen.add(node_name)
-
-                    country_code = node_info.get("country_code", "Unknown")
-                    online_users = node_info.get("online_users", 0)
-
-                    flag = (
-                        "".join(chr(ord(c) + 127397) for c in country_code.upper())
-                        if country_code != "Unknown" and len(country_code) == 2
-                        else country_code
-                    )
-                    result_text += f"  ↳ {flag} ({node_name}): {online_users} онлайн\n"
-
-        except Exception as e:
-            error_text = str(e) or "Сервер недоступен"
-            result_text += f"❌ <b>{prefix} {server_name}</b> - ошибка: {error_text}\n"
+        result_text += f"🌍 <b>{prefix} {row['server_name']}</b> - {row['online']} онлайн\n"
+        seen = set()
+        for node_info in row["nodes"]:
+            node_name = node_info.get("name", "Unknown")
+            if node_name in seen:
+                continue
+            seen.add(node_name)
+
+            country_code = node_info.get("country_code", "Unknown")
+            online_users = node_info.get("online_users", 0)
+
+            flag = (
+                "".join(chr(ord(c) + 127397) for c in country_code.upper())
+                if country_code != "Unknown" and len(country_code) == 2
+                else country_code
+            )
+            result_text += f"  ↳ {flag} ({node_name}): {online_users} онлайн\n"
 
     result_text += f"\n👥 Всего пользователей онлайн: {total_online_users}"
     await callback_query.message.edit_text(text=result_text, reply_markup=build_admin_back_kb("clusters"))
@@ -494,6 +459,40 @@ async def handle_sync(
     )
 
 
+def make_progress_reporter(message: Message, template: str):
+    """Колбэк прогресса, который редактирует message не чаще раза в PROGRESS_UPDATE_INTERVAL секунд."""
+    last_update = time.monotonic()
+
+    async def report(*counters: int):
+        nonlocal last_update
+        if time.monotonic() - last_update < PROGRESS_UPDATE_INTERVAL:
+            return
+        last_update = time.monotonic()
+        try:
+            await message.edit_text(template.format(*counters))
+        except TelegramBadRequest:
+            pass
+
+    return report
+
+
+def format_sync_report(title: str, report: SyncReport) -> str:
+    text = (
+        f"✅ <b>{title}</b>\n\n"
+        f"🔑 Ключей: <b>{report.total}</b>\n"
+        f"➕ Создано на панелях: <b>{report.created}</b>\n"
+        f"🔄 Обновлено: <b>{report.updated}</b>\n"
+        f"✔️ Без изменений: <b>{report.unchanged}</b>\n"
+        f"👻 Лишних записей на панелях: <b>{report.orphaned}</b>"
+    )
+    if report.failed:
+        shown = "\n".join(
+            f"• <code>{email}</code>: {html.escape(reason[:100])}" for email, reason in report.failed[:20]
+        )
+        text += f"\n\n⚠️ Ошибок: <b>{len(report.failed)}</b>\n{shown}"
+    return text
+
+
 @router.callback_query(AdminClusterCallback.filter(F.action == "sync-server"), IsAdminFilter())
 async def handle_sync_server(
     callback_query: types.CallbackQuery,
@@ -503,24 +502,17 @@ async def handle_sync_server(
     server_name = callback_data.data
 
     try:
-        stmt = (
-            select(
-                Server.api_url,
-                Server.inbound_id,
-                Server.server_name,
-                Server.panel_type,
-                Key.tg_id,
-                Key.client_id,
-                Key.email,
-                Key.expiry_time,
-                Key.tariff_id,
-                Key.remnawave_link,
-            )
-            .join(Key, Server.cluster_name == Key.server_id)
-            .where(Server.server_name == server_name)
+        servers = await get_servers(session)
+        cluster_name = next(
+            (name for name, cluster in servers.items() if any(s["server_name"] == server_name for s in cluster)),
+            None,
         )
-        result = await session.execute(stmt)
-        keys_to_sync = result.mappings().all()
+        keys_to_sync = []
+        if cluster_name:
+            result = await session.execute(
+                select(Key).where(Key.server_id == cluster_name, Key.is_frozen.is_not(True))
+            )
+            keys_to_sync = result.scalars().all()
 
         if not keys_to_sync:
             await callback_query.message.edit_text(
@@ -533,136 +525,20 @@ async def handle_sync_server(
             text=f"<b>🔄 Синхронизация сервера {server_name}</b>\n\n🔑 Количество ключей: <b>{len(keys_to_sync)}</b>"
         )
 
-        semaphore = asyncio.Semaphore(2)
-        for key in keys_to_sync:
-            try:
-                if key["panel_type"] == "remnawave":
-                    tariff = None
-                    if key["tariff_id"]:
-                        tariff = await session.get(Tariff, key["tariff_id"])
-                        if tariff:
-                            servers = await get_servers(session)
-                            server_info = None
-                            for cluster_servers in servers.values():
-                                for s in cluster_servers:
-                                    if s.get("server_name") == server_name:
-                                        server_info = s
-                                        break
-                                if server_info:
-                                    break
-                            
-                            if server_info:
-                                if tariff.subgroup_title and tariff.subgroup_title not in server_info.get("tariff_subgroups", []):
-                                    continue
-
-                                if tariff.group_code and tariff.group_code.lower() in ALLOWED_GROUP_CODES:
-                                    if tariff.group_code.lower() not in server_info.get("special_groups", []):
-                                        continue
-
-                    expire_iso = (
-                        datetime.utcfromtimestamp(key["expiry_time"] / 1000).replace(tzinfo=timezone.utc).isoformat()
-                    )
-
-                    remna = RemnawaveAPI(key["api_url"])
-                    if not await remna.login(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD):
-                        logger.error(f"Не удалось авторизоваться в Remnawave для сервера {server_name}")
-                        continue
-
-                    traffic_limit_bytes = 0
-                    hwid_limit = 0
-                    if tariff:
-                        if tariff.traffic_limit is not None:
-                            traffic_limit_bytes = int(tariff.traffic_limit * 1024**3)
-                        hwid_limit = tariff.device_limit
-
-                    success = await remna.update_user(
-                        uuid=key["client_id"],
-                        expire_at=expire_iso,
-                        telegram_id=key["tg_id"],
-                        email=f"{key['email']}@fake.local",
-                        active_user_inbounds=[key["inbound_id"]],
-                        traffic_limit_bytes=traffic_limit_bytes,
-                        hwid_device_limit=hwid_limit,
-                    )
-
-                    if success:
-                        try:
-                            sub = await remna.get_subscription_by_username(key["email"])
-                            if sub:
-                                new_remnawave_link = sub.get("subscriptionUrl")
-                                if HAPP_CRYPTOLINK:
-                                    happ = sub.get("happ") or {}
-                                    new_remnawave_link = happ.get("cryptoLink") or happ.get("link") or new_remnawave_link
-                                
-                                if new_remnawave_link:
-                                    server_result = await session.execute(
-                                        select(Server.cluster_name).where(Server.server_name == server_name)
-                                    )
-                                    cluster_name = server_result.scalar()
-                                    
-                                    servers = await get_servers(session)
-                                    cluster_servers = servers.get(cluster_name, [])
-                                    
-                                    key_value = await make_aggregated_link(
-                                        session=session,
-                                        cluster_all=cluster_servers,
-                                        cluster_id=cluster_name,
-                                        email=key["email"],
-                                        client_id=key["client_id"],
-                                        tg_id=key["tg_id"],
-                                        remna_link_override=new_remnawave_link,
-                                        plan=key["tariff_id"],
-                                    )
-                                    
-                                    await session.execute(
-                                        update(Key)
-                                        .where(Key.tg_id == key["tg_id"], Key.client_id == key["client_id"])
-                                        .values(
-                                            remnawave_link=new_remnawave_link,
-                                            key=key_value
-                                        )
-                                    )
-                                    await session.commit()
-                                    logger.info(f"[Sync] Обновлена ссылка для {key['email']}: {new_remnawave_link}")
-                        except Exception as e:
-                            logger.warning(f"[Sync] Не удалось получить ссылку для {key['email']}: {e}")
-
-                    if not success:
-                        logger.warning("[Sync] ошибка обновления, пробуем пересоздать")
-
-                        await delete_key_from_cluster(server_name, key["email"], key["client_id"], session)
-
-                        await create_key_on_cluster(
-                            cluster_id=server_name,
-                            tg_id=key["tg_id"],
-                            client_id=key["client_id"],
-                            email=key["email"],
-                            expiry_timestamp=key["expiry_time"],
-                            plan=key["tariff_id"],
-                            session=session,
-                            remnawave_link=key["remnawave_link"],
-                        )
-                else:
-                    await create_client_on_server(
-                        {
-                            "api_url": key["api_url"],
-                            "inbound_id": key["inbound_id"],
-                            "server_name": key["server_name"],
-                        },
-                        key["tg_id"],
-                        key["client_id"],
-                        key["email"],
-                        key["expiry_time"],
-                        semaphore,
-                        plan=key["tariff_id"],
-                        session=session,
-                    )
-                await asyncio.sleep(0.6)
-            except Exception as e:
-                logger.error(f"Ошибка при синхронизации ключа {key['client_id']} в сервер {server_name}: {e}")
+        report = await sync_keys_with_panels(
+            session,
+            cluster_name,
+            servers[cluster_name],
+            keys_to_sync,
+            target_servers=[server_name],
+            on_progress=make_progress_reporter(
+                callback_query.message,
+                f"<b>🔄 Синхронизация сервера {server_name}</b>\n\nИсправлено расхождений: {{0}}/{{1}}",
+            ),
+        )
 
         await callback_query.message.edit_text(
-            text=f"✅ Ключи успешно синхронизированы для сервера {server_name}",
+            text=format_sync_report(f"Синхронизация сервера {server_name} завершена", report),
             reply_markup=build_admin_back_kb("clusters"),
         )
     except Exception as e:
@@ -683,16 +559,9 @@ async def handle_sync_cluster(
 
     try:
         result = await session.execute(
-            select(
-                Key.tg_id,
-                Key.client_id,
-                Key.email,
-                Key.expiry_time,
-                Key.remnawave_link,
-                Key.tariff_id,
-            ).where(Key.server_id == cluster_name, Key.is_frozen.is_(False))
+            select(Key).where(Key.server_id == cluster_name, Key.is_frozen.is_not(True))
         )
-        keys_to_sync = result.mappings().all()
+        keys_to_sync = result.scalars().all()
 
         if not keys_to_sync:
             await callback_query.message.edit_text(
@@ -703,160 +572,24 @@ async def handle_sync_cluster(
 
         servers = await get_servers(session)
         cluster_servers = servers.get(cluster_name, [])
-        only_remnawave = all(s.get("panel_type") == "remnawave" for s in cluster_servers)
 
         await callback_query.message.edit_text(
             text=f"<b>🔄 Синхронизация кластера {cluster_name}</b>\n\n🔑 Количество ключей: <b>{len(keys_to_sync)}</b>"
         )
 
-        for key in keys_to_sync:
-            try:
-                if only_remnawave:
-                    expire_iso = (
-                        datetime.utcfromtimestamp(key["expiry_time"] / 1000).replace(tzinfo=timezone.utc).isoformat()
-                    )
-
-                    remna = RemnawaveAPI(cluster_servers[0]["api_url"])
-                    if not await remna.login(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD):
-                        raise Exception("Не удалось авторизоваться в Remnawave")
-
-                    traffic_limit_bytes = 0
-                    hwid_limit = 0
-                    subgroup_title = None
-                    if key["tariff_id"]:
-                        tariff = await session.get(Tariff, key["tariff_id"])
-                        if tariff:
-                            if tariff.traffic_limit is not None:
-                                traffic_limit_bytes = int(tariff.traffic_limit * 1024**3)
-                            else:
-                                traffic_limit_bytes = 0
-                            hwid_limit = tariff.device_limit
-                            subgroup_title = tariff.subgroup_title
-                        else:
-                            logger.warning(
-                                f"[Sync] Ключ {key['client_id']} с несуществующим тарифом ID={key['tariff_id']} — обновим без лимитов"
-                            )
-
-                    filtered_servers = cluster_servers
-                    if subgroup_title:
-                        filtered_servers = [
-                            s for s in cluster_servers if subgroup_title in s.get("tariff_subgroups", [])
-                        ]
-                        if not filtered_servers:
-                            logger.warning(
-                                f"[Sync] В кластере {cluster_name} не найдено серверов для подгруппы '{subgroup_title}'. Использую весь кластер."
-                            )
-                            filtered_servers = cluster_servers
-
-                    if tariff and tariff.group_code:
-                        group_code = tariff.group_code.lower()
-                        if group_code in ALLOWED_GROUP_CODES:
-                            special_filtered = [
-                                s for s in filtered_servers if group_code in (s.get("special_groups") or [])
-                            ]
-                            if special_filtered:
-                                filtered_servers = special_filtered
-                            else:
-                                logger.warning(
-                                    f"[Sync] В кластере {cluster_name} нет серверов со спецгруппой '{group_code}'. Использую весь кластер."
-                                )
-
-                    inbound_ids = [s["inbound_id"] for s in filtered_servers if s.get("inbound_id")]
-
-                    success = await remna.update_user(
-                        uuid=key["client_id"],
-                        expire_at=expire_iso,
-                        telegram_id=key["tg_id"],
-                        email=f"{key['email']}@fake.local",
-                        active_user_inbounds=inbound_ids,
-                        traffic_limit_bytes=traffic_limit_bytes,
-                        hwid_device_limit=hwid_limit,
-                    )
-
-                    if success:
-                        try:
-                            sub = await remna.get_subscription_by_username(key["email"])
-                            if sub:
-                                new_remnawave_link = sub.get("subscriptionUrl")
-                                if HAPP_CRYPTOLINK:
-                                    happ = sub.get("happ") or {}
-                                    new_remnawave_link = happ.get("cryptoLink") or happ.get("link") or new_remnawave_link
-                                
-                                if new_remnawave_link:
-                                    servers = await get_servers(session)
-                                    cluster_servers = servers.get(cluster_name, [])
-                                    
-                                    key_value = await make_aggregated_link(
-                                        session=session,
-                                        cluster_all=cluster_servers,
-                                        cluster_id=cluster_name,
-                                        email=key["email"],
-                                        client_id=key["client_id"],
-                                        tg_id=key["tg_id"],
-                                        remna_link_override=new_remnawave_link,
-                                        plan=key["tariff_id"],
-                                    )
-                                    
-                                    await session.execute(
-                                        update(Key)
-                                        .where(Key.tg_id == key["tg_id"], Key.client_id == key["client_id"])
-                                        .values(
-                                            remnawave_link=new_remnawave_link,
-                                            key=key_value
-                                        )
-                                    )
-                                    await session.commit()
-                                    logger.info(f"[Sync] Обновлена ссылка для {key['email']}: {new_remnawave_link}")
-                        except Exception as e:
-                            logger.warning(f"[Sync] Не удалось получить ссылку для {key['email']}: {e}")
-
-                    if not success:
-                        logger.warning("[Sync] ошибка обновления, пробуем пересоздать")
-
-                        await delete_key_from_cluster(cluster_name, key["email"], key["client_id"], session)
-
-                        await session.execute(
-                            delete(Key).where(Key.tg_id == key["tg_id"], Key.client_id == key["client_id"])
-                        )
-
-                        await create_key_on_cluster(
-                            cluster_name,
-                            key["tg_id"],
-                            key["client_id"],
-                            key["email"],
-                            key["expiry_time"],
-                            plan=key["tariff_id"],
-                            session=session,
-                            remnawave_link=key["remnawave_link"],
-                        )
-
-                    await asyncio.sleep(0.1)
-
-                else:
-                    await delete_key_from_cluster(cluster_name, key["email"], key["client_id"], session)
-
-                    await session.execute(
-                        delete(Key).where(Key.tg_id == key["tg_id"], Key.client_id == key["client_id"])
-                    )
-
-                    await create_key_on_cluster(
-                        cluster_name,
-                        key["tg_id"],
-                        key["client_id"],
-                        key["email"],
-                        key["expiry_time"],
-                        plan=key["tariff_id"],
-                        session=session,
-                        remnawave_link=key["remnawave_link"],
-                    )
-
-                    await asyncio.sleep(0.5)
-
-            except Exception as e:
-                logger.error(f"[Sync] Ошибка при обработке ключа {key['client_id']} в {cluster_name}: {e}")
+        report = await sync_keys_with_panels(
+            session,
+            cluster_name,
+            cluster_servers,
+            keys_to_sync,
+            on_progress=make_progress_reporter(
+                callback_query.message,
+                f"<b>🔄 Синхронизация кластера {cluster_name}</b>\n\nИсправлено расхождений: {{0}}/{{1}}",
+            ),
+        )
 
         await callback_query.message.edit_text(
-            text=f"✅ Ключи успешно синхронизированы для кластера {cluster_name}",
+            text=format_sync_report(f"Синхронизация кластера {cluster_name} завершена", report),
             reply_markup=build_admin_back_kb("clusters"),
         )
 
@@ -930,43 +663,39 @@ async def handle_days_input(message: Message, state: FSMContext, session: AsyncS
             await state.clear()
             return
 
-        for key in keys:
-            new_expiry = key.expiry_time + add_ms
-
-            traffic_limit = 0
-            device_limit = 0
-            key_subgroup = None
-            if key.tariff_id:
-                result = await session.execute(
-                    select(Tariff.traffic_limit, Tariff.device_limit, Tariff.subgroup_title).where(
-                        Tariff.id == key.tariff_id, Tariff.is_active.is_(True)
-                    )
-                )
-                tariff = result.first()
-                if tariff:
-                    traffic_limit = int(tariff[0]) if tariff[0] is not None else 0
-                    device_limit = int(tariff[1]) if tariff[1] is not None else 0
-                    key_subgroup = tariff[2]
-
-            await renew_key_in_cluster(
-                cluster_name,
-                email=key.email,
-                client_id=key.client_id,
-                new_expiry_time=new_expiry,
-                total_gb=traffic_limit,
-                session=session,
-                hwid_device_limit=device_limit,
-                reset_traffic=False,
-                target_subgroup=key_subgroup,
-                old_subgroup=key_subgroup,
-            )
-            await update_key_expiry(session, key.client_id, new_expiry)
+        progress = await message.answer(f"⏳ Продлеваем {len(keys)} подписок в кластере <b>{cluster_name}</b>...")
+        report_progress = make_progress_reporter(
+            progress,
+            f"⏳ Продлеваем подписки в кластере <b>{cluster_name}</b>\n\nОпераций на панелях: {{0}}/{{1}}",
+        )
 
-            logger.info(f"[Cluster Extend] {key.email} +{days}д → {datetime.utcfromtimestamp(new_expiry / 1000)}")
+        failures = await extend_keys_on_panels(session, cluster_name, keys, add_ms, on_progress=report_progress)
+        failed_emails = {email for email, _ in failures}
+        extended = [key.client_id for key in keys if key.is_frozen or key.email not in failed_emails]
+        await extend_keys_expiry(session, extended, add_ms)
 
-        await message.answer(
-            f"✅ Время подписки продлено на <b>{days} дней</b> всем пользователям в кластере <b>{cluster_name}</b>."
+        logger.info(
+            f"[Cluster Extend] Кластер {cluster_name}: +{days}д для {len(extended)} из {len(keys)} подписок, "
+            f"не продлено на панелях: {len(failures)}"
         )
+        text = (
+            f"✅ Время подписки продлено на <b>{days} дней</b> в кластере <b>{cluster_name}</b>: "
+            f"<b>{len(extended)}</b> из <b>{len(keys)}</b>."
+        )
+        if failures:
+            shown = "\n".join(f"• <code>{email}</code>: {html.escape(reason[:100])}" for email, reason in failures[:20])
+            text += (
+                f"\n\n⚠️ Не удалось продлить ни на одной панели: <b>{len(failures)}</b> — "
+                f"срок этих подписок в базе не изменён\n{shown}"
+            )
+        await progress.edit_text(text)
+
+        if len(failures) > 20:
+            report = "\n".join(f"{email}\t{reason}" for email, reason in failures)
+            await message.answer_document(
+                BufferedInputFile(report.encode("utf-8"), filename=f"extend_{cluster_name}_failures.txt"),
+                caption="📄 Полный список ошибок продления",
+            )
 
     except ValueError:
         await message.answer("❌ Введите корректное число дней.")
@@ -1048,6 +777,8 @@ async def handle_new_cluster_name_input(message: Message, state: FSMContext, ses
             )
 
         await session.commit()
+        invalidate_servers_cache()
+        invalidate_key_counts()
 
         await message.answer(
             text=f"✅ Название кластера успешно изменено с '{old_cluster_name}' на '{new_cluster_name}'!",
@@ -1160,6 +891,8 @@ async def handle_new_server_name_input(message: Message, state: FSMContext, sess
             await session.execute(update(Key).where(Key.server_id == old_server_name).values(server_id=new_server_name))
 
         await session.commit()
+        invalidate_servers_cache()
+        invalidate_key_counts()
 
         await message.answer(
             text=f"✅ Название сервера успешно изменено с '{old_server_name}' на '{new_server_name}' в кластере '{cluster_name}'!",
@@ -1196,6 +929,8 @@ async def handle_server_transfer(callback_query: CallbackQuery, state: FSMContex
         )
 
         await session.commit()
+        invalidate_servers_cache()
+        invalidate_key_counts()
 
         base_text = f"✅ Ключи успешно перенесены на сервер '{new_server_name}', сервер '{old_server_name}' удален!"
         sync_reminder = '\n\n⚠️ Не забудьте сделать "Синхронизацию".'
@@ -1238,6 +973,8 @@ async def handle_cluster_transfer(callback_query: CallbackQuery, state: FSMConte
         )
 
         await session.commit()
+        invalidate_servers_cache()
+        invalidate_key_counts()
 
         await callback_query.message.edit_text(
             text=(
@@ -1294,6 +1031,7 @@ async def apply_tariff_group(callback: CallbackQuery, callback_data: AdminCluste
 
         await session.execute(update(Server).where(Server.cluster_name == cluster_name).values(tariff_group=group_code))
         await session.commit()
+        invalidate_servers_cache()
 
         await callback.message.edit_text(
             f"✅ Для кластера <code>{cluster_name}</code> установлена тарифная группа: <b>{group_code}</b>",
@@ -1459,6 +1197,7 @@ async def apply_tariff_subgroup(
                 ServerSubgroup(server_id=sid, group_code=group_code, subgroup_title=subgroup_title) for sid in to_insert
             ])
             await session.commit()
+            invalidate_servers_cache()
 
         await state.update_data({key: []})
 
@@ -1489,6 +1228,7 @@ async def reset_cluster_subgroups(callback: CallbackQuery, callback_data: AdminC
 
         await session.execute(delete(ServerSubgroup).where(ServerSubgroup.server_id.in_(server_ids)))
         await session.commit()
+        invalidate_servers_cache()
 
         servers = await get_servers(session=session, include_enabled=True)
         cluster_servers = servers.get(cluster_name, [])
@@ -1676,6 +1416,7 @@ async def apply_group_to_servers(
         if to_insert:
             session.add_all([ServerSpecialgroup(server_id=sid, group_code=group_code) for sid in to_insert])
             await session.commit()
+            invalidate_servers_cache()
 
         logger.debug(f"[apply_group_to_servers] group={group_code} server_ids={server_ids}")
 
@@ -1705,6 +1446,7 @@ async def reset_cluster_groups(callback: CallbackQuery, callback_data: AdminClus
             return
         await session.execute(delete(ServerSpecialgroup).where(ServerSpecialgroup.server_id.in_(server_ids)))
         await session.commit()
+        invalidate_servers_cache()
         servers = await get_servers(session=session, include_enabled=True)
         cluster_servers = servers.get(cluster_name, [])
         await callback.message.edit_text(
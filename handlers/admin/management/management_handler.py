@@ -21,6 +21,7 @@ from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from config import DB_NAME, DB_PASSWORD, DB_USER, PG_HOST, PG_PORT, REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD
+from database import adjust_key_count
 from database.models import Admin, Key, Server, User
 from filters.admin import IsAdminFilter
 from handlers.keys.operations import update_subscription
@@ -573,6 +574,7 @@ async def import_remnawave_keys(session: AsyncSession, users: list[dict], server
             logger.error(f"[ERROR] Ошибка при добавлении ключа {client_id}: {e}")
 
     await session.commit()
+    adjust_key_count(server_id, added)
     logger.info(f"[IMPORT] Всего добавлено ключей: {added}")
     return added
 
@@ -0,0 +1,318 @@
+import asyncio
+import time
+
+from datetime import datetime, timedelta
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from aiogram.types import InlineKeyboardMarkup
+
+import config as cfg
+
+from bot import bot
+from database import (
+    BROADCAST_ACTIVE_STATUSES,
+    async_session_maker,
+    checkpoint_broadcast_job,
+    flush_blocked_users,
+    get_broadcast_job,
+    get_broadcast_jobs,
+    mark_user_blocked,
+    update_broadcast_job,
+)
+from handlers.notifications.notify_utils import TokenBucket, acquire_global_send_slot, wait_chat_slot
+from logger import logger
+from utils.update_sharding import is_primary_worker
+
+from .keyboard import build_broadcast_control_kb
+from .recipients import RECIPIENTS_PAGE_SIZE, get_recipients_page
+
+
+BROADCAST_MESSAGES_PER_SECOND = getattr(cfg, "BROADCAST_MESSAGES_PER_SECOND", 25)
+BROADCAST_WORKERS = 20
+BROADCAST_MAX_RETRIES = 3
+BROADCAST_PROGRESS_INTERVAL = 5
+
+BROADCAST_STATUS_TITLES = {
+    "running": "📤 <b>Рассылка идёт</b>",
+    "paused": "⏸ <b>Рассылка на паузе</b>",
+    "cancelled": "⛔ <b>Рассылка остановлена</b>",
+    "finished": "📤 <b>Рассылка завершена!</b>",
+}
+
+_broadcast_tasks: dict[int, asyncio.Task] = {}
+_stop_requested: set[int] = set()
+
+
+def _is_copy_source_lost(error: TelegramBadRequest) -> bool:
+    message = str(error).lower()
+    return "message to copy not found" in message or "message_id_invalid" in message
+
+
+async def send_broadcast_message(
+    tg_id: int,
+    text: str,
+    photo: str | None,
+    keyboard: InlineKeyboardMarkup | None,
+    source: tuple[int, int] | None = None,
+) -> str:
+    """
+    Отправляет одно сообщение рассылки.
+    Если задан source (chat_id, message_id), исходное сообщение администратора копируется через copyMessage
+    как есть; если оно удалено — отправляется сохранённый текст/фото.
+    Возвращает "sent", "blocked" или "failed"; TelegramRetryAfter пробрасывается вызывающему.
+    """
+    try:
+        if source:
+            try:
+                await bot.copy_message(
+                    chat_id=tg_id, from_chat_id=source[0], message_id=source[1], reply_markup=keyboard
+                )
+                return "sent"
+            except TelegramBadRequest as e:
+                if not _is_copy_source_lost(e):
+                    raise
+                logger.warning(f"[Broadcast] Исходное сообщение рассылки недоступно, отправляем текстом: {e}")
+        if photo:
+            await bot.send_photo(chat_id=tg_id, photo=photo, caption=text, parse_mode="HTML", reply_markup=keyboard)
+        else:
+            await bot.send_message(chat_id=tg_id, text=text, parse_mode="HTML", reply_markup=keyboard)
+        return "sent"
+    except TelegramRetryAfter:
+        raise
+    except TelegramForbiddenError:
+        logger.warning(f"🚫 Бот заблокирован пользователем {tg_id}.")
+        return "blocked"
+    except TelegramBadRequest as bad_request:
+        if "chat not found" in str(bad_request).lower():
+            logger.warning(f"🚫 Чат не найден для пользователя {tg_id}.")
+            return "blocked"
+        logger.warning(f"📩 Не удалось отправить сообщение пользователю {tg_id}: {bad_request}")
+        return "failed"
+    except Exception as e:
+        logger.error(f"❌ Ошибка отправки сообщения пользователю {tg_id}: {e}")
+        return "failed"
+
+
+async def _send_page(
+    job_id: int,
+    tg_ids: list[int],
+    text: str,
+    photo: str | None,
+    keyboard: InlineKeyboardMarkup | None,
+    bucket: TokenBucket,
+    outcomes: dict[int, str],
+    source: tuple[int, int] | None = None,
+):
+    """
+    Рассылает страницу получателей пулом воркеров, записывая результаты в outcomes по мере отправки,
+    чтобы при отмене задачи вызывающий мог сохранить уже подтверждённые.
+    После запроса остановки новые получатели не берутся.
+    """
+    queue: asyncio.Queue[int] = asyncio.Queue()
+    for tg_id in tg_ids:
+        queue.put_nowait(tg_id)
+
+    async def worker():
+        while job_id not in _stop_requested:
+            try:
+                tg_id = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            outcome = "failed"
+            for _ in range(BROADCAST_MAX_RETRIES):
+                await bucket.acquire()
+                await wait_chat_slot(tg_id)
+                await acquire_global_send_slot(bulk=True)
+                try:
+                    outcome = await send_broadcast_message(tg_id, text, photo, keyboard, source)
+                    break
+                except TelegramRetryAfter as e:
+                    retry_in = int(e.retry_after) + 1
+                    logger.warning(f"⚠️ Flood control: повтор через {retry_in} сек. для пользователя {tg_id}")
+                    await asyncio.sleep(retry_in)
+            outcomes[tg_id] = outcome
+
+    await asyncio.gather(*(worker() for _ in range(min(BROADCAST_WORKERS, len(tg_ids)))))
+
+
+def _format_progress(job, processed_in_run: int, elapsed: float) -> str:
+    processed = job["sent"] + job["failed"] + job["blocked"]
+    lines = [
+        BROADCAST_STATUS_TITLES.get(job["status"], BROADCAST_STATUS_TITLES["running"]),
+        "",
+        f"👥 <b>Количество получателей:</b> {job['total']}",
+        f"✅ <b>Доставлено:</b> {job['sent']}",
+        f"❌ <b>Не доставлено:</b> {job['failed'] + job['blocked']}",
+    ]
+    if job["status"] == "running" and processed_in_run and elapsed > 0:
+        rate = processed_in_run / elapsed
+        remaining = max(job["total"] - processed, 0)
+        lines.append(f"⚡ <b>Скорость:</b> {rate:.1f} сообщ./сек.")
+        lines.append(f"⏳ <b>Осталось:</b> ~{timedelta(seconds=int(remaining / rate))}")
+    return "\n".join(lines)
+
+
+async def _report_progress(job, processed_in_run: int = 0, elapsed: float = 0.0):
+    if not job["progress_chat_id"] or not job["progress_message_id"]:
+        return
+    try:
+        await bot.edit_message_text(
+            chat_id=job["progress_chat_id"],
+            message_id=job["progress_message_id"],
+            text=_format_progress(job, processed_in_run, elapsed),
+            reply_markup=build_broadcast_control_kb(job["id"], job["status"]),
+        )
+    except TelegramBadRequest as e:
+        if "message is not modified" not in str(e):
+            logger.debug(f"[Broadcast] Не удалось обновить прогресс рассылки #{job['id']}: {e}")
+    except Exception as e:
+        logger.debug(f"[Broadcast] Не удалось обновить прогресс рассылки #{job['id']}: {e}")
+
+
+async def _checkpoint_page(
+    job_id: int, cursor: int | None, outcomes: dict[int, str]
+) -> tuple[int | None, str | None, dict[str, int]]:
+    """
+    Фиксирует подтверждённые результаты страницы. Курсор сдвигается за последний подтверждённый tg_id,
+    поэтому после остановки или перезапуска уже доставленные сообщения не отправляются повторно.
+    Возвращает курсор, актуальный статус задачи и счётчики по исходам.
+    """
+    if outcomes:
+        cursor = max(outcomes)
+    for tg_id, outcome in outcomes.items():
+        if outcome == "blocked":
+            mark_user_blocked(tg_id)
+    results = list(outcomes.values())
+    counts = {"sent": results.count("sent"), "failed": results.count("failed")}
+    counts["blocked"] = len(results) - counts["sent"] - counts["failed"]
+
+    async with async_session_maker() as session:
+        await flush_blocked_users(session)
+        status = await checkpoint_broadcast_job(
+            session, job_id, cursor, counts["sent"], counts["failed"], counts["blocked"]
+        )
+    return cursor, status, counts
+
+
+async def _load_job(job_id: int) -> dict | None:
+    async with async_session_maker() as session:
+        job = await get_broadcast_job(session, job_id)
+        return job.to_dict() if job else None
+
+
+async def run_broadcast_job(job_id: int):
+    """
+    Выполняет рассылку постранично, начиная с сохранённого курсора.
+    После каждой страницы курсор и счётчики фиксируются в broadcast_jobs, поэтому после
+    перезапуска рассылка продолжается с последней сохранённой страницы.
+    """
+    job = await _load_job(job_id)
+    if not job or job["status"] != "running":
+        return
+
+    keyboard = None
+    if job["keyboard"]:
+        try:
+            keyboard = InlineKeyboardMarkup.model_validate(job["keyboard"])
+        except Exception as e:
+            logger.error(f"Ошибка восстановления клавиатуры: {e}")
+
+    source = None
+    if job["source_chat_id"] and job["source_message_id"]:
+        source = (job["source_chat_id"], job["source_message_id"])
+
+    bucket = TokenBucket(BROADCAST_MESSAGES_PER_SECOND)
+    cursor = job["cursor"]
+    started_at = time.monotonic()
+    last_report = 0.0
+    processed_in_run = 0
+    logger.info(f"[Broadcast] Рассылка #{job_id} запущена с курсора {cursor}")
+
+    try:
+        while True:
+            async with async_session_maker() as session:
+                pending, skipped = await get_recipients_page(
+                    session, job["send_to"], job["cluster_name"], cursor, RECIPIENTS_PAGE_SIZE
+                )
+            if not pending and not skipped:
+                async with async_session_maker() as session:
+                    await update_broadcast_job(session, job_id, status="finished", finished_at=datetime.utcnow())
+                job["status"] = "finished"
+                break
+
+            outcomes = dict.fromkeys(skipped, "skipped")
+            try:
+                if pending:
+                    await _send_page(job_id, pending, job["text"], job["photo"], keyboard, bucket, outcomes, source)
+            except asyncio.CancelledError:
+                await _checkpoint_page(job_id, cursor, outcomes)
+                raise
+            cursor, status, counts = await _checkpoint_page(job_id, cursor, outcomes)
+
+            job.update(
+                cursor=cursor,
+                sent=job["sent"] + counts["sent"],
+                failed=job["failed"] + counts["failed"],
+                blocked=job["blocked"] + counts["blocked"],
+                status=status or "cancelled",
+            )
+            processed_in_run += len(outcomes)
+
+            if job["status"] != "running":
+                break
+            _stop_requested.discard(job_id)
+
+            elapsed = time.monotonic() - started_at
+            if elapsed - last_report >= BROADCAST_PROGRESS_INTERVAL:
+                last_report = elapsed
+                await _report_progress(job, processed_in_run, elapsed)
+    finally:
+        _stop_requested.discard(job_id)
+
+    logger.info(
+        f"[Broadcast] Рассылка #{job_id}: статус {job['status']}, доставлено {job['sent']}, "
+        f"не доставлено {job['failed'] + job['blocked']}"
+    )
+    await _report_progress(job)
+
+
+def start_broadcast_job(job_id: int) -> bool:
+    """Запускает рассылку в фоне. Возвращает False, если она уже выполняется в этом процессе."""
+    task = _broadcast_tasks.get(job_id)
+    if task and not task.done():
+        return False
+    _stop_requested.discard(job_id)
+    task = asyncio.create_task(run_broadcast_job(job_id))
+    _broadcast_tasks[job_id] = task
+    task.add_done_callback(lambda _: _broadcast_tasks.pop(job_id, None))
+    return True
+
+
+def request_broadcast_stop(job_id: int):
+    """
+    Прерывает текущую страницу: воркеры перестают брать новых получателей, курсор сохраняется
+    по последнему обработанному. Сам статус (paused/cancelled) должен быть уже записан в БД.
+    """
+    task = _broadcast_tasks.get(job_id)
+    if task and not task.done():
+        _stop_requested.add(job_id)
+
+
+async def resume_broadcast_jobs():
+    """Продолжает рассылки, прерванные перезапуском бота."""
+    if not is_primary_worker():
+        return
+    async with async_session_maker() as session:
+        jobs = await get_broadcast_jobs(session, BROADCAST_ACTIVE_STATUSES)
+    for job in jobs:
+        if job.status == "running" and start_broadcast_job(job.id):
+            logger.info(f"[Broadcast] Возобновлена рассылка #{job.id} с курсора {job.cursor}")
+
+
+async def stop_broadcast_tasks():
+    """При остановке бота прерывает рассылки; статус running сохраняется для возобновления."""
+    tasks = [task for task in _broadcast_tasks.values() if not task.done()]
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
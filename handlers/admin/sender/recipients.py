@@ -0,0 +1,102 @@
+from datetime import datetime
+
+from sqlalchemy import Select, distinct, exists, func, not_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import get_blocked_user_ids
+from database.models import BlockedUser, Key, ManualBan, Payment, Server, Tariff, User
+
+
+RECIPIENTS_PAGE_SIZE = 200
+
+
+def build_recipients_query(send_to: str, cluster_name: str = None) -> Select:
+    """Запрос уникальных tg_id получателей рассылки для выбранной группы."""
+    now_ms = int(datetime.utcnow().timestamp() * 1000)
+    banned_tg_ids = select(BlockedUser.tg_id).union_all(
+        select(ManualBan.tg_id).where((ManualBan.until.is_(None)) | (ManualBan.until > datetime.utcnow()))
+    )
+
+    if send_to == "subscribed":
+        return (
+            select(distinct(User.tg_id)).join(Key).where(Key.expiry_time > now_ms).where(~User.tg_id.in_(banned_tg_ids))
+        )
+    if send_to == "unsubscribed":
+        subquery = (
+            select(User.tg_id)
+            .outerjoin(Key, User.tg_id == Key.tg_id)
+            .group_by(User.tg_id)
+            .having(func.count(Key.tg_id) == 0)
+            .union_all(
+                select(User.tg_id)
+                .join(Key, User.tg_id == Key.tg_id)
+                .group_by(User.tg_id)
+                .having(func.max(Key.expiry_time) <= now_ms)
+            )
+        )
+        return select(distinct(subquery.c.tg_id)).where(~subquery.c.tg_id.in_(banned_tg_ids))
+    if send_to == "untrial":
+        subquery = select(Key.tg_id)
+        return (
+            select(distinct(User.tg_id))
+            .where(~User.tg_id.in_(subquery) & User.trial.in_([0, -1]))
+            .where(~User.tg_id.in_(banned_tg_ids))
+        )
+    if send_to == "cluster":
+        return (
+            select(distinct(User.tg_id))
+            .join(Key, User.tg_id == Key.tg_id)
+            .join(Server, Key.server_id == Server.cluster_name)
+            .where(Server.cluster_name == cluster_name)
+            .where(~User.tg_id.in_(banned_tg_ids))
+        )
+    if send_to == "hotleads":
+        subquery_active_keys = select(Key.tg_id).where(Key.expiry_time > now_ms).distinct()
+        return (
+            select(distinct(User.tg_id))
+            .join(Payment, User.tg_id == Payment.tg_id)
+            .where(Payment.status == "success")
+            .where(Payment.amount > 0)
+            .where(Payment.payment_system.notin_(["referral", "coupon", "cashback"]))
+            .where(not_(exists(subquery_active_keys.where(Key.tg_id == User.tg_id))))
+            .where(~User.tg_id.in_(banned_tg_ids))
+        )
+    if send_to == "trial":
+        trial_tariff_subquery = select(Tariff.id).where(Tariff.group_code == "trial")
+        return (
+            select(distinct(Key.tg_id))
+            .where(Key.tariff_id.in_(trial_tariff_subquery))
+            .where(~Key.tg_id.in_(banned_tg_ids))
+        )
+    return select(distinct(User.tg_id)).where(~User.tg_id.in_(banned_tg_ids))
+
+
+async def count_recipients(session: AsyncSession, send_to: str, cluster_name: str = None) -> int:
+    subquery = build_recipients_query(send_to, cluster_name).subquery()
+    result = await session.execute(select(func.count()).select_from(subquery))
+    return result.scalar_one()
+
+
+async def get_recipients_page(
+    session: AsyncSession,
+    send_to: str,
+    cluster_name: str = None,
+    after_tg_id: int | None = None,
+    page_size: int = RECIPIENTS_PAGE_SIZE,
+) -> tuple[list[int], list[int]]:
+    """
+    Следующая страница получателей с tg_id больше after_tg_id, по возрастанию tg_id.
+    Возвращает (получатели, пропущенные): пропущенные — заблокировавшие бота, ещё не записанные в blocked_users.
+    Курсор двигается по обоим спискам, иначе страница из одних пропущенных завершила бы рассылку.
+    """
+    subquery = build_recipients_query(send_to, cluster_name).subquery()
+    tg_id = subquery.c[0]
+    query = select(tg_id).order_by(tg_id).limit(page_size)
+    if after_tg_id is not None:
+        query = query.where(tg_id > after_tg_id)
+    result = await session.execute(query)
+    blocked_ids = await get_blocked_user_ids(session)
+    recipients, skipped = [], []
+    for (recipient_id,) in result.all():
+        (skipped if recipient_id in blocked_ids else recipients).append(recipient_id)
+    return recipients, skipped
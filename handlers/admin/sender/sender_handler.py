@@ -1,175 +1,44 @@
-import asyncio
 import json
 import re
 
-from datetime import datetime
-
 from aiogram import F, Router
-from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, Message
-from sqlalchemy import distinct, exists, func, not_, select
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from database import create_blocked_user
-from database.models import BlockedUser, Key, ManualBan, Payment, Server, Tariff, User
+from database import create_broadcast_job, get_broadcast_job, update_broadcast_job
+from database.models import Server
 from filters.admin import IsAdminFilter
 from logger import logger
 
 from ..panel.keyboard import AdminPanelCallback, build_admin_back_kb
-from .keyboard import AdminSenderCallback, build_clusters_kb, build_sender_kb
+from .broadcast import (
+    request_broadcast_stop,
+    resume_broadcast_jobs,
+    start_broadcast_job,
+    stop_broadcast_tasks,
+)
+from .keyboard import (
+    AdminBroadcastCallback,
+    AdminSenderCallback,
+    build_broadcast_control_kb,
+    build_clusters_kb,
+    build_sender_kb,
+)
+from .recipients import count_recipients
 
 
 router = Router()
 
 
-async def try_add_blocked_user(tg_id: int, session: AsyncSession):
-    if session:
-        try:
-            await create_blocked_user(session, tg_id)
-            logger.info(f"Пользователь {tg_id} добавлен в blocked_users.")
-        except Exception as e:
-            logger.warning(f"Не удалось добавить {tg_id} в blocked_users: {e}")
-
-
-async def send_broadcast_batch(bot, messages, batch_size=15, session=None):
-    results = []
-    min_interval = 1.0 / 15
-
-    for msg in messages:
-        tg_id = msg["tg_id"]
-        text = msg["text"]
-        photo = msg.get("photo")
-        keyboard = msg.get("keyboard")
-
-        try:
-            if photo:
-                await bot.send_photo(chat_id=tg_id, photo=photo, caption=text, parse_mode="HTML", reply_markup=keyboard)
-            else:
-                await bot.send_message(chat_id=tg_id, text=text, parse_mode="HTML", reply_markup=keyboard)
-            results.append(True)
-
-        except TelegramRetryAfter as e:
-            retry_in = int(e.retry_after) + 1
-            logger.warning(f"⚠️ Flood control: повтор через {retry_in} сек. для пользователя {tg_id}")
-            await asyncio.sleep(e.retry_after)
-            try:
-                if photo:
-                    await bot.send_photo(
-                        chat_id=tg_id, photo=photo, caption=text, parse_mode="HTML", reply_markup=keyboard
-                    )
-                else:
-                    await bot.send_message(chat_id=tg_id, text=text, parse_mode="HTML", reply_markup=keyboard)
-                results.append(True)
-            except TelegramForbiddenError:
-                logger.warning(f"🚫 Бот заблокирован пользователем {tg_id}.")
-                await try_add_blocked_user(tg_id, session)
-                results.append(False)
-            except TelegramBadRequest as bad_request:
-                error_msg = str(bad_request).lower()
-                if "chat not found" in error_msg:
-                    logger.warning(f"🚫 Чат не найден для пользователя {tg_id}.")
-                    await try_add_blocked_user(tg_id, session)
-                else:
-                    logger.warning(f"📩 Не удалось отправить сообщение пользователю {tg_id}: {bad_request}")
-                results.append(False)
-            except Exception as retry_error:
-                logger.error(f"❌ Ошибка повторной отправки пользователю {tg_id}: {retry_error}")
-                results.append(False)
-
-        except TelegramForbiddenError:
-            logger.warning(f"🚫 Бот заблокирован пользователем {tg_id}.")
-            await try_add_blocked_user(tg_id, session)
-            results.append(False)
-        except TelegramBadRequest as bad_request:
-            error_msg = str(bad_request).lower()
-            if "chat not found" in error_msg:
-                logger.warning(f"🚫 Чат не найден для пользователя {tg_id}.")
-                await try_add_blocked_user(tg_id, session)
-            else:
-                logger.warning(f"📩 Не удалось отправить сообщение пользователю {tg_id}: {bad_request}")
-            results.append(False)
-        except Exception as e:
-            logger.error(f"❌ Ошибка отправки сообщения пользователю {tg_id}: {e}")
-            results.append(False)
-
-        await asyncio.sleep(min_interval)
-
-    return results
-
-
 class AdminSender(StatesGroup):
     waiting_for_message = State()
     preview = State()
 
 
-async def get_recipients(session: AsyncSession, send_to: str, cluster_name: str = None) -> tuple[list[int], int]:
-    now_ms = int(datetime.utcnow().timestamp() * 1000)
-    banned_tg_ids = select(BlockedUser.tg_id).union_all(
-        select(ManualBan.tg_id).where((ManualBan.until.is_(None)) | (ManualBan.until > datetime.utcnow()))
-    )
-
-    query = None
-    if send_to == "subscribed":
-        query = (
-            select(distinct(User.tg_id)).join(Key).where(Key.expiry_time > now_ms).where(~User.tg_id.in_(banned_tg_ids))
-        )
-    elif send_to == "unsubscribed":
-        subquery = (
-            select(User.tg_id)
-            .outerjoin(Key, User.tg_id == Key.tg_id)
-            .group_by(User.tg_id)
-            .having(func.count(Key.tg_id) == 0)
-            .union_all(
-                select(User.tg_id)
-                .join(Key, User.tg_id == Key.tg_id)
-                .group_by(User.tg_id)
-                .having(func.max(Key.expiry_time) <= now_ms)
-            )
-        )
-        query = select(distinct(subquery.c.tg_id)).where(~subquery.c.tg_id.in_(banned_tg_ids))
-    elif send_to == "untrial":
-        subquery = select(Key.tg_id)
-        query = (
-            select(distinct(User.tg_id))
-            .where(~User.tg_id.in_(subquery) & User.trial.in_([0, -1]))
-            .where(~User.tg_id.in_(banned_tg_ids))
-        )
-    elif send_to == "cluster":
-        query = (
-            select(distinct(User.tg_id))
-            .join(Key, User.tg_id == Key.tg_id)
-            .join(Server, Key.server_id == Server.cluster_name)
-            .where(Server.cluster_name == cluster_name)
-            .where(~User.tg_id.in_(banned_tg_ids))
-        )
-    elif send_to == "hotleads":
-        subquery_active_keys = select(Key.tg_id).where(Key.expiry_time > now_ms).distinct()
-        query = (
-            select(distinct(User.tg_id))
-            .join(Payment, User.tg_id == Payment.tg_id)
-            .where(Payment.status == "success")
-            .where(Payment.amount > 0)
-            .where(Payment.payment_system.notin_(["referral", "coupon", "cashback"]))
-            .where(not_(exists(subquery_active_keys.where(Key.tg_id == User.tg_id))))
-            .where(~User.tg_id.in_(banned_tg_ids))
-        )
-    elif send_to == "trial":
-        trial_tariff_subquery = select(Tariff.id).where(Tariff.group_code == "trial")
-        query = (
-            select(distinct(Key.tg_id))
-            .where(Key.tariff_id.in_(trial_tariff_subquery))
-            .where(~Key.tg_id.in_(banned_tg_ids))
-        )
-    else:
-        query = select(distinct(User.tg_id)).where(~User.tg_id.in_(banned_tg_ids))
-
-    result = await session.execute(query)
-    tg_ids = [row[0] for row in result.all()]
-    return tg_ids, len(tg_ids)
-
-
 def parse_message_buttons(text: str) -> tuple[str, InlineKeyboardMarkup | None]:
     if "BUTTONS:" not in text:
         return text, None
@@ -257,6 +126,7 @@ async def handle_sender_callback_text(
             "• Только <b>текст</b>\n"
             "• Только <b>картинку</b>\n"
             "• <b>Текст + картинку</b>\n"
+            "• <b>Видео, GIF или файл</b> — сообщение без кнопок копируется как есть\n"
             "• <b>Сообщение + кнопки</b> (см. формат ниже)\n\n"
             "<b>📋 Пример формата кнопок:</b>\n"
             "<code>Ваше сообщение</code>\n\n"
@@ -293,7 +163,7 @@ async def handle_message_input(message: Message, state: FSMContext, session: Asy
 
     clean_text, keyboard = parse_message_buttons(original_text)
 
-    max_len = 1024 if photo else 4096
+    max_len = 1024 if photo or message.caption is not None else 4096
     if len(clean_text) > max_len:
         await message.answer(
             f"⚠️ Сообщение слишком длинное.\nМаксимум: <b>{max_len}</b> символов, сейчас: <b>{len(clean_text)}</b>.",
@@ -305,12 +175,23 @@ async def handle_message_input(message: Message, state: FSMContext, session: Asy
     data = await state.get_data()
     send_to = data.get("type", "all")
     cluster_name = data.get("cluster_name")
-    _, user_count = await get_recipients(session, send_to, cluster_name)
+    user_count = await count_recipients(session, send_to, cluster_name)
 
-    await state.update_data(text=clean_text, photo=photo, keyboard=keyboard.model_dump() if keyboard else None)
+    copy_source = None
+    if "BUTTONS:" not in original_text:
+        copy_source = {"chat_id": message.chat.id, "message_id": message.message_id}
+
+    await state.update_data(
+        text=clean_text,
+        photo=photo,
+        keyboard=keyboard.model_dump() if keyboard else None,
+        copy_source=copy_source,
+    )
     await state.set_state(AdminSender.preview)
 
-    if photo:
+    if copy_source:
+        await message.copy_to(chat_id=message.chat.id)
+    elif photo:
         await message.answer_photo(photo=photo, caption=clean_text, parse_mode="HTML", reply_markup=keyboard)
     else:
         await message.answer(text=clean_text, parse_mode="HTML", reply_markup=keyboard)
@@ -331,41 +212,71 @@ async def handle_message_input(message: Message, state: FSMContext, session: Asy
 @router.callback_query(F.data == "send_message", IsAdminFilter())
 async def handle_send_confirm(callback_query: CallbackQuery, state: FSMContext, session: AsyncSession):
     data = await state.get_data()
-    text_message = data.get("text")
-    photo = data.get("photo")
-    keyboard_data = data.get("keyboard")
     send_to = data.get("type", "all")
     cluster_name = data.get("cluster_name")
+    copy_source = data.get("copy_source")
+
+    total_users = await count_recipients(session, send_to, cluster_name)
+    job = await create_broadcast_job(
+        session,
+        send_to=send_to,
+        cluster_name=cluster_name,
+        text=data.get("text"),
+        photo=data.get("photo"),
+        keyboard=data.get("keyboard"),
+        created_by=callback_query.from_user.id,
+        total=total_users,
+        source_chat_id=copy_source["chat_id"] if copy_source else None,
+        source_message_id=copy_source["message_id"] if copy_source else None,
+    )
 
-    keyboard = None
-    if keyboard_data:
-        try:
-            keyboard = InlineKeyboardMarkup.model_validate(keyboard_data)
-        except Exception as e:
-            logger.error(f"Ошибка восстановления клавиатуры: {e}")
+    progress_message = await callback_query.message.edit_text(
+        f"📤 <b>Рассылка начата!</b>\n👥 Количество получателей: {total_users}",
+        reply_markup=build_broadcast_control_kb(job.id, "running"),
+    )
+    if isinstance(progress_message, Message):
+        await update_broadcast_job(
+            session,
+            job.id,
+            progress_chat_id=progress_message.chat.id,
+            progress_message_id=progress_message.message_id,
+        )
 
-    tg_ids, total_users = await get_recipients(session, send_to, cluster_name)
+    start_broadcast_job(job.id)
+    await state.clear()
 
-    await callback_query.message.edit_text(f"📤 <b>Рассылка начата!</b>\n👥 Количество получателей: {total_users}")
 
-    messages = []
-    for tg_id in tg_ids:
-        message_data = {"tg_id": tg_id, "text": text_message, "photo": photo, "keyboard": keyboard}
-        messages.append(message_data)
+@router.callback_query(AdminBroadcastCallback.filter(), IsAdminFilter())
+async def handle_broadcast_control(
+    callback_query: CallbackQuery, callback_data: AdminBroadcastCallback, session: AsyncSession
+):
+    job = await get_broadcast_job(session, callback_data.job_id)
+    if not job or job.status in ("finished", "cancelled"):
+        await callback_query.answer("Рассылка уже завершена.", show_alert=True)
+        return
 
-    results = await send_broadcast_batch(bot=callback_query.bot, messages=messages, batch_size=15, session=session)
-    success_count = sum(1 for result in results if result)
+    action = callback_data.action
+    if action == "pause" and job.status == "running":
+        await update_broadcast_job(session, job.id, status="paused")
+        request_broadcast_stop(job.id)
+        status, notice = "paused", "⏸ Рассылка будет приостановлена"
+    elif action == "resume" and job.status == "paused":
+        await update_broadcast_job(session, job.id, status="running")
+        start_broadcast_job(job.id)
+        status, notice = "running", "▶️ Рассылка продолжена"
+    elif action == "cancel":
+        await update_broadcast_job(session, job.id, status="cancelled")
+        request_broadcast_stop(job.id)
+        status, notice = "cancelled", "⛔ Рассылка будет остановлена"
+    else:
+        await callback_query.answer()
+        return
 
-    await callback_query.message.answer(
-        text=(
-            f"📤 <b>Рассылка завершена!</b>\n\n"
-            f"👥 <b>Количество получателей:</b> {total_users}\n"
-            f"✅ <b>Доставлено:</b> {success_count}\n"
-            f"❌ <b>Не доставлено:</b> {total_users - success_count}"
-        ),
-        reply_markup=build_admin_back_kb("sender"),
-    )
-    await state.clear()
+    await callback_query.answer(notice)
+    try:
+        await callback_query.message.edit_reply_markup(reply_markup=build_broadcast_control_kb(job.id, status))
+    except TelegramBadRequest:
+        pass
 
 
 @router.callback_query(F.data == "cancel_message", IsAdminFilter())
@@ -375,3 +286,7 @@ async def handle_send_cancel(callback_query: CallbackQuery, state: FSMContext):
         reply_markup=build_admin_back_kb("sender"),
     )
     await state.clear()
+
+
+router.startup.register(resume_broadcast_jobs)
+router.shutdown.register(stop_broadcast_tasks)
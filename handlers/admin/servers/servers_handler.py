@@ -11,6 +11,7 @@ from database.models import Key, Server
 from database.servers import (
     get_available_clusters,
     get_server_by_name,
+    invalidate_servers_cache,
     update_server_cluster,
     update_server_field,
     update_server_name_with_keys,
@@ -41,6 +42,27 @@ class ServerEditState(StatesGroup):
     editing_value = State()
 
 
+def format_latency_history(server_name: str) -> str:
+    """Сводка по последним замерам задержки из проверки серверов; пустая строка, если замеров ещё нет."""
+    from servers import get_latency_history
+
+    history = get_latency_history(server_name)
+    if not history:
+        return ""
+
+    checked_at, last_latency = history[-1]
+    latencies = [latency for _, latency in history if latency is not None]
+    last_display = f"{last_latency * 1000:.0f} мс" if last_latency is not None else "недоступен"
+    text = f"📶 Пинг: <b>{last_display}</b> ({checked_at:%H:%M:%S})\n"
+    if latencies:
+        average = sum(latencies) / len(latencies) * 1000
+        text += f"📊 За {len(history)} проверок: средний <b>{average:.0f} мс</b>, "
+    else:
+        text += f"📊 За {len(history)} проверок: "
+    text += f"доступен <b>{len(latencies)}/{len(history)}</b>\n"
+    return text
+
+
 @router.callback_query(AdminServerCallback.filter(F.action == "manage"), IsAdminFilter())
 async def handle_server_manage(
     callback_query: CallbackQuery,
@@ -85,6 +107,10 @@ async def handle_server_manage(
         if subscription_count > 0:
             text += f"🔑 Подписок на сервере: <b>{subscription_count}</b>\n"
 
+        latency_text = format_latency_history(server_name)
+        if latency_text:
+            text += latency_text
+
         text += "</blockquote>"
 
         await callback_query.message.edit_text(
@@ -230,6 +256,7 @@ async def process_callback_delete_server(
         stmt_delete = delete(Server).where((Server.cluster_name == cluster_name) & (Server.server_name == server_name))
         await session.execute(stmt_delete)
         await session.commit()
+        invalidate_servers_cache()
         await callback_query.message.edit_text(
             text=f"✅ Сервер '{server_name}' удален. Кластер '{cluster_name}' также удален, так как в нем не осталось серверов.",
             reply_markup=build_admin_back_kb("clusters"),
@@ -238,6 +265,7 @@ async def process_callback_delete_server(
         stmt_delete = delete(Server).where((Server.cluster_name == cluster_name) & (Server.server_name == server_name))
         await session.execute(stmt_delete)
         await session.commit()
+        invalidate_servers_cache()
         await callback_query.message.edit_text(
             text=f"✅ Сервер '{server_name}' удален.",
             reply_markup=build_admin_back_kb("clusters"),
@@ -257,6 +285,7 @@ async def toggle_server_enabled(
 
     await session.execute(update(Server).where(Server.server_name == server_name).values(enabled=new_status))
     await session.commit()
+    invalidate_servers_cache()
 
     servers = await get_servers(session=session, include_enabled=True)
 
@@ -310,6 +339,7 @@ async def save_server_limit(message: types.Message, state: FSMContext, session:
 
         await session.execute(update(Server).where(Server.server_name == server_name).values(max_keys=new_value))
         await session.commit()
+        invalidate_servers_cache()
 
         servers = await get_servers(session=session, include_enabled=True)
         cluster_name, server = next(
@@ -23,6 +23,7 @@ def build_stats_kb() -> InlineKeyboardMarkup:
         text="📥 Выгрузить горящих лидов",
         callback_data=AdminPanelCallback(action="stats_export_hot_leads_csv").pack(),
     )
+    builder.button(text="🧠 Кэши", callback_data=AdminPanelCallback(action="stats_caches").pack())
     builder.row(build_admin_back_btn())
     builder.adjust(1)
     return builder.as_markup()
@@ -37,6 +37,7 @@ from utils.csv_export import (
     export_payments_csv,
     export_users_csv,
 )
+from utils.shared_storage import get_cache_stats
 
 from ..panel.keyboard import AdminPanelCallback, build_admin_back_kb
 from .keyboard import build_stats_kb
@@ -226,6 +227,26 @@ async def handle_stats(callback_query: CallbackQuery, session: AsyncSession):
         await callback_query.answer("Произошла ошибка при получении статистики", show_alert=True)
 
 
+@router.callback_query(AdminPanelCallback.filter(F.action == "stats_caches"), IsAdminFilter())
+async def handle_cache_stats(callback_query: CallbackQuery):
+    lines = []
+    for namespace, stats in get_cache_stats().items():
+        requests = stats["hits"] + stats["misses"]
+        hit_rate = stats["hits"] / requests * 100 if requests else 0
+        size = f"{stats['size']}/{stats['maxsize']}" if stats["size"] is not None else "Redis"
+        lines.append(
+            f"<b>{namespace}</b>: {size}\n"
+            f"└ попадания {stats['hits']} ({hit_rate:.1f}%), промахи {stats['misses']}, вытеснено {stats['evictions']}"
+        )
+
+    text = "🧠 <b>Кэши процесса</b> (с момента запуска)\n\n" + ("\n\n".join(lines) or "Кэши ещё не создавались.")
+    try:
+        await callback_query.message.edit_text(text=text, reply_markup=build_admin_back_kb("stats"))
+    except TelegramBadRequest as e:
+        if "message is not modified" not in str(e):
+            logger.error(f"[Stats] Ошибка при выводе статистики кэшей: {e}")
+
+
 @router.callback_query(AdminPanelCallback.filter(F.action == "stats_export_users_csv"), IsAdminFilter())
 async def handle_export_users_csv(callback_query: CallbackQuery, session: AsyncSession):
     kb = build_admin_back_kb("stats")
@@ -20,10 +20,12 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from database import create_tariff
 from database.models import Gift, Key, Server, Tariff
+from database.servers import invalidate_servers_cache
 from database.tariffs import (
     create_subgroup_hash,
     find_subgroup_by_hash,
     get_tariffs,
+    invalidate_tariff_cache,
     move_tariff_down as db_move_tariff_down,
     move_tariff_up as db_move_tariff_up,
 )
@@ -537,6 +539,8 @@ async def delete_tariff_with_gift_replacement(callback: CallbackQuery, session:
         await session.execute(update(Server).where(Server.tariff_group == group_code).values(tariff_group=None))
 
     await session.commit()
+    invalidate_tariff_cache()
+    invalidate_servers_cache()
     await callback.message.edit_text("🗑 Тариф удалён. Все подарки обновлены.", reply_markup=build_tariff_menu_kb())
 
 
@@ -574,6 +578,8 @@ async def delete_tariff(callback: CallbackQuery, session: AsyncSession):
         await session.execute(update(Server).where(Server.tariff_group == group_code).values(tariff_group=None))
 
     await session.commit()
+    invalidate_tariff_cache()
+    invalidate_servers_cache()
     await callback.message.edit_text("🗑 Тариф успешно удалён.", reply_markup=build_tariff_menu_kb())
 
 
@@ -636,6 +642,7 @@ async def set_vless_flag(callback: CallbackQuery, state: FSMContext, session: As
     tariff.vless = vless_flag
     tariff.updated_at = datetime.utcnow()
     await session.commit()
+    invalidate_tariff_cache()
     await state.clear()
 
     text, markup = render_tariff_card(tariff)
@@ -683,6 +690,7 @@ async def apply_edit(message: Message, state: FSMContext, session: AsyncSession)
     tariff.updated_at = datetime.utcnow()
 
     await session.commit()
+    invalidate_tariff_cache()
     await state.clear()
 
     text, markup = render_tariff_card(tariff)
@@ -702,6 +710,7 @@ async def toggle_tariff_status(callback: CallbackQuery, session: AsyncSession):
 
     tariff.is_active = not tariff.is_active
     await session.commit()
+    invalidate_tariff_cache()
 
     text, markup = render_tariff_card(tariff)
     await callback.message.edit_text(text=text, reply_markup=markup)
@@ -862,6 +871,7 @@ async def apply_subgroup_title(message: Message, state: FSMContext, session: Asy
         update(Tariff).where(Tariff.id.in_(selected_ids)).values(subgroup_title=title, updated_at=datetime.utcnow())
     )
     await session.commit()
+    invalidate_tariff_cache()
     await state.clear()
 
     await message.answer(
@@ -1001,6 +1011,7 @@ async def save_new_subgroup_title(message: Message, state: FSMContext, session:
         .values(subgroup_title=new_title)
     )
     await session.commit()
+    invalidate_tariff_cache()
     await state.clear()
 
     create_subgroup_hash(new_title, group_code)
@@ -1062,6 +1073,7 @@ async def perform_subgroup_deletion(callback: CallbackQuery, state: FSMContext,
         .values(subgroup_title=None)
     )
     await session.commit()
+    invalidate_tariff_cache()
     await state.clear()
 
     await callback.message.edit_text(
@@ -1211,6 +1223,7 @@ async def save_subgroup_tariffs_changes(callback: CallbackQuery, state: FSMConte
         )
 
     await session.commit()
+    invalidate_tariff_cache()
     await state.clear()
 
     if not selected_tariff_ids:
@@ -17,7 +17,7 @@ from sqlalchemy import delete, func, or_, select, update
 from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from config import REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD, USE_COUNTRY_SELECTION
+from config import USE_COUNTRY_SELECTION
 from database import (
     delete_key,
     delete_user_data,
@@ -44,7 +44,9 @@ from handlers.keys.operations import (
 )
 from handlers.utils import generate_random_email, sanitize_key_name
 from logger import logger
-from panels.remnawave import RemnawaveAPI
+from middlewares.ban_checker import invalidate_ban_cache
+from middlewares.user import invalidate_user_cache
+from panels.remnawave_clients import get_remnawave_client
 from utils.csv_export import export_referrals_csv
 
 from ..panel.keyboard import (
@@ -129,8 +131,8 @@ async def handle_hwid_menu(
         )
         return
 
-    api = RemnawaveAPI(remna_server["api_url"])
-    if not await api.login(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD):
+    api = await get_remnawave_client(remna_server["api_url"])
+    if not api:
         await callback_query.message.edit_text("❌ Ошибка авторизации в Remnawave.")
         return
 
@@ -185,8 +187,8 @@ async def handle_hwid_reset(
         )
         return
 
-    api = RemnawaveAPI(remna_server["api_url"])
-    if not await api.login(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD):
+    api = await get_remnawave_client(remna_server["api_url"])
+    if not api:
         await callback_query.message.edit_text("❌ Ошибка авторизации в Remnawave.")
         return
 
@@ -1114,6 +1116,7 @@ async def handle_delete_user_confirm(
 
     try:
         await delete_user_data(session, tg_id)
+        await invalidate_user_cache(tg_id)
 
         await callback_query.message.edit_text(
             text=f"🗑️ Пользователь с ID {tg_id} был удален.",
@@ -1664,6 +1667,7 @@ async def handle_ban_forever_reason_input(message: Message, state: FSMContext, s
 
     await session.execute(stmt)
     await session.commit()
+    await invalidate_ban_cache(tg_id)
     await state.clear()
 
     await message.answer(
@@ -1741,6 +1745,7 @@ async def handle_ban_duration_input(message: Message, state: FSMContext, session
 
         await session.execute(stmt)
         await session.commit()
+        await invalidate_ban_cache(tg_id)
 
         text = (
             f"✅ Пользователь <code>{tg_id}</code> временно забанен до <b>{until:%Y-%m-%d %H:%M}</b> по UTC."
@@ -1778,6 +1783,7 @@ async def handle_ban_shadow(callback: CallbackQuery, callback_data: AdminUserEdi
     )
     await session.execute(stmt)
     await session.commit()
+    await invalidate_ban_cache(callback_data.tg_id)
 
     await callback.message.edit_text(
         text=f"👻 Пользователь <code>{callback_data.tg_id}</code> получил теневой бан.",
@@ -1793,6 +1799,7 @@ async def handle_user_unban(
 ):
     await session.execute(delete(ManualBan).where(ManualBan.tg_id == callback_data.tg_id))
     await session.commit()
+    await invalidate_ban_cache(callback_data.tg_id)
 
     text = (
         f"✅ Пользователь <code>{callback_data.tg_id}</code> разблокирован. Нажмите кнопку ниже для возврата в профиль."
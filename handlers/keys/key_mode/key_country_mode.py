@@ -28,6 +28,7 @@ from config import (
 )
 from database import (
     add_user,
+    adjust_key_count,
     check_server_name_by_cluster,
     check_user_exists,
     filter_cluster_by_subgroup,
@@ -63,6 +64,7 @@ from hooks.hooks import run_hooks
 from logger import logger
 from panels._3xui import delete_client, get_xui_instance
 from panels.remnawave import RemnawaveAPI, get_vless_link_for_remnawave_by_username
+from panels.remnawave_clients import get_remnawave_client
 
 
 router = Router()
@@ -427,8 +429,8 @@ async def finalize_key_creation(
                                 update(Key).where(Key.tg_id == tg_id, Key.email == email).values(key=None)
                             )
                         elif old_server_info.panel_type.lower() == "remnawave":
-                            remna_del = RemnawaveAPI(old_server_info.api_url)
-                            if await remna_del.login(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD):
+                            remna_del = await get_remnawave_client(old_server_info.api_url)
+                            if remna_del:
                                 await remna_del.delete_user(client_id)
                                 await session.execute(
                                     update(Key)
@@ -441,8 +443,8 @@ async def finalize_key_creation(
         panel_type = server_info.panel_type.lower()
 
         if panel_type == "remnawave" or is_full_remnawave:
-            remna = RemnawaveAPI(server_info.api_url)
-            if not await remna.login(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD):
+            remna = await get_remnawave_client(server_info.api_url)
+            if not remna:
                 raise ValueError(f"❌ Не удалось авторизоваться в Remnawave ({server_info.server_name})")
 
             expire_at = datetime.utcfromtimestamp(expiry_timestamp / 1000).isoformat() + "Z"
@@ -578,6 +580,13 @@ async def finalize_key_creation(
 
         await session.commit()
 
+        if old_key_name:
+            if old_key_details["server_id"] != selected_country:
+                adjust_key_count(old_key_details["server_id"], -1)
+                adjust_key_count(selected_country, 1)
+        else:
+            adjust_key_count(selected_country, 1)
+
     except Exception as e:
         logger.error(f"[Key Finalize] Ошибка при создании ключа для пользователя {tg_id}: {e}")
         await callback_query.message.answer("❌ Произошла ошибка при создании подписки. Попробуйте снова.")
@@ -22,8 +22,6 @@ from config import (
     HAPP_CRYPTOLINK,
     HWID_RESET_BUTTON,
     QRCODE,
-    REMNAWAVE_LOGIN,
-    REMNAWAVE_PASSWORD,
     REMNAWAVE_WEBAPP,
     TOGGLE_CLIENT,
     USE_COUNTRY_SELECTION,
@@ -67,7 +65,7 @@ from handlers.utils import (
 from hooks.hook_buttons import insert_hook_buttons
 from hooks.hooks import run_hooks
 from logger import logger
-from panels.remnawave import RemnawaveAPI
+from panels.remnawave_clients import get_remnawave_client
 
 
 router = Router()
@@ -285,8 +283,8 @@ async def render_key_info(message: Message, session: Any, key_name: str, image_p
                 (srv for cl in servers.values() for srv in cl if srv.get("panel_type") == "remnawave"), None
             )
             if remna_server:
-                api = RemnawaveAPI(remna_server["api_url"])
-                if await api.login(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD):
+                api = await get_remnawave_client(remna_server["api_url"])
+                if api:
                     devices = await api.get_user_hwid_devices(client_id)
                     hwid_count = len(devices or [])
                     user_data = await api.get_user_by_uuid(client_id)
@@ -400,8 +398,8 @@ async def handle_reset_hwid(callback_query: CallbackQuery, session: Any):
         await callback_query.answer("❌ Remnawave-сервер не найден.", show_alert=True)
         return
 
-    api = RemnawaveAPI(remna_server["api_url"])
-    if not await api.login(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD):
+    api = await get_remnawave_client(remna_server["api_url"])
+    if not api:
         await callback_query.answer("❌ Авторизация в Remnawave не удалась.", show_alert=True)
         return
 
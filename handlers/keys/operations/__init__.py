@@ -1,10 +1,18 @@
 # handlers/keys/operations/__init__.py
 
+from .bulk import BulkResult, PanelClient, bulk_add_clients, bulk_update_clients
 from .creation import create_client_on_server, create_key_on_cluster
 from .deletion import delete_key_from_cluster
-from .renewal import renew_key_in_cluster
+from .renewal import extend_keys_on_panels, renew_key_in_cluster
+from .sync import SyncReport, sync_keys_with_panels
 from .toggles import toggle_client_on_cluster
-from .traffic import get_user_traffic, reset_traffic_in_cluster
+from .traffic import (
+    collect_traffic,
+    get_user_traffic,
+    reset_traffic_in_cluster,
+    start_traffic_collector,
+    stop_traffic_collector,
+)
 from .update import update_key_on_cluster, update_subscription
 
 
@@ -12,10 +20,20 @@ __all__ = [
     "create_key_on_cluster",
     "create_client_on_server",
     "renew_key_in_cluster",
+    "extend_keys_on_panels",
     "update_key_on_cluster",
     "update_subscription",
     "delete_key_from_cluster",
     "get_user_traffic",
     "reset_traffic_in_cluster",
+    "collect_traffic",
+    "start_traffic_collector",
+    "stop_traffic_collector",
     "toggle_client_on_cluster",
+    "sync_keys_with_panels",
+    "SyncReport",
+    "PanelClient",
+    "BulkResult",
+    "bulk_add_clients",
+    "bulk_update_clients",
 ]
@@ -0,0 +1,234 @@
+import asyncio
+
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+import py3xui
+
+from config import SUPERNODE
+from logger import (
+    CLOGGER as logger,
+    PANEL_REMNA,
+    PANEL_XUI,
+)
+from panels._3xui import add_clients_bulk, get_xui_instance, update_clients_bulk
+from panels.remnawave_clients import pipeline_remnawave_calls
+
+from .utils import bytes_from_gb, split_by_panel
+
+
+BULK_PANEL_CONCURRENCY = 10
+XUI_FLOW = "xtls-rprx-vision"
+
+
+@dataclass
+class PanelClient:
+    """Клиент в терминах панелей: total_gb в гигабайтах, short_uuid — для пересоздания в Remnawave с прежней ссылкой."""
+
+    client_id: str
+    email: str
+    tg_id: int
+    expiry_time: int
+    total_gb: int = 0
+    device_limit: int = 0
+    short_uuid: str | None = None
+
+
+@dataclass
+class BulkResult:
+    succeeded: set[str] = field(default_factory=set)
+    errors: dict[str, list[str]] = field(default_factory=dict)
+    remnawave_users: dict[str, dict] = field(default_factory=dict)
+
+    def failed_everywhere(self) -> dict[str, list[str]]:
+        """client_id → ошибки для клиентов, которые не удалось обработать ни на одной панели."""
+        return {client_id: errors for client_id, errors in self.errors.items() if client_id not in self.succeeded}
+
+
+def xui_email(email: str, server_name: str) -> str:
+    """Email клиента в 3x-ui: с суффиксом сервера при SUPERNODE, в нижнем регистре, как его сохраняет add_client."""
+    return (f"{email}_{server_name}" if SUPERNODE else email).lower()
+
+
+def _group_targets(items: list[tuple[PanelClient, list]]) -> tuple[dict, dict]:
+    """
+    Раскладывает (клиент, серверы) по целям: 3x-ui — по серверу (с SUPERNODE у серверов общего inbound'а
+    разные email, запись в один inbound при этом идёт последовательно), Remnawave — по api_url первой ноды,
+    со сквадами всех нод клиента, как при продлении одного ключа.
+    """
+    xui_groups: dict[str, tuple[dict, list[PanelClient]]] = {}
+    remna_groups: dict[str, list[tuple[PanelClient, list]]] = {}
+    for client, servers in items:
+        xui_servers, remna_servers = split_by_panel(servers)
+        for server in xui_servers:
+            if not server.get("inbound_id"):
+                logger.warning(f"{PANEL_XUI} INBOUND_ID отсутствует для сервера {server.get('server_name')}. Пропуск.")
+                continue
+            xui_groups.setdefault(server["server_name"], (server, []))[1].append(client)
+        remna_servers = [s for s in remna_servers if s.get("inbound_id")]
+        if remna_servers:
+            squads = [s["inbound_id"] for s in remna_servers]
+            remna_groups.setdefault(remna_servers[0]["api_url"], []).append((client, squads))
+    return xui_groups, remna_groups
+
+
+async def _run_bulk(
+    items: list[tuple[PanelClient, list]],
+    xui_op: Callable[[py3xui.AsyncApi, int, str, list[PanelClient]], Awaitable[list[tuple[str, str]]]],
+    remna_call: Callable[..., Awaitable],
+    on_progress: Callable[[int, int], Awaitable[None]] | None,
+) -> BulkResult:
+    result = BulkResult()
+    xui_groups, remna_groups = _group_targets(items)
+    total = sum(len(clients) for _, clients in xui_groups.values()) + sum(map(len, remna_groups.values()))
+    done = 0
+    semaphore = asyncio.Semaphore(BULK_PANEL_CONCURRENCY)
+    inbound_locks: dict[tuple[str, int], asyncio.Lock] = {}
+
+    async def advance(count: int):
+        nonlocal done
+        done += count
+        if on_progress:
+            await on_progress(done, total)
+
+    async def run_xui(server: dict, clients: list[PanelClient]):
+        name = server["server_name"]
+        lock = inbound_locks.setdefault((server["api_url"], int(server["inbound_id"])), asyncio.Lock())
+        async with lock, semaphore:
+            try:
+                xui = await get_xui_instance(server["api_url"])
+                failed = await xui_op(xui, int(server["inbound_id"]), name, clients)
+            except Exception as e:
+                failed = [(xui_email(client.email, name), str(e)) for client in clients]
+
+        by_email = {xui_email(client.email, name).lower(): client for client in clients}
+        failed_ids = set()
+        for email, error in failed:
+            client = by_email.get(email.lower())
+            if client:
+                failed_ids.add(client.client_id)
+                result.errors.setdefault(client.client_id, []).append(f"{name}: {error}")
+        result.succeeded.update(client.client_id for client in clients if client.client_id not in failed_ids)
+        await advance(len(clients))
+
+    async def run_remna(api_url: str, entries: list[tuple[PanelClient, list]]):
+        async def call(api, entry):
+            try:
+                return await remna_call(api, *entry)
+            finally:
+                await advance(1)
+
+        for (client, _), response in await pipeline_remnawave_calls(api_url, entries, call):
+            if isinstance(response, Exception) or not response:
+                error = str(response) if isinstance(response, Exception) else "панель вернула ошибку"
+                result.errors.setdefault(client.client_id, []).append(f"Remnawave: {error}")
+                continue
+            result.succeeded.add(client.client_id)
+            if isinstance(response, dict):
+                result.remnawave_users[client.client_id] = response
+
+    await asyncio.gather(
+        *(run_xui(server, clients) for server, clients in xui_groups.values()),
+        *(run_remna(api_url, entries) for api_url, entries in remna_groups.items()),
+    )
+    logger.info(
+        f"[Bulk] Клиентов {len(items)}, операций на панелях {total}, "
+        f"запросов к 3x-ui ≈{len(xui_groups)}, к Remnawave {sum(map(len, remna_groups.values()))}, "
+        f"ошибок {len(result.failed_everywhere())}"
+    )
+    return result
+
+
+def _remna_expire_at(expiry_time: int) -> str:
+    return datetime.fromtimestamp(expiry_time / 1000, tz=timezone.utc).isoformat()
+
+
+async def bulk_add_clients(
+    items: list[tuple[PanelClient, list]],
+    on_progress: Callable[[int, int], Awaitable[None]] | None = None,
+) -> BulkResult:
+    """
+    Создаёт клиентов на всех их серверах: в 3x-ui — пачками addClient на inbound,
+    в Remnawave — конвейером create_user. Ответы Remnawave сохраняются в remnawave_users (там ссылки подписки).
+    """
+
+    async def add_xui(xui, inbound_id, server_name, clients):
+        return await add_clients_bulk(
+            xui,
+            inbound_id,
+            [
+                py3xui.Client(
+                    id=client.client_id,
+                    email=xui_email(client.email, server_name),
+                    limit_ip=client.device_limit,
+                    total_gb=bytes_from_gb(client.total_gb),
+                    expiry_time=client.expiry_time,
+                    enable=True,
+                    tg_id=client.tg_id,
+                    sub_id=client.email,
+                    flow=XUI_FLOW,
+                )
+                for client in clients
+            ],
+        )
+
+    async def add_remna(api, client: PanelClient, squads: list):
+        user_data = {
+            "uuid": client.client_id,
+            "username": client.email,
+            "trafficLimitStrategy": "NO_RESET",
+            "expireAt": _remna_expire_at(client.expiry_time),
+            "telegramId": client.tg_id,
+            "activeInternalSquads": squads,
+            "hwidDeviceLimit": client.device_limit,
+        }
+        if client.total_gb:
+            user_data["trafficLimitBytes"] = bytes_from_gb(client.total_gb)
+        if client.short_uuid:
+            user_data["shortUuid"] = client.short_uuid
+        response = await api.create_user(user_data)
+        if response:
+            logger.info(f"{PANEL_REMNA} [Bulk] Создан пользователь {client.email}")
+        return response
+
+    return await _run_bulk(items, add_xui, add_remna, on_progress)
+
+
+async def bulk_update_clients(
+    items: list[tuple[PanelClient, list]],
+    on_progress: Callable[[int, int], Awaitable[None]] | None = None,
+) -> BulkResult:
+    """
+    Записывает срок, лимит трафика и устройств существующим клиентам и включает их:
+    в 3x-ui — один снимок inbound'а и updateClient на каждого клиента, в Remnawave — конвейером update_user.
+    Статистика трафика не сбрасывается.
+    """
+
+    async def update_xui(xui, inbound_id, server_name, clients):
+        changes = {
+            xui_email(client.email, server_name): {
+                "id": client.client_id,
+                "expiry_time": client.expiry_time,
+                "total_gb": bytes_from_gb(client.total_gb),
+                "limit_ip": client.device_limit,
+                "enable": True,
+                "sub_id": client.email,
+                "tg_id": client.tg_id,
+                "flow": XUI_FLOW,
+            }
+            for client in clients
+        }
+        return await update_clients_bulk(xui, inbound_id, changes)
+
+    async def update_remna(api, client: PanelClient, squads: list):
+        return await api.update_user(
+            uuid=client.client_id,
+            expire_at=_remna_expire_at(client.expiry_time),
+            telegram_id=client.tg_id,
+            active_user_inbounds=squads,
+            traffic_limit_bytes=bytes_from_gb(client.total_gb),
+            hwid_device_limit=client.device_limit,
+        )
+
+    return await _run_bulk(items, update_xui, update_remna, on_progress)
@@ -5,8 +5,8 @@ from datetime import datetime
 from sqlalchemy import update
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from config import HAPP_CRYPTOLINK, PUBLIC_LINK, REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD, SUPERNODE
-from database import get_servers, get_tariff_by_id, store_key
+from config import HAPP_CRYPTOLINK, PUBLIC_LINK, SUPERNODE
+from database import get_cluster_servers, get_tariff_by_id, store_key
 from database.models import User
 from handlers.utils import ALLOWED_GROUP_CODES, check_server_key_limit
 from logger import (
@@ -15,9 +15,11 @@ from logger import (
     PANEL_XUI,
 )
 from panels._3xui import ClientConfig, add_client, get_xui_instance
-from panels.remnawave import RemnawaveAPI, get_vless_link_for_remnawave_by_username
+from panels.remnawave import get_vless_link_for_remnawave_by_username
+from panels.remnawave_clients import get_remnawave_client
 
 from .aggregated_links import make_aggregated_link
+from .bulk import xui_email
 
 
 async def create_key_on_cluster(
@@ -34,21 +36,10 @@ async def create_key_on_cluster(
     is_trial: bool = False,
 ):
     try:
-        servers = await get_servers(session)
-        cluster = servers.get(cluster_id)
-        server_id_to_store = cluster_id
-
+        cluster = await get_cluster_servers(session, cluster_id)
         if not cluster:
-            found_servers = []
-            for _key, server_list in servers.items():
-                for server_info in server_list:
-                    if server_info.get("server_name", "").lower() == cluster_id.lower():
-                        found_servers.append(server_info)
-            if found_servers:
-                cluster = found_servers
-                server_id_to_store = found_servers[0].get("server_name")
-            else:
-                raise ValueError(f"Кластер или сервер с ID/именем {cluster_id} не найден.")
+            raise ValueError(f"Кластер или сервер с ID/именем {cluster_id} не найден.")
+        server_id_to_store = cluster_id if cluster[0]["cluster_name"] == cluster_id else cluster[0]["server_name"]
 
         enabled_servers = [s for s in cluster if s.get("enabled", True)]
         if not enabled_servers:
@@ -115,9 +106,8 @@ async def create_key_on_cluster(
         remnawave_client_id = None
 
         if remnawave_servers:
-            remna = RemnawaveAPI(remnawave_servers[0]["api_url"])
-            logged_in = await remna.login(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD)
-            if not logged_in:
+            remna = await get_remnawave_client(remnawave_servers[0]["api_url"])
+            if not remna:
                 logger.error(f"{PANEL_REMNA} Не удалось войти в Remnawave API")
             else:
                 expire_at = datetime.utcfromtimestamp(expiry_timestamp / 1000).isoformat() + "Z"
@@ -256,12 +246,8 @@ async def create_client_on_server(
             logger.warning(f"{PANEL_XUI} [Client] INBOUND_ID отсутствует для сервера {server_name}. Пропуск.")
             return
 
-        if SUPERNODE:
-            unique_email = f"{email}_{server_name.lower()}"
-            sub_id = email
-        else:
-            unique_email = email
-            sub_id = unique_email
+        unique_email = xui_email(email, server_name)
+        sub_id = email
 
         total_gb_value = 0
         device_limit_value = 0
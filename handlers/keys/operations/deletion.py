@@ -2,34 +2,23 @@ import asyncio
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from config import REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD
-from database import get_servers
+from database import get_cluster_servers
 from logger import (
     CLOGGER as logger,
     PANEL_REMNA,
     PANEL_XUI,
 )
 from panels._3xui import delete_client, get_xui_instance
-from panels.remnawave import RemnawaveAPI
+from panels.remnawave_clients import get_remnawave_client
 
 from .utils import unique_by_api_url
 
 
 async def delete_key_from_cluster(cluster_id: str, email: str, client_id: str, session: AsyncSession):
     try:
-        servers = await get_servers(session)
-        cluster = servers.get(cluster_id)
-
+        cluster = await get_cluster_servers(session, cluster_id)
         if not cluster:
-            found_servers = []
-            for _, server_list in servers.items():
-                for server_info in server_list:
-                    if server_info.get("server_name", "").lower() == cluster_id.lower():
-                        found_servers.append(server_info)
-            if found_servers:
-                cluster = found_servers
-            else:
-                raise ValueError(f"Кластер или сервер с ID/именем {cluster_id} не найден.")
+            raise ValueError(f"Кластер или сервер с ID/именем {cluster_id} не найден.")
 
         remna_servers = [s for s in cluster if s.get("panel_type", "3x-ui").lower() == "remnawave"]
         xui_servers = [s for s in cluster if s.get("panel_type", "3x-ui").lower() == "3x-ui"]
@@ -74,9 +63,8 @@ async def delete_on_remnawave(servers: list, client_id: str) -> bool:
     servers = unique_by_api_url(servers)
     for s in servers:
         name = s.get("server_name", "remna")
-        api = RemnawaveAPI(s.get("api_url"))
-        ok = await api.login(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD)
-        if not ok:
+        api = await get_remnawave_client(s.get("api_url"))
+        if not api:
             logger.warning(f"{PANEL_REMNA} [{name}] Авторизация не удалась")
             continue
         try:
@@ -1,46 +1,53 @@
 import asyncio
 
+from collections.abc import Awaitable, Callable
 from datetime import datetime
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from config import REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD, SUPERNODE
 from database import (
     delete_notification,
     filter_cluster_by_subgroup,
+    get_cluster_servers,
     get_key_details,
-    get_servers,
+    get_server_topology,
+    get_tariff_catalog,
     resolve_device_limit_from_group,
     update_key_expiry,
     update_key_link,
 )
+from database.models import Key
 from logger import (
     CLOGGER as logger,
     PANEL_REMNA,
     PANEL_XUI,
 )
 from panels._3xui import extend_client_key, get_xui_instance
-from panels.remnawave import RemnawaveAPI
+from panels.remnawave_clients import get_remnawave_client
 
 from .aggregated_links import make_aggregated_link
+from .bulk import PanelClient, bulk_update_clients, xui_email
 from .subgroup_migration import migrate_between_subgroups
 
 
 async def resolve_cluster(session: AsyncSession, cluster_id: str):
-    servers = await get_servers(session)
-    cluster = servers.get(cluster_id)
+    cluster = await get_cluster_servers(session, cluster_id)
     if cluster:
         return cluster
-    found = []
-    for _key, server_list in servers.items():
-        for s in server_list:
-            if s.get("server_name", "").lower() == cluster_id.lower():
-                found.append(s)
-    if found:
-        return found
     raise ValueError(f"Кластер или сервер с ID/именем {cluster_id} не найден.")
 
 
+async def find_key_cluster(session: AsyncSession, cluster_id: str, server_id: str):
+    """Серверы, на которых живёт ключ: его кластер, либо (если ключ привязан к серверу) сам сервер."""
+    topology = await get_server_topology(session)
+    if topology["by_cluster_enabled"].get(server_id):
+        return topology["by_cluster_enabled"][server_id], None
+    for s in topology["by_name"].get(server_id.lower(), ()):
+        if s["server_name"] == server_id:
+            return [s], s
+    return await resolve_cluster(session, cluster_id), None
+
+
 async def renew_on_remnawave(
     cluster: list,
     client_id: str,
@@ -62,8 +69,8 @@ async def renew_on_remnawave(
         remnawave_nodes = [s for s in remnawave_nodes if s.get("server_name") == target_server_name] or remnawave_nodes[
             :1
         ]
-    remna = RemnawaveAPI(remnawave_nodes[0]["api_url"])
-    if not await remna.login(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD):
+    remna = await get_remnawave_client(remnawave_nodes[0]["api_url"])
+    if not remna:
         logger.error(f"{PANEL_REMNA} Не удалось войти в Remnawave API")
         return False
     expire_iso = datetime.utcfromtimestamp(new_expiry_time // 1000).isoformat() + "Z"
@@ -110,12 +117,8 @@ async def renew_on_3xui(
         if not inbound_id:
             logger.warning(f"{PANEL_XUI} INBOUND_ID отсутствует для сервера {server_name}. Пропуск.")
             continue
-        if SUPERNODE:
-            unique_email = f"{email}_{server_name.lower()}"
-            sub_id_val = email
-        else:
-            unique_email = email
-            sub_id_val = unique_email
+        unique_email = xui_email(email, server_name)
+        sub_id_val = email
         traffic_bytes = total_gb * 1024 * 1024 * 1024 if total_gb else 0
 
         async def process_server(si, inbound, uniq, sub, name):
@@ -179,8 +182,6 @@ async def renew_key_in_cluster(
     plan=None,
 ):
     try:
-        servers_map = await get_servers(session)
-
         kd = await get_key_details(session, email)
         if not kd or kd.get("client_id") != client_id:
             logger.error(f"Не найден ключ по email={email} и client_id={client_id}")
@@ -189,22 +190,7 @@ async def renew_key_in_cluster(
         tg_id = int(kd["tg_id"])
         server_id = kd["server_id"]
 
-        single_server = None
-        if servers_map.get(server_id):
-            cluster = servers_map[server_id]
-        else:
-            for _k, sl in servers_map.items():
-                for s in sl:
-                    if s.get("server_name") == server_id:
-                        single_server = s
-                        break
-                if single_server:
-                    break
-            cluster = (
-                [single_server]
-                if single_server
-                else servers_map.get(cluster_id) or await resolve_cluster(session, cluster_id)
-            )
+        cluster, single_server = await find_key_cluster(session, cluster_id, server_id)
 
         dl = await resolve_device_limit_from_group(session, server_id)
         if dl is not None:
@@ -293,3 +279,63 @@ async def renew_key_in_cluster(
     except Exception as e:
         logger.error(f"Не удалось продлить ключ {client_id} в кластере/на сервере {cluster_id}: {e}")
         raise
+
+
+async def extend_keys_on_panels(
+    session: AsyncSession,
+    cluster_id: str,
+    keys: list[Key],
+    add_ms: int,
+    on_progress: Callable[[int, int], Awaitable[None]] | None = None,
+) -> list[tuple[str, str]]:
+    """
+    Продлевает ключи кластера на панелях на add_ms без изменения БД.
+    Тарифы берутся из get_tariff_catalog, топология и лимиты устройств читаются один раз на сервер,
+    запись идёт через bulk_update_clients: свой client.update на каждого клиента 3x-ui
+    и конвейер update_user в Remnawave. Замороженные ключи не трогаются.
+    on_progress(выполнено, всего) считает операции на панелях.
+    Возвращает (email, причина) для ключей, которые не удалось продлить ни на одной панели.
+    """
+    catalog = await get_tariff_catalog(session)
+    tariffs = {
+        tariff["id"]: (
+            int(tariff.get("traffic_limit") or 0),
+            int(tariff.get("device_limit") or 0),
+            tariff.get("subgroup_title"),
+        )
+        for tariff in catalog["all"]
+        if tariff.get("is_active")
+    }
+
+    device_limits = {}
+    scopes = {}
+    items = []
+    for key in keys:
+        if key.is_frozen:
+            continue
+        total_gb, device_limit, subgroup = tariffs.get(key.tariff_id, (0, 0, None))
+        if key.server_id not in device_limits:
+            device_limits[key.server_id] = await resolve_device_limit_from_group(session, key.server_id)
+        if device_limits[key.server_id] is not None:
+            device_limit = device_limits[key.server_id]
+        if (key.server_id, subgroup) not in scopes:
+            cluster, single_server = await find_key_cluster(session, cluster_id, key.server_id)
+            if not single_server and subgroup:
+                cluster = await filter_cluster_by_subgroup(session, cluster, subgroup, cluster_id) or cluster
+            scopes[key.server_id, subgroup] = cluster
+        client = PanelClient(
+            client_id=key.client_id,
+            email=key.email,
+            tg_id=key.tg_id,
+            expiry_time=key.expiry_time + add_ms,
+            total_gb=total_gb,
+            device_limit=device_limit,
+        )
+        items.append((client, scopes[key.server_id, subgroup]))
+
+    result = await bulk_update_clients(items, on_progress=on_progress)
+    emails = {key.client_id: key.email for key in keys}
+    targeted = result.succeeded | set(result.errors)
+    failures = [(emails[client_id], ", ".join(errors)) for client_id, errors in result.failed_everywhere().items()]
+    failures += [(client.email, "нет подходящих серверов") for client, _ in items if client.client_id not in targeted]
+    return failures
@@ -4,7 +4,7 @@ from datetime import datetime
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from config import HAPP_CRYPTOLINK, REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD, SUPERNODE
+from config import HAPP_CRYPTOLINK, SUPERNODE
 from database import filter_cluster_by_subgroup, update_key_client_id
 from logger import (
     CLOGGER as logger,
@@ -12,7 +12,7 @@ from logger import (
     PANEL_XUI,
 )
 from panels._3xui import ClientConfig, add_client, extend_client_key, get_xui_instance
-from panels.remnawave import RemnawaveAPI
+from panels.remnawave_clients import get_remnawave_client
 
 from .deletion import delete_on_3xui, delete_on_remnawave
 from .utils import bytes_from_gb, norm_name, split_by_panel
@@ -34,9 +34,8 @@ async def ensure_on_remnawave(
 
     inbounds = [s.get("inbound_id") for s in servers if s.get("inbound_id")]
 
-    api = RemnawaveAPI(servers[0]["api_url"])
-    ok = await api.login(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD)
-    if not ok:
+    api = await get_remnawave_client(servers[0]["api_url"])
+    if not api:
         logger.error(f"{PANEL_REMNA} API недоступен при создании/обновлении")
         return None, None
 
@@ -0,0 +1,267 @@
+import asyncio
+
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import HAPP_CRYPTOLINK, REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD
+from database.models import Key, Tariff
+from handlers.utils import ALLOWED_GROUP_CODES
+from logger import CLOGGER as logger
+from panels._3xui import get_inbound_snapshot, get_xui_instance
+from panels.remnawave_clients import get_remnawave_client
+
+from .aggregated_links import make_aggregated_link
+from .bulk import PanelClient, bulk_add_clients, bulk_update_clients, xui_email
+from .utils import bytes_from_gb, split_by_panel
+
+
+SYNC_EXPIRY_TOLERANCE_MS = 1000
+
+
+@dataclass
+class SyncReport:
+    total: int = 0
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    orphaned: int = 0
+    failed: list[tuple[str, str]] = field(default_factory=list)
+
+
+def _servers_for_tariff(cluster_servers: list, tariff: dict | None) -> list:
+    """Серверы кластера, на которых должен быть ключ: с учётом подгруппы и спецгруппы тарифа, как при создании."""
+    servers = [s for s in cluster_servers if s.get("enabled", True)]
+    if not tariff:
+        return servers
+    if tariff["subgroup_title"]:
+        servers = [s for s in servers if tariff["subgroup_title"] in s.get("tariff_subgroups", [])] or servers
+    group_code = (tariff["group_code"] or "").lower()
+    if group_code in ALLOWED_GROUP_CODES:
+        servers = [s for s in servers if group_code in (s.get("special_groups") or [])] or servers
+    return servers
+
+
+def _remna_expiry_ms(value: str | None) -> int | None:
+    if not value:
+        return None
+    return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp() * 1000)
+
+
+def _remna_squads(user: dict) -> set | None:
+    squads = user.get("activeInternalSquads")
+    if squads is None:
+        squads = user.get("activeUserInbounds")
+    if squads is None:
+        return None
+    return {str(s.get("uuid") if isinstance(s, dict) else s) for s in squads}
+
+
+async def sync_keys_with_panels(
+    session: AsyncSession,
+    cluster_name: str,
+    cluster_servers: list,
+    keys: list[Key],
+    target_servers: list[str] | None = None,
+    on_progress: Callable[[int, int], Awaitable[None]] | None = None,
+) -> SyncReport:
+    """
+    Сверяет ключи кластера с состоянием панелей и исправляет только расхождения.
+    Список пользователей Remnawave и клиентов каждого inbound 3x-ui (параллельно) читается один раз,
+    затем отсутствующие записи создаются, а отличающиеся (срок, лимиты, сквады) обновляются
+    пакетно через bulk_add_clients и bulk_update_clients. target_servers ограничивает сверку указанными серверами.
+    Записи панелей, которым не соответствует ни один ключ кластера, только подсчитываются.
+    """
+    report = SyncReport(total=len(keys))
+
+    tariff_ids = {key.tariff_id for key in keys if key.tariff_id}
+    tariffs = {}
+    if tariff_ids:
+        result = await session.execute(
+            select(
+                Tariff.id, Tariff.traffic_limit, Tariff.device_limit, Tariff.subgroup_title, Tariff.group_code
+            ).where(Tariff.id.in_(tariff_ids))
+        )
+        tariffs = {row.id: row._asdict() for row in result}
+
+    names = [s["server_name"] for s in cluster_servers] + [cluster_name]
+    result = await session.execute(select(Key.email).where(Key.server_id.in_(names)))
+    known_emails = {(email or "").lower() for (email,) in result.all()}
+
+    scopes = {}
+    for key in keys:
+        scope = _servers_for_tariff(cluster_servers, tariffs.get(key.tariff_id))
+        if target_servers is not None:
+            scope = [s for s in scope if s["server_name"] in target_servers]
+        scopes[key.client_id] = split_by_panel(scope)
+
+    clients = {key.client_id: _panel_client(key, tariffs) for key in keys}
+    to_create: dict[str, list] = {}
+    to_update: dict[str, list] = {}
+    new_links: dict[str, str] = {}
+
+    remna_servers = [s for s in split_by_panel(cluster_servers)[1] if s.get("inbound_id")]
+    if remna_servers and any(scopes[key.client_id][1] for key in keys):
+        remna = await get_remnawave_client(remna_servers[0]["api_url"])
+        if not remna:
+            raise RuntimeError("Не удалось авторизоваться в Remnawave")
+        panel_users = await remna.get_all_users_time(username=REMNAWAVE_LOGIN, password=REMNAWAVE_PASSWORD)
+        if panel_users is None:
+            raise RuntimeError("Не удалось получить список пользователей Remnawave")
+        users_by_uuid = {str(u.get("uuid")): u for u in panel_users}
+        all_ids = set((await session.execute(select(Key.client_id))).scalars().all())
+        report.orphaned += sum(1 for uuid in users_by_uuid if uuid not in all_ids)
+        _diff_remnawave(keys, scopes, clients, users_by_uuid, to_create, to_update, new_links)
+
+    xui_servers: dict[str, dict] = {}
+    server_keys: dict[str, list[Key]] = {}
+    for key in keys:
+        for server in scopes[key.client_id][0]:
+            if server.get("inbound_id"):
+                xui_servers[server["server_name"]] = server
+                server_keys.setdefault(server["server_name"], []).append(key)
+
+    async def fetch_snapshot(server: dict) -> dict | None:
+        xui = await get_xui_instance(server["api_url"])
+        return await get_inbound_snapshot(xui, int(server["inbound_id"]), force=True)
+
+    snapshots = await asyncio.gather(*(fetch_snapshot(server) for server in xui_servers.values()))
+    for server, snapshot in zip(xui_servers.values(), snapshots, strict=True):
+        if snapshot is None:
+            raise RuntimeError(f"Inbound {server['inbound_id']} не найден на сервере {server['server_name']}")
+        panel_clients = {email.lower(): client for email, client in snapshot["by_email"].items()}
+        suffix = f"_{server['server_name'].lower()}"
+        report.orphaned += sum(
+            1 for email in panel_clients if email not in known_emails and email.removesuffix(suffix) not in known_emails
+        )
+        _diff_xui(server, server_keys[server["server_name"]], clients, panel_clients, to_create, to_update)
+
+    create_items = [(clients[client_id], servers) for client_id, servers in to_create.items()]
+    update_items = [(clients[client_id], servers) for client_id, servers in to_update.items()]
+    total_operations = _count_operations(create_items) + _count_operations(update_items)
+    offset = 0
+
+    async def progress(done: int, _total: int):
+        if on_progress:
+            await on_progress(offset + done, total_operations)
+
+    created = await bulk_add_clients(create_items, on_progress=progress)
+    offset = _count_operations(create_items)
+    updated = await bulk_update_clients(update_items, on_progress=progress)
+
+    failed_ids = set(created.errors) | set(updated.errors)
+    for client_id in failed_ids:
+        errors = created.errors.get(client_id, []) + updated.errors.get(client_id, [])
+        report.failed.append((clients[client_id].email, "; ".join(errors)))
+        logger.warning(f"[Sync] {clients[client_id].email}: {'; '.join(errors)}")
+
+    for client_id, user in created.remnawave_users.items():
+        link = user["happ"]["cryptoLink"] if HAPP_CRYPTOLINK else user.get("subscriptionUrl")
+        if link:
+            new_links[client_id] = link
+
+    changed = set(to_create) | set(to_update)
+    report.unchanged = len(keys) - len(changed)
+    report.created = len(set(to_create) - failed_ids)
+    report.updated = len(set(to_update) - set(to_create) - failed_ids)
+
+    keys_by_id = {key.client_id: key for key in keys}
+    for client_id, link in new_links.items():
+        key = keys_by_id[client_id]
+        if client_id in failed_ids or link == key.remnawave_link:
+            continue
+        key_value = await make_aggregated_link(
+            session=session,
+            cluster_all=cluster_servers,
+            cluster_id=cluster_name,
+            email=key.email,
+            client_id=client_id,
+            tg_id=key.tg_id,
+            remna_link_override=link,
+            plan=key.tariff_id,
+        )
+        await session.execute(
+            update(Key).where(Key.client_id == client_id).values(remnawave_link=link, key=key_value or key.key)
+        )
+    await session.commit()
+
+    logger.info(
+        f"[Sync] {cluster_name}: ключей {report.total}, создано {report.created}, обновлено {report.updated}, "
+        f"без изменений {report.unchanged}, лишних на панелях {report.orphaned}, ошибок {len(report.failed)}"
+    )
+    return report
+
+
+def _panel_client(key: Key, tariffs: dict) -> PanelClient:
+    tariff = tariffs.get(key.tariff_id) or {}
+    short_uuid = None
+    if key.remnawave_link and "/" in key.remnawave_link:
+        short_uuid = key.remnawave_link.rstrip("/").split("/")[-1]
+    return PanelClient(
+        client_id=key.client_id,
+        email=key.email,
+        tg_id=key.tg_id,
+        expiry_time=key.expiry_time,
+        total_gb=int(tariff.get("traffic_limit") or 0),
+        device_limit=int(tariff.get("device_limit") or 0),
+        short_uuid=short_uuid,
+    )
+
+
+def _count_operations(items: list) -> int:
+    """Сколько операций на панелях выполнит bulk-вызов: по одной на сервер 3x-ui и одна на Remnawave."""
+    count = 0
+    for _, servers in items:
+        xui_servers, remna_servers = split_by_panel(servers)
+        count += len(xui_servers) + bool(remna_servers)
+    return count
+
+
+def _diff_remnawave(keys, scopes, clients, users_by_uuid, to_create, to_update, new_links):
+    for key in keys:
+        servers = [s for s in scopes[key.client_id][1] if s.get("inbound_id")]
+        if not servers:
+            continue
+        client = clients[key.client_id]
+        user = users_by_uuid.get(key.client_id)
+        if user is None:
+            to_create.setdefault(key.client_id, []).extend(servers)
+            continue
+
+        if not HAPP_CRYPTOLINK and user.get("subscriptionUrl") and user["subscriptionUrl"] != key.remnawave_link:
+            new_links[key.client_id] = user["subscriptionUrl"]
+
+        panel_expiry = _remna_expiry_ms(user.get("expireAt"))
+        panel_squads = _remna_squads(user)
+        drifted = (
+            panel_expiry is None
+            or abs(panel_expiry - key.expiry_time) > SYNC_EXPIRY_TOLERANCE_MS
+            or int(user.get("trafficLimitBytes") or 0) != bytes_from_gb(client.total_gb)
+            or int(user.get("hwidDeviceLimit") or 0) != client.device_limit
+            or (panel_squads is not None and panel_squads != {str(s["inbound_id"]) for s in servers})
+            or (user.get("telegramId") is not None and int(user["telegramId"]) != key.tg_id)
+        )
+        if drifted:
+            to_update.setdefault(key.client_id, []).extend(servers)
+
+
+def _diff_xui(server, keys, clients, panel_clients, to_create, to_update):
+    for key in keys:
+        client = clients[key.client_id]
+        panel_client = panel_clients.get(xui_email(key.email, server["server_name"]))
+        if panel_client is None:
+            to_create.setdefault(key.client_id, []).append(server)
+            continue
+
+        drifted = (
+            str(panel_client.id) != key.client_id
+            or abs((panel_client.expiry_time or 0) - key.expiry_time) > SYNC_EXPIRY_TOLERANCE_MS
+            or int(panel_client.total_gb or 0) != bytes_from_gb(client.total_gb)
+            or int(panel_client.limit_ip or 0) != client.device_limit
+            or not panel_client.enable
+        )
+        if drifted:
+            to_update.setdefault(key.client_id, []).append(server)
@@ -4,11 +4,12 @@ from typing import Any
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from config import REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD, SUPERNODE
-from database import get_servers
+from database import get_cluster_servers
 from logger import logger
 from panels._3xui import get_xui_instance, toggle_client
-from panels.remnawave import RemnawaveAPI
+from panels.remnawave_clients import get_remnawave_client
+
+from .bulk import xui_email
 
 
 async def toggle_client_on_cluster(
@@ -21,19 +22,9 @@ async def toggle_client_on_cluster(
     try:
         if session is None:
             raise ValueError("[Cluster Toggle] Не передан объект сессии для toggle_client_on_cluster")
-        servers = await get_servers(session)
-        cluster = servers.get(cluster_id)
-
+        cluster = await get_cluster_servers(session, cluster_id)
         if not cluster:
-            found_servers = []
-            for _, server_list in servers.items():
-                for server_info in server_list:
-                    if server_info.get("server_name", "").lower() == cluster_id.lower():
-                        found_servers.append(server_info)
-            if found_servers:
-                cluster = found_servers
-            else:
-                raise ValueError(f"Кластер или сервер с ID/именем '{cluster_id}' не найден.")
+            raise ValueError(f"Кластер или сервер с ID/именем '{cluster_id}' не найден.")
 
         results = {}
         tasks = []
@@ -50,13 +41,13 @@ async def toggle_client_on_cluster(
                     continue
 
                 xui = await get_xui_instance(server_info["api_url"])
-                unique_email = f"{email}_{server_name.lower()}" if SUPERNODE else email
+                unique_email = xui_email(email, server_name)
 
                 tasks.append(toggle_client(xui, int(inbound_id), unique_email, client_id, enable))
 
             elif panel_type == "remnawave":
-                remna = RemnawaveAPI(server_info["api_url"])
-                if not await remna.login(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD):
+                remna = await get_remnawave_client(server_info["api_url"])
+                if not remna:
                     logger.error(f"[Remnawave] Авторизация не удалась на сервере {server_name}")
                     results[server_name] = False
                     continue
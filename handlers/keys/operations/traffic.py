@@ -1,28 +1,65 @@
 import asyncio
 
+from datetime import datetime, timedelta
 from typing import Any
 
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from config import REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD, SUPERNODE
-from database import get_servers
+import config as cfg
+
+from config import REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD
+from database import (
+    async_session_maker,
+    get_cluster_servers,
+    get_key_traffic,
+    get_servers,
+    purge_key_traffic,
+    upsert_key_traffic,
+    zero_key_traffic,
+)
 from database.models import Key, Server
 from logger import logger
 from panels._3xui import get_client_traffic, get_xui_instance
-from panels.remnawave import RemnawaveAPI
+from panels.remnawave_clients import get_remnawave_client
+from utils.update_sharding import is_primary_worker
+
+from .bulk import xui_email
+
+
+TRAFFIC_COLLECT_INTERVAL = getattr(cfg, "TRAFFIC_COLLECT_INTERVAL", 600)
+TRAFFIC_RETENTION = timedelta(days=1)
+REMNAWAVE_TRAFFIC_SERVER = "remnawave"
+REMNAWAVE_TRAFFIC_LABEL = "Remnawave (общий)"
+
+_collector_task: asyncio.Task | None = None
 
 
 async def get_user_traffic(session: AsyncSession, tg_id: int, email: str) -> dict[str, Any]:
     """
-    Получает трафик пользователя на всех серверах, где у него есть ключ (3x-ui и Remnawave).
-    Для Remnawave трафик считается один раз и отображается как "Remnawave (общий):".
+    Трафик пользователя по серверам, где у него есть ключ (3x-ui и Remnawave).
+    Читается из key_traffic, который заполняет фоновый сборщик; к панелям идём, только если данных ещё нет.
+    Для Remnawave трафик считается один раз и отображается как "Remnawave (общий)".
     """
     result = await session.execute(select(Key.client_id, Key.server_id).where(Key.tg_id == tg_id, Key.email == email))
     rows = result.all()
     if not rows:
         return {"status": "error", "message": "У пользователя нет активных ключей."}
 
+    stored = await get_key_traffic(session, [row.client_id for row in rows])
+    if stored:
+        traffic = {}
+        for row in stored:
+            label = REMNAWAVE_TRAFFIC_LABEL if row.server_name == REMNAWAVE_TRAFFIC_SERVER else row.server_name
+            traffic[label] = round(traffic.get(label, 0) + (row.up + row.down) / 1073741824, 2)
+        return {"status": "success", "traffic": traffic}
+
+    return await _fetch_user_traffic(session, rows)
+
+
+async def _fetch_user_traffic(session: AsyncSession, rows: list) -> dict[str, Any]:
+    """Живой запрос трафика к панелям для строк (client_id, server_id) ключей пользователя."""
+
     server_ids = {row.server_id for row in rows}
     server_id = list(server_ids)[0]
 
@@ -99,8 +136,8 @@ async def get_user_traffic(session: AsyncSession, tg_id: int, email: str) -> dic
 
     if remnawave_client_id and remnawave_api_url:
         try:
-            remna = RemnawaveAPI(remnawave_api_url)
-            if not await remna.login(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD):
+            remna = await get_remnawave_client(remnawave_api_url)
+            if not remna:
                 user_traffic_data["Remnawave (общий)"] = "Не удалось авторизоваться"
             else:
                 user_data = await remna.get_user_by_uuid(remnawave_client_id)
@@ -116,21 +153,121 @@ async def get_user_traffic(session: AsyncSession, tg_id: int, email: str) -> dic
     return {"status": "success", "traffic": user_traffic_data}
 
 
-async def reset_traffic_in_cluster(cluster_id: str, email: str, session: AsyncSession) -> None:
-    try:
+async def _collect_xui_traffic(api_url: str, inbounds: dict[int, str]) -> list[dict]:
+    """Счётчики всех клиентов панели одним inbounds/list: uuid берётся из settings, up/down — из clientStats."""
+    xui = await get_xui_instance(api_url)
+    rows = []
+    for inbound in await xui.inbound.get_list():
+        server_name = inbounds.get(inbound.id)
+        if not server_name:
+            continue
+        ids = {(c.email or "").lower(): str(c.id) for c in inbound.settings.clients or [] if c.id}
+        for stat in inbound.client_stats or []:
+            client_id = ids.get((stat.email or "").lower())
+            if client_id:
+                rows.append(
+                    {"client_id": client_id, "server_name": server_name, "up": stat.up or 0, "down": stat.down or 0}
+                )
+    return rows
+
+
+async def _collect_remnawave_traffic(api_url: str) -> list[dict]:
+    remna = await get_remnawave_client(api_url)
+    if not remna:
+        raise RuntimeError("Не удалось авторизоваться в Remnawave")
+    users = await remna.get_all_users_time(username=REMNAWAVE_LOGIN, password=REMNAWAVE_PASSWORD)
+    if users is None:
+        raise RuntimeError("Не удалось получить список пользователей Remnawave")
+    rows = []
+    for user in users:
+        used = user.get("usedTrafficBytes")
+        if used is None:
+            used = (user.get("userTraffic") or {}).get("usedTrafficBytes", 0)
+        if user.get("uuid"):
+            rows.append({
+                "client_id": str(user["uuid"]),
+                "server_name": REMNAWAVE_TRAFFIC_SERVER,
+                "up": 0,
+                "down": int(used or 0),
+            })
+    return rows
+
+
+async def collect_traffic():
+    """
+    Один проход сборщика: по запросу на панель 3x-ui и на API Remnawave, затем upsert в key_traffic
+    для существующих ключей и очистка строк, не обновлявшихся дольше TRAFFIC_RETENTION.
+    """
+    started_at = datetime.utcnow()
+    async with async_session_maker() as session:
         servers = await get_servers(session)
-        cluster = servers.get(cluster_id)
+        known_ids = set((await session.execute(select(Key.client_id))).scalars().all())
+
+    xui_panels: dict[str, dict[int, str]] = {}
+    remna_urls = set()
+    for cluster_servers in servers.values():
+        for server in cluster_servers:
+            panel_type = str(server.get("panel_type", "3x-ui")).lower()
+            if panel_type == "3x-ui" and server.get("inbound_id"):
+                xui_panels.setdefault(server["api_url"], {})[int(server["inbound_id"])] = server["server_name"]
+            elif panel_type == "remnawave":
+                remna_urls.add(server["api_url"])
+
+    sources = [(url, _collect_xui_traffic(url, inbounds)) for url, inbounds in xui_panels.items()]
+    sources += [(url, _collect_remnawave_traffic(url)) for url in remna_urls]
+    results = await asyncio.gather(*(coro for _, coro in sources), return_exceptions=True)
+
+    rows = []
+    for (url, _), result in zip(sources, results, strict=True):
+        if isinstance(result, Exception):
+            logger.warning(f"[Traffic] Не удалось собрать трафик с {url}: {result}")
+            continue
+        rows += [row for row in result if row["client_id"] in known_ids]
+
+    async with async_session_maker() as session:
+        saved = await upsert_key_traffic(session, rows, started_at)
+        purged = await purge_key_traffic(session, started_at - TRAFFIC_RETENTION)
+    logger.info(
+        f"[Traffic] Опрошено панелей: {len(sources)}, записано счётчиков: {saved}, удалено устаревших: {purged}"
+    )
 
+
+async def run_traffic_collector():
+    while True:
+        try:
+            await collect_traffic()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"[Traffic] Ошибка сборщика трафика: {e}")
+        await asyncio.sleep(TRAFFIC_COLLECT_INTERVAL)
+
+
+async def start_traffic_collector():
+    """Фоновый сбор трафика раз в TRAFFIC_COLLECT_INTERVAL секунд; 0 отключает сборщик."""
+    global _collector_task
+    if not TRAFFIC_COLLECT_INTERVAL or not is_primary_worker():
+        return
+    if _collector_task and not _collector_task.done():
+        return
+    _collector_task = asyncio.create_task(run_traffic_collector())
+    logger.info("[Traffic] Сборщик трафика запущен")
+
+
+async def stop_traffic_collector():
+    global _collector_task
+    if not _collector_task:
+        return
+    _collector_task.cancel()
+    await asyncio.gather(_collector_task, return_exceptions=True)
+    _collector_task = None
+
+
+async def reset_traffic_in_cluster(cluster_id: str, email: str, session: AsyncSession) -> None:
+    try:
+        cluster = await get_cluster_servers(session, cluster_id)
         if not cluster:
-            found_servers = []
-            for _, server_list in servers.items():
-                for server_info in server_list:
-                    if server_info.get("server_name", "").lower() == cluster_id.lower():
-                        found_servers.append(server_info)
-            if found_servers:
-                cluster = found_servers
-            else:
-                raise ValueError(f"Кластер или сервер с ID/именем {cluster_id} не найден.")
+            raise ValueError(f"Кластер или сервер с ID/именем {cluster_id} не найден.")
 
         tasks = []
         remnawave_done = False
@@ -153,8 +290,8 @@ async def reset_traffic_in_cluster(cluster_id: str, email: str, session: AsyncSe
 
                 client_id = row[0]
 
-                remna = RemnawaveAPI(api_url)
-                if not await remna.login(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD):
+                remna = await get_remnawave_client(api_url)
+                if not remna:
                     logger.warning(f"[Reset Traffic] Не удалось авторизоваться в Remnawave ({server_name})")
                     continue
 
@@ -168,12 +305,16 @@ async def reset_traffic_in_cluster(cluster_id: str, email: str, session: AsyncSe
                     continue
 
                 xui = await get_xui_instance(api_url)
-                unique_email = f"{email}_{server_name.lower()}" if SUPERNODE else email
+                unique_email = xui_email(email, server_name)
                 tasks.append(xui.client.reset_stats(int(inbound_id), unique_email))
             else:
                 logger.warning(f"[Reset Traffic] Неизвестный тип панели '{panel_type}' на {server_name}")
 
         await asyncio.gather(*tasks, return_exceptions=True)
+
+        result = await session.execute(select(Key.client_id).where(Key.email == email))
+        await zero_key_traffic(session, result.scalars().all())
+        await session.commit()
         logger.info(f"[Reset Traffic] Трафик клиента {email} успешно сброшен в кластере {cluster_id}")
 
     except Exception as e:
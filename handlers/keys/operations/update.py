@@ -5,8 +5,8 @@ from datetime import datetime, timezone
 from sqlalchemy import delete, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from config import PUBLIC_LINK, REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD, SUPERNODE
-from database import filter_cluster_by_subgroup, get_servers, store_key
+from config import PUBLIC_LINK
+from database import adjust_key_count, filter_cluster_by_subgroup, get_servers, store_key
 from database.models import Key, Tariff
 from handlers.utils import get_least_loaded_cluster
 from logger import (
@@ -15,9 +15,10 @@ from logger import (
     PANEL_XUI,
 )
 from panels._3xui import ClientConfig, add_client, get_xui_instance
-from panels.remnawave import RemnawaveAPI
+from panels.remnawave_clients import get_remnawave_client
 
 from .aggregated_links import make_aggregated_link
+from .bulk import xui_email
 from .deletion import delete_key_from_cluster
 
 
@@ -65,8 +66,8 @@ async def update_key_on_cluster(
 
         if remnawave_servers:
             inbound_ids = [s["inbound_id"] for s in remnawave_servers if s.get("inbound_id")]
-            remna = RemnawaveAPI(remnawave_servers[0]["api_url"])
-            if await remna.login(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD):
+            remna = await get_remnawave_client(remnawave_servers[0]["api_url"])
+            if remna:
                 await remna.delete_user(client_id)
 
                 group_code = remnawave_servers[0].get("tariff_group")
@@ -127,7 +128,7 @@ async def update_key_on_cluster(
             xui = await get_xui_instance(server_info["api_url"])
 
             sub_id = email
-            unique_email = f"{email}_{server_name.lower()}" if SUPERNODE else email
+            unique_email = xui_email(email, server_name)
 
             group_code = server_info.get("tariff_group")
             if not group_code:
@@ -207,6 +208,7 @@ async def update_subscription(
     await delete_key_from_cluster(old_cluster_id, email, client_id, session=session)
     await session.execute(delete(Key).where(Key.tg_id == tg_id, Key.email == email))
     await session.commit()
+    adjust_key_count(old_cluster_id, -1)
 
     if country_override or cluster_override:
         new_cluster_id = country_override or cluster_override
@@ -1,5 +1,6 @@
 import asyncio
 import base64
+import codecs
 import random
 import re
 import time
@@ -8,7 +9,7 @@ import urllib.parse
 import aiohttp
 
 from aiohttp import web
-from sqlalchemy import select
+from cachetools import TTLCache
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from config import (
@@ -19,25 +20,76 @@ from config import (
     USERNAME_BOT,
     USE_COUNTRY_SELECTION,
 )
-from database import get_key_details, get_servers
-from database.models import Server
+from database import get_key_details, get_server_topology
 from handlers.texts import HAPP_ANNOUNCE, HIDDIFY_PROFILE_TITLE, SUBSCRIPTION_INFO_TEXT, V2RAYTUN_ANNOUNCE
 from handlers.utils import convert_to_bytes
 from logger import logger
 
 
+SUBSCRIPTION_CACHE_TTL = 60
+SUBSCRIPTION_FETCH_TIMEOUT = 5
+
+_subscription_cache: TTLCache = TTLCache(maxsize=20_000, ttl=SUBSCRIPTION_CACHE_TTL)
+_subscription_inflight: dict[tuple, asyncio.Task] = {}
+_http_session: aiohttp.ClientSession | None = None
+
+SUBSCRIPTION_CHUNK_SIZE = 64 * 1024
+_BASE64_JUNK_RE = re.compile(rb"[^A-Za-z0-9+/=]")
+_TRAFFIC_PART_RE = re.compile(r"\d+(?:[.,]\d+)?\s*(?:GB|MB|KB|TB)", re.IGNORECASE)
+_TRAFFIC_VALUE_RE = re.compile(r"([\d\.]+)\s*([GMKTB]B)", re.IGNORECASE)
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Общая HTTP-сессия с пулом соединений для запросов к панелям."""
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        _http_session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=SUBSCRIPTION_FETCH_TIMEOUT),
+            connector=aiohttp.TCPConnector(limit=200, limit_per_host=20, ttl_dns_cache=300),
+        )
+    return _http_session
+
+
+async def close_http_session():
+    global _http_session
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+
+
+async def iter_subscription_lines(response: aiohttp.ClientResponse):
+    """Построчно декодирует base64-тело подписки по мере чтения, не держа весь ответ в памяти."""
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = b""
+    tail = ""
+
+    async for chunk in response.content.iter_chunked(SUBSCRIPTION_CHUNK_SIZE):
+        pending += _BASE64_JUNK_RE.sub(b"", chunk)
+        cut = len(pending) - len(pending) % 4
+        if not cut:
+            continue
+        tail += text_decoder.decode(base64.b64decode(pending[:cut]))
+        pending = pending[cut:]
+        *lines, tail = tail.split("\n")
+        for line in lines:
+            yield line
+
+    if pending:
+        tail += text_decoder.decode(base64.b64decode(pending + b"=" * (-len(pending) % 4)))
+    tail += text_decoder.decode(b"", final=True)
+    for line in tail.split("\n"):
+        yield line
+
+
 async def fetch_url_content(url: str, identifier: str) -> tuple[list[str], dict[str, str]]:
     try:
-        timeout = aiohttp.ClientTimeout(total=5)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.get(url, ssl=False) as response:
-                if response.status == 200:
-                    content = await response.text()
-                    lines = base64.b64decode(content).decode("utf-8").split("\n")
-                    headers = {k.lower(): v for k, v in response.headers.items()}
-                    logger.debug(f"Fetched {url}: {len(lines)} lines, headers: {headers}")
-                    return lines, headers
-                return [], {}
+        async with get_http_session().get(url, ssl=False) as response:
+            if response.status == 200:
+                lines = [line async for line in iter_subscription_lines(response)]
+                headers = {k.lower(): v for k, v in response.headers.items()}
+                logger.debug(f"Fetched {url}: {len(lines)} lines, headers: {headers}")
+                return lines, headers
+            return [], {}
     except Exception as e:
         logger.error(f"Error fetching URL {url}: {e}")
         return [], {}
@@ -57,33 +109,34 @@ async def combine_unique_lines(
     urls_with_query = [f"{url}?{query_string}" if query_string else url for url in urls]
     tasks = [fetch_url_content(url, identifier) for url in urls_with_query]
     results = await asyncio.gather(*tasks, return_exceptions=True)
-    all_lines = []
+    all_lines: dict[str, None] = {}
     all_headers = []
     for result in results:
         if isinstance(result, tuple):
             lines, headers = result
-            for line in filter(None, lines):
-                if line not in all_lines:
-                    all_lines.append(line)
+            all_lines.update(dict.fromkeys(filter(None, lines)))
             all_headers.append(headers)
-    return all_lines, all_headers
+    return list(all_lines), all_headers
 
 
 async def get_subscription_urls(
     server_id: str, email: str, session: AsyncSession, include_remnawave_key: str = None
 ) -> list[str]:
     urls = []
+    topology = await get_server_topology(session)
     if USE_COUNTRY_SELECTION:
-        result = await session.execute(
-            select(Server.subscription_url).where(Server.server_name == server_id, Server.enabled.is_(True))
+        server_data = next(
+            (
+                s["subscription_url"]
+                for s in topology["by_name"].get(server_id.lower(), ())
+                if s["server_name"] == server_id
+            ),
+            None,
         )
-        server_data = result.scalar()
         if server_data:
             urls.append(f"{server_data}/{email}")
     else:
-        servers = await get_servers(session)
-        cluster_servers = servers.get(server_id, [])
-        for server in cluster_servers:
+        for server in topology["by_cluster_enabled"].get(server_id, ()):
             if url := server.get("subscription_url"):
                 urls.append(f"{url}/{email}")
 
@@ -134,7 +187,7 @@ def calculate_traffic(
         remaining_str = parts[1].strip() if len(parts) == 2 else ""
         if remaining_str:
             remaining_str = remaining_str.replace(",", ".")
-            m_total = re.search(r"([\d\.]+)\s*([GMKTB]B)", remaining_str, re.IGNORECASE)
+            m_total = _TRAFFIC_VALUE_RE.search(remaining_str)
             if m_total:
                 value = float(m_total.group(1))
                 unit = m_total.group(2).upper()
@@ -168,7 +221,7 @@ def clean_subscription_line(line: str) -> str:
     traffic = ""
     for part in parts[1:]:
         part_decoded = urllib.parse.unquote(part).strip()
-        if re.search(r"\d+(?:[.,]\d+)?\s*(?:GB|MB|KB|TB)", part_decoded, re.IGNORECASE):
+        if _TRAFFIC_PART_RE.search(part_decoded):
             traffic = part_decoded
             break
     meta_clean = f"{country} - {traffic}" if traffic else country
@@ -236,48 +289,79 @@ def prepare_headers(
         }
 
 
-async def handle_subscription(request: web.Request) -> web.Response:
-    email = request.match_info.get("email")
-    tg_id = request.match_info.get("tg_id")
-
-    if not email or not tg_id:
-        return web.Response(text="❌ Неверные параметры запроса.", status=400)
+def get_user_agent_class(user_agent: str) -> str:
+    if "Happ" in user_agent:
+        return "happ"
+    if "Hiddify" in user_agent:
+        return "hiddify"
+    if "v2raytun" in user_agent:
+        return "v2raytun"
+    return "default"
 
-    sessionmaker = request.app["sessionmaker"]
 
+async def build_subscription_response(
+    sessionmaker, email: str, tg_id: str, query_string: str, user_agent: str
+) -> tuple[int, str, dict[str, str] | None]:
     async with sessionmaker() as session:
-        try:
-            key = await get_key_details(session, email)
-            if not key:
-                return web.Response(text="❌ Клиент с таким email не найден.", status=404)
+        key = await get_key_details(session, email)
+        if not key:
+            return 404, "❌ Клиент с таким email не найден.", None
+
+        if int(tg_id) != int(key["tg_id"]):
+            return 403, "❌ Неверные данные. Получите свой ключ в боте.", None
+
+        expiry_time_ms = key["expiry_time"]
+        server_id = key["server_id"]
+        remnawave_link = key["remnawave_link"]
+
+        time_left = format_time_left(expiry_time_ms)
+
+        urls = await get_subscription_urls(server_id, email, session, include_remnawave_key=remnawave_link)
+        if not urls:
+            return 404, "❌ Сервер не найден.", None
 
-            if int(tg_id) != int(key["tg_id"]):
-                return web.Response(text="❌ Неверные данные. Получите свой ключ в боте.", status=403)
+    combined_subscriptions, headers_list = await combine_unique_lines(urls, tg_id or email, query_string)
 
-            expiry_time_ms = key["expiry_time"]
-            server_id = key["server_id"]
-            remnawave_link = key["remnawave_link"]
+    cleaned_subscriptions = [clean_subscription_line(line) for line in combined_subscriptions]
 
-            time_left = format_time_left(expiry_time_ms)
+    base64_encoded = base64.b64encode("\n".join(cleaned_subscriptions).encode("utf-8")).decode("utf-8")
+    subscription_info = SUBSCRIPTION_INFO_TEXT.format(email=email, time_left=time_left)
 
-            urls = await get_subscription_urls(server_id, email, session, include_remnawave_key=remnawave_link)
-            if not urls:
-                return web.Response(text="❌ Сервер не найден.", status=404)
+    subscription_userinfo = calculate_traffic(cleaned_subscriptions, expiry_time_ms, headers_list)
+    headers = prepare_headers(user_agent, PROJECT_NAME, subscription_info, subscription_userinfo)
 
-            query_string = request.query_string
-            combined_subscriptions, headers_list = await combine_unique_lines(urls, tg_id or email, query_string)
+    return 200, base64_encoded, headers
 
-            cleaned_subscriptions = [clean_subscription_line(line) for line in combined_subscriptions]
 
-            base64_encoded = base64.b64encode("\n".join(cleaned_subscriptions).encode("utf-8")).decode("utf-8")
-            subscription_info = SUBSCRIPTION_INFO_TEXT.format(email=email, time_left=time_left)
+async def handle_subscription(request: web.Request) -> web.Response:
+    email = request.match_info.get("email")
+    tg_id = request.match_info.get("tg_id")
 
-            user_agent = request.headers.get("User-Agent", "")
-            subscription_userinfo = calculate_traffic(cleaned_subscriptions, expiry_time_ms, headers_list)
-            headers = prepare_headers(user_agent, PROJECT_NAME, subscription_info, subscription_userinfo)
+    if not email or not tg_id:
+        return web.Response(text="❌ Неверные параметры запроса.", status=400)
 
-            return web.Response(text=base64_encoded, headers=headers)
+    query_string = request.query_string
+    user_agent = request.headers.get("User-Agent", "")
+    cache_key = (email, tg_id, query_string, get_user_agent_class(user_agent))
 
-        except Exception as e:
-            logger.error(f"Ошибка в handle_subscription: {e}", exc_info=True)
-            return web.Response(text=f"❌ Ошибка сервера: {e}", status=500)
+    cached = _subscription_cache.get(cache_key)
+    if cached:
+        return web.Response(text=cached[0], headers=cached[1])
+
+    try:
+        task = _subscription_inflight.get(cache_key)
+        if task is None:
+            task = asyncio.create_task(
+                build_subscription_response(request.app["sessionmaker"], email, tg_id, query_string, user_agent)
+            )
+            _subscription_inflight[cache_key] = task
+            task.add_done_callback(lambda _: _subscription_inflight.pop(cache_key, None))
+
+        status, text, headers = await asyncio.shield(task)
+        if status == 200:
+            _subscription_cache[cache_key] = (text, headers)
+        return web.Response(text=text, headers=headers, status=status)
+
+    except Exception as e:
+        logger.error(f"Ошибка в handle_subscription: {e}", exc_info=True)
+        return web.Response(text=f"❌ Ошибка сервера: {e}", status=500)
@@ -1,5 +1,6 @@
 import asyncio
 
+from collections.abc import AsyncIterator
 from datetime import datetime, timedelta
 
 import pytz
@@ -22,21 +23,24 @@ from config import (
     TRIAL_TIME_DISABLE,
 )
 from database import (
-    add_notification,
-    check_notification_time,
+    add_notifications_bulk,
+    can_notify_from,
     check_notifications_bulk,
     check_tariff_exists,
     delete_key,
     delete_notification,
     get_all_keys,
     get_balance,
-    get_last_notification_time,
+    get_notification_times,
     get_tariff_by_id,
     get_tariffs_for_cluster,
+    stream_expiring_keys,
+    stream_unnotified_keys,
     update_balance,
     update_key_expiry,
     update_key_tariff,
 )
+from database.models import Key
 from handlers.keys.operations import delete_key_from_cluster, renew_key_in_cluster
 from handlers.notifications.notify_kb import (
     build_change_tariff_kb,
@@ -52,11 +56,11 @@ from handlers.texts import (
     get_renewal_message,
 )
 from handlers.utils import format_hours, format_minutes, get_russian_month
-from hooks.hooks import run_hooks
+from hooks.hooks import has_hooks, run_hooks
 from logger import logger
 
 from .hot_leads_notifications import notify_hot_leads
-from .notify_utils import prepare_key_expiry_data, send_messages_with_limit, send_notification
+from .notify_utils import enqueue_notifications, prepare_key_expiry_data
 from .special_notifications import notify_inactive_trial_users, notify_users_no_traffic
 
 
@@ -79,13 +83,6 @@ async def periodic_notifications(bot: Bot, *, sessionmaker: async_sessionmaker):
 
                     current_time = int(datetime.now(moscow_tz).timestamp() * 1000)
 
-                    try:
-                        keys = await get_all_keys(session=session)
-                        keys = [k for k in keys if not k.is_frozen]
-                    except Exception as e:
-                        logger.error(f"Ошибка при получении ключей: {e}")
-                        keys = []
-
                     if not TRIAL_TIME_DISABLE:
                         try:
                             await notify_inactive_trial_users(bot, session)
@@ -97,7 +94,8 @@ async def periodic_notifications(bot: Bot, *, sessionmaker: async_sessionmaker):
                             threshold_24h = int(
                                 (datetime.now(moscow_tz) + timedelta(hours=NOTIFY_24H_HOURS)).timestamp() * 1000
                             )
-                            await notify_24h_keys(bot, session, current_time, threshold_24h, keys)
+                            keys_24h = stream_expiring_keys(session, expiry_from=current_time, expiry_to=threshold_24h)
+                            await notify_24h_keys(bot, session, current_time, threshold_24h, keys_24h)
                         except Exception as e:
                             logger.error(f"Ошибка в notify_24h_keys: {e}")
 
@@ -106,22 +104,30 @@ async def periodic_notifications(bot: Bot, *, sessionmaker: async_sessionmaker):
                             threshold_10h = int(
                                 (datetime.now(moscow_tz) + timedelta(hours=NOTIFY_10H_HOURS)).timestamp() * 1000
                             )
-                            await notify_10h_keys(bot, session, current_time, threshold_10h, keys)
+                            keys_10h = stream_expiring_keys(session, expiry_from=current_time, expiry_to=threshold_10h)
+                            await notify_10h_keys(bot, session, current_time, threshold_10h, keys_10h)
                         except Exception as e:
                             logger.error(f"Ошибка в notify_10h_keys: {e}")
 
                     try:
-                        await handle_expired_keys(bot, session, current_time, keys)
+                        expired_keys = stream_expiring_keys(session, expiry_to=current_time - 1)
+                        await handle_expired_keys(bot, session, current_time, expired_keys)
                     except Exception as e:
                         logger.error(f"Ошибка в handle_expired_keys: {e}")
 
                     if NOTIFY_INACTIVE_TRAFFIC:
                         try:
-                            await notify_users_no_traffic(bot, session, current_time, keys)
+                            created_before = current_time - NOTIFY_INACTIVE_TRAFFIC * 3600 * 1000
+                            unnotified_keys = stream_unnotified_keys(
+                                session, created_before=created_before, active_at=current_time
+                            )
+                            await notify_users_no_traffic(bot, session, current_time, unnotified_keys)
                         except Exception as e:
                             logger.error(f"Ошибка в notify_users_no_traffic: {e}")
                     try:
-                        await run_hooks("periodic_notifications", bot=bot, session=session, keys=keys)
+                        if has_hooks("periodic_notifications"):
+                            all_keys = [k for k in await get_all_keys(session=session) if not k.is_frozen]
+                            await run_hooks("periodic_notifications", bot=bot, session=session, keys=all_keys)
                     except Exception as e:
                         logger.error(f"Ошибка в хуках periodic_notifications: {e}")
 
@@ -143,82 +149,103 @@ async def notify_24h_keys(
     session: AsyncSession,
     current_time: int,
     threshold_time_24h: int,
-    keys: list,
+    keys: AsyncIterator[list[Key]],
 ):
     logger.info(f"Начало проверки подписок, истекающих через {NOTIFY_24H_HOURS} часов.")
-    expiring_keys = [key for key in keys if key.expiry_time and current_time < key.expiry_time <= threshold_time_24h]
-    logger.info(f"Найдено {len(expiring_keys)} подписок, истекающих через {NOTIFY_24H_HOURS} часов.")
-
-    tg_ids = [getattr(key, "tg_id", key["tg_id"]) for key in expiring_keys]
-    emails = [key.email or "" for key in expiring_keys]
-    allowed = await check_notifications_bulk(session, "key_24h", NOTIFY_24H_HOURS, tg_ids=tg_ids, emails=emails)
+    found_count = 0
+    sent_count = 0
+    sent_notifications = []
 
-    allowed_set = {(u["tg_id"], u["email"]) for u in allowed}
-    messages = []
+    try:
+        async for expiring_keys in keys:
+            found_count += len(expiring_keys)
+
+            tg_ids = [key.tg_id for key in expiring_keys]
+            emails = [key.email or "" for key in expiring_keys]
+            allowed = await check_notifications_bulk(session, "key_24h", NOTIFY_24H_HOURS, tg_ids=tg_ids, emails=emails)
+            notification_times = await get_notification_times(
+                session, tg_ids, [f"{email}_key_24h" for email in emails] + [f"{email}_renew" for email in emails]
+            )
 
-    for key in expiring_keys:
-        tg_id = getattr(key, "tg_id", key["tg_id"])
-        email = key.email or ""
-        if (tg_id, email) not in allowed_set:
-            continue
+            allowed_set = {(u["tg_id"], u["email"]) for u in allowed}
+            messages = []
 
-        notification_id = f"{email}_key_24h"
+            for key in expiring_keys:
+                tg_id = key.tg_id
+                email = key.email or ""
+                if (tg_id, email) not in allowed_set:
+                    continue
 
-        can_notify = await check_notification_time(session, tg_id, notification_id, hours=NOTIFY_24H_HOURS)
-        if not can_notify:
-            continue
+                notification_id = f"{email}_key_24h"
 
-        expiry_data = await prepare_key_expiry_data(key, session, current_time)
+                can_notify = can_notify_from(notification_times, tg_id, notification_id, hours=NOTIFY_24H_HOURS)
+                if not can_notify:
+                    continue
 
-        notification_text = KEY_EXPIRY.format(
-            email=email,
-            hours_left_formatted=expiry_data["hours_left_formatted"],
-            formatted_expiry_date=expiry_data["formatted_expiry_date"],
-            tariff_name=expiry_data["tariff_name"],
-            tariff_details=expiry_data["tariff_details"],
-        )
+                expiry_data = await prepare_key_expiry_data(key, session, current_time)
 
-        if NOTIFY_RENEW:
-            try:
-                await process_auto_renew_or_notify(
-                    bot,
-                    session,
-                    key,
-                    notification_id,
-                    1,
-                    "notify_24h.jpg",
-                    notification_text,
-                )
-            except Exception as e:
-                logger.error(f"Ошибка авто-продления/уведомления для пользователя {tg_id}: {e}")
-                continue
-        else:
-            keyboard = build_notification_kb(email)
-            messages.append({
-                "tg_id": tg_id,
-                "text": notification_text,
-                "photo": "notify_24h.jpg",
-                "keyboard": keyboard,
-                "notification_id": notification_id,
-                "email": email,
-            })
-
-    if messages:
-        results = await send_messages_with_limit(bot, messages, session=session)
-        sent_count = 0
-        for msg, result in zip(messages, results, strict=False):
-            tg_id = msg["tg_id"]
-
-            await add_notification(session, tg_id, msg["notification_id"])
-            if result:
-                sent_count += 1
-                logger.info(f"Отправлено уведомление об истекающей подписке {msg['email']} пользователю {tg_id}.")
-            else:
-                logger.warning(
-                    f"Не удалось отправить уведомление об истекающей подписке {msg['email']} пользователю {tg_id}."
+                notification_text = KEY_EXPIRY.format(
+                    email=email,
+                    hours_left_formatted=expiry_data["hours_left_formatted"],
+                    formatted_expiry_date=expiry_data["formatted_expiry_date"],
+                    tariff_name=expiry_data["tariff_name"],
+                    tariff_details=expiry_data["tariff_details"],
                 )
-        logger.info(f"Отправлено {sent_count} уведомлений об истечении подписки через {NOTIFY_24H_HOURS} часов.")
 
+                if NOTIFY_RENEW:
+                    try:
+                        await process_auto_renew_or_notify(
+                            bot,
+                            session,
+                            key,
+                            notification_id,
+                            1,
+                            "notify_24h.jpg",
+                            notification_text,
+                            notification_times,
+                            sent_notifications,
+                        )
+                    except Exception as e:
+                        logger.error(f"Ошибка авто-продления/уведомления для пользователя {tg_id}: {e}")
+                        continue
+                else:
+                    keyboard = build_notification_kb(email)
+                    messages.append({
+                        "tg_id": tg_id,
+                        "text": notification_text,
+                        "photo": "notify_24h.jpg",
+                        "keyboard": keyboard,
+                        "notification_id": notification_id,
+                        "email": email,
+                    })
+
+            if messages:
+                results = await enqueue_notifications(session, messages, "key_expiry")
+                for msg, result in zip(messages, results, strict=False):
+                    tg_id = msg["tg_id"]
+
+                    sent_notifications.append((tg_id, msg["notification_id"]))
+                    if result:
+                        sent_count += 1
+                        logger.info(
+                            f"Уведомление об истекающей подписке {msg['email']} пользователю {tg_id} "
+                            "поставлено в очередь."
+                        )
+                    else:
+                        logger.warning(
+                            f"Не удалось поставить в очередь уведомление об истекающей подписке {msg['email']} "
+                            f"пользователю {tg_id}."
+                        )
+
+            await add_notifications_bulk(session, sent_notifications)
+            sent_notifications.clear()
+    finally:
+        await add_notifications_bulk(session, sent_notifications)
+
+    logger.info(f"Найдено {found_count} подписок, истекающих через {NOTIFY_24H_HOURS} часов.")
+    logger.info(
+        f"Поставлено в очередь {sent_count} уведомлений об истечении подписки через {NOTIFY_24H_HOURS} часов."
+    )
     logger.info(f"Обработка всех уведомлений за {NOTIFY_24H_HOURS} часов завершена.")
     await asyncio.sleep(1)
 
@@ -228,82 +255,103 @@ async def notify_10h_keys(
     session: AsyncSession,
     current_time: int,
     threshold_time_10h: int,
-    keys: list,
+    keys: AsyncIterator[list[Key]],
 ):
     logger.info(f"Начало проверки подписок, истекающих через {NOTIFY_10H_HOURS} часов.")
-    expiring_keys = [key for key in keys if key.expiry_time and current_time < key.expiry_time <= threshold_time_10h]
-    logger.info(f"Найдено {len(expiring_keys)} подписок, истекающих через {NOTIFY_10H_HOURS} часов.")
+    found_count = 0
+    sent_count = 0
+    sent_notifications = []
 
-    tg_ids = [key.tg_id for key in expiring_keys]
-    emails = [key.email or "" for key in expiring_keys]
-    allowed = await check_notifications_bulk(session, "key_10h", NOTIFY_10H_HOURS, tg_ids=tg_ids, emails=emails)
+    try:
+        async for expiring_keys in keys:
+            found_count += len(expiring_keys)
+
+            tg_ids = [key.tg_id for key in expiring_keys]
+            emails = [key.email or "" for key in expiring_keys]
+            allowed = await check_notifications_bulk(session, "key_10h", NOTIFY_10H_HOURS, tg_ids=tg_ids, emails=emails)
+            notification_times = await get_notification_times(
+                session, tg_ids, [f"{email}_key_10h" for email in emails] + [f"{email}_renew" for email in emails]
+            )
 
-    allowed_set = {(u["tg_id"], u["email"]) for u in allowed}
-    messages = []
+            allowed_set = {(u["tg_id"], u["email"]) for u in allowed}
+            messages = []
 
-    for key in expiring_keys:
-        tg_id = key.tg_id
-        email = key.email or ""
-        if (tg_id, email) not in allowed_set:
-            continue
+            for key in expiring_keys:
+                tg_id = key.tg_id
+                email = key.email or ""
+                if (tg_id, email) not in allowed_set:
+                    continue
 
-        notification_id = f"{email}_key_10h"
+                notification_id = f"{email}_key_10h"
 
-        can_notify = await check_notification_time(session, tg_id, notification_id, hours=NOTIFY_10H_HOURS)
-        if not can_notify:
-            continue
+                can_notify = can_notify_from(notification_times, tg_id, notification_id, hours=NOTIFY_10H_HOURS)
+                if not can_notify:
+                    continue
 
-        expiry_data = await prepare_key_expiry_data(key, session, current_time)
+                expiry_data = await prepare_key_expiry_data(key, session, current_time)
 
-        notification_text = KEY_EXPIRY.format(
-            email=email,
-            hours_left_formatted=expiry_data["hours_left_formatted"],
-            formatted_expiry_date=expiry_data["formatted_expiry_date"],
-            tariff_name=expiry_data["tariff_name"],
-            tariff_details=expiry_data["tariff_details"],
-        )
-
-        if NOTIFY_RENEW:
-            try:
-                await process_auto_renew_or_notify(
-                    bot,
-                    session,
-                    key,
-                    notification_id,
-                    1,
-                    "notify_10h.jpg",
-                    notification_text,
-                )
-            except Exception as e:
-                logger.error(f"Ошибка авто-продления/уведомления для пользователя {tg_id}: {e}")
-                continue
-        else:
-            keyboard = build_notification_kb(email)
-            messages.append({
-                "tg_id": tg_id,
-                "text": notification_text,
-                "photo": "notify_10h.jpg",
-                "keyboard": keyboard,
-                "notification_id": notification_id,
-                "email": email,
-            })
-
-    if messages:
-        results = await send_messages_with_limit(bot, messages, session=session)
-        sent_count = 0
-        for msg, result in zip(messages, results, strict=False):
-            tg_id = msg["tg_id"]
-
-            await add_notification(session, tg_id, msg["notification_id"])
-            if result:
-                sent_count += 1
-                logger.info(f"Отправлено уведомление об истекающей подписке {msg['email']} пользователю {tg_id}.")
-            else:
-                logger.warning(
-                    f"Не удалось отправить уведомление об истекающей подписке {msg['email']} пользователю {tg_id}."
+                notification_text = KEY_EXPIRY.format(
+                    email=email,
+                    hours_left_formatted=expiry_data["hours_left_formatted"],
+                    formatted_expiry_date=expiry_data["formatted_expiry_date"],
+                    tariff_name=expiry_data["tariff_name"],
+                    tariff_details=expiry_data["tariff_details"],
                 )
-        logger.info(f"Отправлено {sent_count} уведомлений об истечении подписки через {NOTIFY_10H_HOURS} часов.")
 
+                if NOTIFY_RENEW:
+                    try:
+                        await process_auto_renew_or_notify(
+                            bot,
+                            session,
+                            key,
+                            notification_id,
+                            1,
+                            "notify_10h.jpg",
+                            notification_text,
+                            notification_times,
+                            sent_notifications,
+                        )
+                    except Exception as e:
+                        logger.error(f"Ошибка авто-продления/уведомления для пользователя {tg_id}: {e}")
+                        continue
+                else:
+                    keyboard = build_notification_kb(email)
+                    messages.append({
+                        "tg_id": tg_id,
+                        "text": notification_text,
+                        "photo": "notify_10h.jpg",
+                        "keyboard": keyboard,
+                        "notification_id": notification_id,
+                        "email": email,
+                    })
+
+            if messages:
+                results = await enqueue_notifications(session, messages, "key_expiry")
+                for msg, result in zip(messages, results, strict=False):
+                    tg_id = msg["tg_id"]
+
+                    sent_notifications.append((tg_id, msg["notification_id"]))
+                    if result:
+                        sent_count += 1
+                        logger.info(
+                            f"Уведомление об истекающей подписке {msg['email']} пользователю {tg_id} "
+                            "поставлено в очередь."
+                        )
+                    else:
+                        logger.warning(
+                            f"Не удалось поставить в очередь уведомление об истекающей подписке {msg['email']} "
+                            f"пользователю {tg_id}."
+                        )
+
+            await add_notifications_bulk(session, sent_notifications)
+            sent_notifications.clear()
+    finally:
+        await add_notifications_bulk(session, sent_notifications)
+
+    logger.info(f"Найдено {found_count} подписок, истекающих через {NOTIFY_10H_HOURS} часов.")
+    logger.info(
+        f"Поставлено в очередь {sent_count} уведомлений об истечении подписки через {NOTIFY_10H_HOURS} часов."
+    )
     logger.info(f"Обработка всех уведомлений за {NOTIFY_10H_HOURS} часов завершена.")
     await asyncio.sleep(1)
 
@@ -312,125 +360,148 @@ async def handle_expired_keys(
     bot: Bot,
     session: AsyncSession,
     current_time: int,
-    keys: list,
+    keys: AsyncIterator[list[Key]],
 ):
     logger.info("Начало обработки истекших ключей.")
+    found_count = 0
+    sent_count = 0
+    sent_notifications = []
 
-    expired_keys = [key for key in keys if key.expiry_time and key.expiry_time < current_time]
-    logger.info(f"Найдено {len(expired_keys)} истекших ключей.")
+    try:
+        async for expired_keys in keys:
+            found_count += len(expired_keys)
+
+            tg_ids = [key.tg_id for key in expired_keys]
+            emails = [key.email or "" for key in expired_keys]
+            users = await check_notifications_bulk(session, "key_expired", 0, tg_ids=tg_ids, emails=emails)
+            users_set = {(u["tg_id"], u["email"]) for u in users}
+            notification_times = await get_notification_times(
+                session, tg_ids, [f"{email}_key_expired" for email in emails] + [f"{email}_renew" for email in emails]
+            )
 
-    tg_ids = [key.tg_id for key in expired_keys]
-    emails = [key.email or "" for key in expired_keys]
-    users = await check_notifications_bulk(session, "key_expired", 0, tg_ids=tg_ids, emails=emails)
+            messages = []
 
-    messages = []
+            for key in expired_keys:
+                tg_id = key.tg_id
+                email = key.email or ""
+                client_id = key.client_id
+                server_id = key.server_id
+                notification_id = f"{email}_key_expired"
 
-    for key in expired_keys:
-        tg_id = key.tg_id
-        email = key.email or ""
-        client_id = key.client_id
-        server_id = key.server_id
-        notification_id = f"{email}_key_expired"
-
-        last_notification_time = await get_last_notification_time(session, tg_id, notification_id)
+                last_time = notification_times.get((tg_id, notification_id))
+                last_notification_time = int(last_time.timestamp() * 1000) if last_time else None
 
-        if NOTIFY_RENEW_EXPIRED:
-            try:
-                balance = await get_balance(session, tg_id)
-                tariffs = await get_tariffs_for_cluster(session, server_id)
-                tariff = tariffs[0] if tariffs else None
-
-                if tariff and balance >= tariff["price_rub"]:
-                    await process_auto_renew_or_notify(
-                        bot,
-                        session,
-                        key,
-                        notification_id,
-                        1,
-                        "notify_expired.jpg",
-                        get_renewal_message(
-                            tariff_name=tariff.get("name", ""),
-                            traffic_limit=tariff.get("traffic_limit") if tariff.get("traffic_limit") is not None else 0,
-                            device_limit=tariff.get("device_limit") if tariff.get("device_limit") is not None else 0,
-                            subgroup_title=tariff.get("subgroup_title", ""),
-                        ),
-                    )
+                if NOTIFY_RENEW_EXPIRED:
+                    try:
+                        balance = await get_balance(session, tg_id)
+                        tariffs = await get_tariffs_for_cluster(session, server_id)
+                        tariff = tariffs[0] if tariffs else None
+
+                        if tariff and balance >= tariff["price_rub"]:
+                            await process_auto_renew_or_notify(
+                                bot,
+                                session,
+                                key,
+                                notification_id,
+                                1,
+                                "notify_expired.jpg",
+                                get_renewal_message(
+                                    tariff_name=tariff.get("name", ""),
+                                    traffic_limit=tariff.get("traffic_limit")
+                                    if tariff.get("traffic_limit") is not None
+                                    else 0,
+                                    device_limit=tariff.get("device_limit")
+                                    if tariff.get("device_limit") is not None
+                                    else 0,
+                                    subgroup_title=tariff.get("subgroup_title", ""),
+                                ),
+                                notification_times,
+                                sent_notifications,
+                            )
 
-            except Exception as e:
-                logger.error(f"Ошибка авто-продления для пользователя {tg_id}: {e}")
-                continue
-
-        if NOTIFY_DELETE_KEY:
-            delete_immediately = NOTIFY_DELETE_DELAY == 0
-            delete_after_delay = False
-
-            if last_notification_time is not None:
-                delete_after_delay = (current_time - last_notification_time) / (1000 * 60) >= NOTIFY_DELETE_DELAY
-                logger.info(
-                    f"Прошло минут={(current_time - last_notification_time) / (1000 * 60):.2f} "
-                    f"NOTIFY_DELETE_DELAY={NOTIFY_DELETE_DELAY}"
-                )
+                    except Exception as e:
+                        logger.error(f"Ошибка авто-продления для пользователя {tg_id}: {e}")
+                        continue
+
+                if NOTIFY_DELETE_KEY:
+                    delete_immediately = NOTIFY_DELETE_DELAY == 0
+                    delete_after_delay = False
+
+                    if last_notification_time is not None:
+                        delete_after_delay = (current_time - last_notification_time) / (1000 * 60) >= NOTIFY_DELETE_DELAY
+                        logger.info(
+                            f"Прошло минут={(current_time - last_notification_time) / (1000 * 60):.2f} "
+                            f"NOTIFY_DELETE_DELAY={NOTIFY_DELETE_DELAY}"
+                        )
 
-            if delete_immediately or delete_after_delay:
-                try:
-                    await delete_key_from_cluster(server_id, email, client_id, session)
-                    await delete_key(session, client_id)
-                    logger.info(f"🗑 Ключ {client_id} для пользователя {tg_id} успешно удалён.")
+                    if delete_immediately or delete_after_delay:
+                        try:
+                            await delete_key_from_cluster(server_id, email, client_id, session)
+                            await delete_key(session, client_id)
+                            logger.info(f"🗑 Ключ {client_id} для пользователя {tg_id} успешно удалён.")
+
+                            keyboard = build_notification_expired_kb()
+                            messages.append({
+                                "tg_id": tg_id,
+                                "text": KEY_DELETED_MSG.format(email=email),
+                                "photo": "notify_expired.jpg",
+                                "keyboard": keyboard,
+                                "notification_id": notification_id,
+                                "email": email,
+                            })
+                        except Exception as e:
+                            logger.error(f"Ошибка удаления ключа {client_id} для пользователя {tg_id}: {e}")
+                        continue
+
+                if last_notification_time is None and (tg_id, email) in users_set:
+                    keyboard = build_notification_kb(email)
+
+                    if NOTIFY_DELETE_DELAY > 0:
+                        hours = NOTIFY_DELETE_DELAY // 60
+                        minutes = NOTIFY_DELETE_DELAY % 60
+                        if hours > 0 and minutes > 0:
+                            time_formatted = f"{format_hours(hours)} и {format_minutes(minutes)}"
+                        elif hours > 0:
+                            time_formatted = format_hours(hours)
+                        else:
+                            time_formatted = format_minutes(minutes)
+
+                        delay_message = KEY_EXPIRED_DELAY_MSG.format(email=email, time_formatted=time_formatted)
+                    else:
+                        delay_message = KEY_EXPIRED_NO_DELAY_MSG.format(email=email)
 
-                    keyboard = build_notification_expired_kb()
                     messages.append({
                         "tg_id": tg_id,
-                        "text": KEY_DELETED_MSG.format(email=email),
+                        "text": delay_message,
                         "photo": "notify_expired.jpg",
                         "keyboard": keyboard,
                         "notification_id": notification_id,
                         "email": email,
                     })
-                except Exception as e:
-                    logger.error(f"Ошибка удаления ключа {client_id} для пользователя {tg_id}: {e}")
-                continue
-
-        if last_notification_time is None and any(u["tg_id"] == tg_id and u["email"] == email for u in users):
-            keyboard = build_notification_kb(email)
-
-            if NOTIFY_DELETE_DELAY > 0:
-                hours = NOTIFY_DELETE_DELAY // 60
-                minutes = NOTIFY_DELETE_DELAY % 60
-                if hours > 0 and minutes > 0:
-                    time_formatted = f"{format_hours(hours)} и {format_minutes(minutes)}"
-                elif hours > 0:
-                    time_formatted = format_hours(hours)
-                else:
-                    time_formatted = format_minutes(minutes)
 
-                delay_message = KEY_EXPIRED_DELAY_MSG.format(email=email, time_formatted=time_formatted)
-            else:
-                delay_message = KEY_EXPIRED_NO_DELAY_MSG.format(email=email)
-
-            messages.append({
-                "tg_id": tg_id,
-                "text": delay_message,
-                "photo": "notify_expired.jpg",
-                "keyboard": keyboard,
-                "notification_id": notification_id,
-                "email": email,
-            })
-
-    if messages:
-        results = await send_messages_with_limit(bot, messages, session=session)
-        sent_count = 0
-        for msg, result in zip(messages, results, strict=False):
-            await add_notification(session, msg["tg_id"], msg["notification_id"])
-            if result:
-                sent_count += 1
-                logger.info(f"📢 Уведомление об истекшем ключе {msg['email']} отправлено пользователю {msg['tg_id']}.")
-            else:
-                logger.warning(
-                    f"📢 Не удалось отправить уведомление об истекшем ключе {msg['email']} пользователю {msg['tg_id']}."
-                )
+            if messages:
+                results = await enqueue_notifications(session, messages, "key_expired")
+                for msg, result in zip(messages, results, strict=False):
+                    sent_notifications.append((msg["tg_id"], msg["notification_id"]))
+                    if result:
+                        sent_count += 1
+                        logger.info(
+                            f"📢 Уведомление об истекшем ключе {msg['email']} пользователю {msg['tg_id']} "
+                            "поставлено в очередь."
+                        )
+                    else:
+                        logger.warning(
+                            f"📢 Не удалось поставить в очередь уведомление об истекшем ключе {msg['email']} "
+                            f"пользователю {msg['tg_id']}."
+                        )
 
-        logger.info(f"Отправлено {sent_count} уведомлений об истекших ключах.")
+            await add_notifications_bulk(session, sent_notifications)
+            sent_notifications.clear()
+    finally:
+        await add_notifications_bulk(session, sent_notifications)
 
+    logger.info(f"Найдено {found_count} истекших ключей.")
+    logger.info(f"Поставлено в очередь {sent_count} уведомлений об истекших ключах.")
     logger.info("Обработка истекших ключей завершена.")
     await asyncio.sleep(1)
 
@@ -443,13 +514,21 @@ async def process_auto_renew_or_notify(
     renewal_period_months: int,
     standard_photo: str,
     standard_caption: str,
+    notification_times: dict[tuple[int, str], datetime],
+    sent_notifications: list[tuple[int, str]],
 ):
+    """
+    Продлевает подписку с баланса или уведомляет о невозможности продления.
+    Время прошлых уведомлений берётся из notification_times, загруженных стадией заранее,
+    а новые отметки добавляются в sent_notifications и записываются стадией через add_notifications_bulk.
+    Сообщения ставятся в outbox и попадают в очередь вместе с этими отметками.
+    """
     tg_id = key.tg_id
     email = key.email or ""
     renew_notification_id = f"{email}_renew"
 
     try:
-        can_renew = await check_notification_time(conn, tg_id, renew_notification_id, hours=24)
+        can_renew = can_notify_from(notification_times, tg_id, renew_notification_id, hours=24)
         if not can_renew:
             logger.debug(
                 f"⏳ Подписка {email} уже продлевалась в течение последних 24 часов, повторное продление отменено."
@@ -530,18 +609,21 @@ async def process_auto_renew_or_notify(
                     tariff_details=expiry_data["tariff_details"],
                 )
 
-            last_notification_time = await get_last_notification_time(conn, tg_id, notification_id)
-            if last_notification_time is not None:
+            if notification_times.get((tg_id, notification_id)) is not None:
                 return
-            
+
             if use_change_tariff_kb:
                 keyboard = build_change_tariff_kb(email)
             else:
                 keyboard = build_notification_kb(email)
 
-            await add_notification(conn, tg_id, notification_id)
+            sent_notifications.append((tg_id, notification_id))
             text_to_send = message_text if "message_text" in locals() else standard_caption
-            await send_notification(bot, tg_id, standard_photo, text_to_send, keyboard)
+            await enqueue_notifications(
+                conn,
+                [{"tg_id": tg_id, "text": text_to_send, "photo": standard_photo, "keyboard": keyboard}],
+                "key_expiry",
+            )
             return
 
         client_id = key.client_id
@@ -586,7 +668,7 @@ async def process_auto_renew_or_notify(
         await update_balance(conn, tg_id, -renewal_cost)
         await update_key_expiry(conn, client_id, int(new_expiry_time))
         await update_key_tariff(conn, client_id, selected_tariff["id"])
-        await add_notification(conn, tg_id, renew_notification_id)
+        sent_notifications.append((tg_id, renew_notification_id))
         await delete_notification(conn, tg_id, notification_id)
 
         renewed_message = get_renewal_message(
@@ -600,11 +682,17 @@ async def process_auto_renew_or_notify(
         )
 
         keyboard = build_notification_expired_kb()
-        result = await send_notification(bot, tg_id, "notify_expired.jpg", renewed_message, keyboard)
-        if result:
-            logger.info(f"✅ Уведомление о продлении подписки {email} отправлено пользователю {tg_id}.")
+        [queued] = await enqueue_notifications(
+            conn,
+            [{"tg_id": tg_id, "text": renewed_message, "photo": "notify_expired.jpg", "keyboard": keyboard}],
+            "auto_renew",
+        )
+        if queued:
+            logger.info(f"✅ Уведомление о продлении подписки {email} пользователю {tg_id} поставлено в очередь.")
         else:
-            logger.warning(f"📢 Не удалось отправить уведомление о продлении подписки {email} пользователю {tg_id}.")
+            logger.warning(
+                f"📢 Не удалось поставить в очередь уведомление о продлении подписки {email} пользователю {tg_id}."
+            )
 
     except Exception as e:
         logger.error(f"❌ Ошибка в process_auto_renew_or_notify: {e}")
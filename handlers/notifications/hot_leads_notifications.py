@@ -5,11 +5,16 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from config import DISCOUNT_ACTIVE_HOURS, HOT_LEAD_INTERVAL_HOURS
-from database import add_notification, check_notification_time, get_hot_leads
+from database import (
+    OUTBOX_PRIORITY_NOTIFICATION,
+    add_notification,
+    check_notification_time,
+    enqueue_outbox_message,
+    get_hot_leads,
+)
 from database.models import Notification
 from handlers.buttons import MAIN_MENU
 from handlers.notifications.notify_kb import build_hot_lead_kb
-from handlers.notifications.notify_utils import send_notification
 from handlers.texts import (
     HOT_LEAD_FINAL_MESSAGE,
     HOT_LEAD_LOST_OPPORTUNITY,
@@ -18,6 +23,18 @@ from handlers.texts import (
 from logger import logger
 
 
+async def _enqueue_hot_lead(session: AsyncSession, tg_id: int, text: str, keyboard) -> bool:
+    """Ставит сообщение горячему лиду в outbox; запись попадёт в очередь вместе с отметкой шага (add_notification)."""
+    return await enqueue_outbox_message(
+        session,
+        tg_id,
+        text,
+        priority=OUTBOX_PRIORITY_NOTIFICATION,
+        message_class="hot_lead",
+        keyboard=keyboard.model_dump(),
+    )
+
+
 async def notify_hot_leads(bot: Bot, session: AsyncSession):
     logger.info("Запуск уведомлений для горячих лидов.")
 
@@ -48,10 +65,10 @@ async def notify_hot_leads(bot: Bot, session: AsyncSession):
                     continue
 
                 keyboard = build_hot_lead_kb()
-                result = await send_notification(bot, tg_id, None, HOT_LEAD_MESSAGE, keyboard)
+                result = await _enqueue_hot_lead(session, tg_id, HOT_LEAD_MESSAGE, keyboard)
                 if result:
                     await add_notification(session, tg_id, "hot_lead_step_2")
-                    logger.info(f"Шаг 2 — отправлено первое уведомление: {tg_id}")
+                    logger.info(f"Шаг 2 — первое уведомление поставлено в очередь: {tg_id}")
                     notified += 1
                 continue
 
@@ -74,10 +91,10 @@ async def notify_hot_leads(bot: Bot, session: AsyncSession):
                     builder = InlineKeyboardBuilder()
                     builder.row(InlineKeyboardButton(text=MAIN_MENU, callback_data="profile"))
 
-                    result = await send_notification(bot, tg_id, None, HOT_LEAD_LOST_OPPORTUNITY, builder.as_markup())
+                    result = await _enqueue_hot_lead(session, tg_id, HOT_LEAD_LOST_OPPORTUNITY, builder.as_markup())
                     if result:
                         await add_notification(session, tg_id, "hot_lead_step_2_expired")
-                        logger.info(f"📭 Скидка упущена — отправлено уведомление: {tg_id}")
+                        logger.info(f"📭 Скидка упущена — уведомление поставлено в очередь: {tg_id}")
                     continue
 
             if not has_step_3:
@@ -91,13 +108,13 @@ async def notify_hot_leads(bot: Bot, session: AsyncSession):
                     continue
 
                 keyboard = build_hot_lead_kb(final=True)
-                result = await send_notification(bot, tg_id, None, HOT_LEAD_FINAL_MESSAGE, keyboard)
+                result = await _enqueue_hot_lead(session, tg_id, HOT_LEAD_FINAL_MESSAGE, keyboard)
                 if result:
                     await add_notification(session, tg_id, "hot_lead_step_3")
-                    logger.info(f"⚡ Шаг 3 — отправлено финальное уведомление: {tg_id}")
+                    logger.info(f"⚡ Шаг 3 — финальное уведомление поставлено в очередь: {tg_id}")
                     notified += 1
 
-        logger.info(f"Уведомления завершены. Отправлено: {notified}")
+        logger.info(f"Уведомления завершены. Поставлено в очередь: {notified}")
 
     except Exception as e:
         logger.error(f"❌ Ошибка в notify_hot_leads: {e}")
@@ -1,5 +1,6 @@
 import asyncio
 import os
+import time
 
 from datetime import datetime
 
@@ -7,160 +8,166 @@ import aiofiles
 import pytz
 
 from aiogram import Bot
-from aiogram.exceptions import (
-    TelegramBadRequest,
-    TelegramForbiddenError,
-    TelegramRetryAfter,
-)
-from aiogram.types import BufferedInputFile, InlineKeyboardMarkup
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import BufferedInputFile
+from cachetools import TTLCache
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from database import create_blocked_user, get_tariff_by_id
-from handlers.utils import format_hours
+from database import OUTBOX_PRIORITY_NOTIFICATION, enqueue_outbox_message, get_blocked_user_ids, get_tariff_by_id
+from handlers.utils import (
+    extract_media_file_id,
+    forget_cached_media_id,
+    format_hours,
+    get_cached_media_id,
+    is_bad_file_id_error,
+    remember_media_id,
+)
 from logger import logger
 
 
-async def send_messages_with_limit(
-    bot: Bot,
-    messages: list[dict],
-    session: AsyncSession = None,
-    source_file: str = None,
-    messages_per_second: int = 25,
-):
+GLOBAL_MESSAGES_PER_SECOND = 28
+PER_CHAT_INTERVAL = 1.0
+
+
+class TokenBucket:
+    """Токен-бакет: не больше rate операций в секунду с допустимым всплеском capacity."""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+_global_bucket = TokenBucket(GLOBAL_MESSAGES_PER_SECOND)
+_chat_next_slot: TTLCache = TTLCache(maxsize=100_000, ttl=60)
+
+
+_priority_demand = 0
+_bulk_allowed = asyncio.Event()
+_bulk_allowed.set()
+
+
+def hold_bulk_traffic(count: int = 1):
+    """Сообщает, что count приоритетных сообщений ждут отправки: массовые отправители уступают им слот."""
+    global _priority_demand
+    _priority_demand += count
+    if _priority_demand:
+        _bulk_allowed.clear()
+
+
+def release_bulk_traffic(count: int = 1):
+    global _priority_demand
+    _priority_demand = max(_priority_demand - count, 0)
+    if not _priority_demand:
+        _bulk_allowed.set()
+
+
+async def acquire_global_send_slot(bulk: bool = False):
     """
-    Отправляет сообщения с ограничением по количеству сообщений в секунду.
-    Возвращает список результатов отправки (True для успеха, False для ошибки).
+    Общий для процесса лимит GLOBAL_MESSAGES_PER_SECOND: его соблюдают outbox и рассылки.
+    Массовые отправки (bulk=True) ждут, пока есть приоритетные сообщения.
     """
-    batch_size = messages_per_second
-    results = []
-
-    for i in range(0, len(messages), batch_size):
-        batch = messages[i : i + batch_size]
-        tasks = [
-            send_notification(bot, msg["tg_id"], msg.get("photo"), msg["text"], msg.get("keyboard")) for msg in batch
-        ]
-        batch_results = await asyncio.gather(*tasks, return_exceptions=True)
-
-        for msg, result in zip(batch, batch_results, strict=False):
-            tg_id = msg["tg_id"]
-
-            if isinstance(result, bool) and result:
-                results.append(True)
-            elif isinstance(result, TelegramForbiddenError):
-                logger.warning(f"🚫 Бот заблокирован пользователем {tg_id}.")
-                await try_add_blocked_user(tg_id, session, source_file)
-                results.append(False)
-            elif isinstance(result, TelegramBadRequest) and "chat not found" in str(result).lower():
-                logger.warning(f"🚫 Чат не найден для пользователя {tg_id}.")
-                await try_add_blocked_user(tg_id, session, source_file)
-                results.append(False)
-            else:
-                logger.warning(f"📩 Не удалось отправить уведомление пользователю {tg_id}.")
-                await try_add_blocked_user(tg_id, session, source_file)
-                results.append(False)
-
-        await asyncio.sleep(1.0)
+    if bulk:
+        while _priority_demand:
+            await _bulk_allowed.wait()
+    await _global_bucket.acquire()
 
-    return results
+
+async def wait_chat_slot(chat_id: int):
+    """Выдерживает интервал PER_CHAT_INTERVAL между сообщениями в один чат."""
+    now = time.monotonic()
+    slot = max(now, _chat_next_slot.get(chat_id, 0.0))
+    _chat_next_slot[chat_id] = slot + PER_CHAT_INTERVAL
+    if slot > now:
+        await asyncio.sleep(slot - now)
 
 
-async def try_add_blocked_user(tg_id: int, session: AsyncSession, source_file: str | None):
+async def enqueue_notifications(
+    session: AsyncSession,
+    messages: list[dict],
+    message_class: str,
+    priority: int = OUTBOX_PRIORITY_NOTIFICATION,
+    skip_blocked: bool = False,
+) -> list[bool]:
     """
-    Добавляет пользователя в список заблокировавших бота, если требуется.
+    Ставит уведомления в outbox в транзакции вызывающего: сообщения уйдут в очередь вместе с его коммитом
+    (например, с отметками add_notifications_bulk), доставляет их диспетчер outbox с общими лимитами отправки.
+    messages — словари с tg_id, text и необязательными photo (имя файла из img/) и keyboard.
+    При skip_blocked пользователи из blocked_users пропускаются.
+    Возвращает для каждого сообщения, поставлено ли оно в очередь.
     """
-    if source_file == "special_notifications" and session:
-        try:
-            await create_blocked_user(session, tg_id)
-            logger.info(f"Пользователь {tg_id} добавлен в blocked_users.")
-        except Exception as e:
-            logger.warning(f"Не удалось добавить {tg_id} в blocked_users: {e}")
-
-
-def rate_limited_send(func):
-    async def wrapper(*args, **kwargs):
-        while True:
-            try:
-                return await func(*args, **kwargs)
-            except TelegramRetryAfter as e:
-                retry_in = int(e.retry_after) + 1
-                logger.warning(f"⚠️ Flood control: повтор через {retry_in} сек.")
-                await asyncio.sleep(retry_in)
-            except TelegramForbiddenError:
-                tg_id = kwargs.get("tg_id") or args[1]
-                logger.warning(f"🚫 Бот заблокирован пользователем {tg_id}.")
-                return False
-            except TelegramBadRequest:
-                tg_id = kwargs.get("tg_id") or args[1]
-                logger.warning(f"🚫 Чат не найден для пользователя {tg_id}.")
-                return False
-            except Exception as e:
-                tg_id = kwargs.get("tg_id") or args[1]
-                logger.error(f"❌ Ошибка отправки сообщения пользователю {tg_id}: {e}")
-                return False
-
-    return wrapper
-
-
-async def send_notification(
+    if not messages:
+        return []
+
+    blocked_ids = await get_blocked_user_ids(session) if skip_blocked else frozenset()
+    results: list[bool] = []
+    for msg in messages:
+        if msg["tg_id"] in blocked_ids:
+            results.append(False)
+            continue
+        keyboard = msg.get("keyboard")
+        results.append(
+            await enqueue_outbox_message(
+                session,
+                msg["tg_id"],
+                msg["text"],
+                priority=priority,
+                message_class=message_class,
+                photo=msg.get("photo"),
+                keyboard=keyboard.model_dump() if keyboard else None,
+            )
+        )
+    return results
+
+
+async def send_notification_photo(
     bot: Bot,
     tg_id: int,
-    image_filename: str | None,
+    image_filename: str,
     caption: str,
-    keyboard: InlineKeyboardMarkup | None = None,
-) -> bool:
+    **kwargs,
+):
     """
-    Отправляет уведомление пользователю.
+    Отправляет картинку из img/ с подписью. Файл загружается один раз, дальше отправляется по file_id.
+    Без файла отправляется только текст. Ошибки Telegram пробрасываются вызывающему.
     """
-    if image_filename is None:
-        return await _send_text_notification(bot, tg_id, caption, keyboard)
-
     photo_path = os.path.join("img", image_filename)
-    if os.path.isfile(photo_path):
-        return await _send_photo_notification(bot, tg_id, photo_path, image_filename, caption, keyboard)
-    else:
+    if not os.path.isfile(photo_path):
         logger.warning(f"Файл с изображением не найден: {photo_path}")
-        return await _send_text_notification(bot, tg_id, caption, keyboard)
+        await bot.send_message(tg_id, caption, **kwargs)
+        return
 
-
-@rate_limited_send
-async def _send_photo_notification(
-    bot: Bot,
-    tg_id: int,
-    photo_path: str,
-    image_filename: str,
-    caption: str,
-    keyboard: InlineKeyboardMarkup | None = None,
-) -> bool:
-    """Отправляет уведомление с изображением."""
-    try:
-        async with aiofiles.open(photo_path, "rb") as image_file:
-            image_data = await image_file.read()
-        buffered_photo = BufferedInputFile(image_data, filename=image_filename)
-        await bot.send_photo(tg_id, buffered_photo, caption=caption, reply_markup=keyboard)
-        return True
-    except (TelegramForbiddenError, TelegramBadRequest):
-        return False
-    except Exception as e:
-        logger.error(f"Ошибка отправки фото для пользователя {tg_id}: {e}")
-        return await _send_text_notification(bot, tg_id, caption, keyboard)
-
-
-@rate_limited_send
-async def _send_text_notification(
-    bot: Bot,
-    tg_id: int,
-    caption: str,
-    keyboard: InlineKeyboardMarkup | None = None,
-) -> bool:
-    """Отправляет текстовое уведомление."""
-    try:
-        await bot.send_message(tg_id, caption, reply_markup=keyboard)
-        return True
-    except (TelegramForbiddenError, TelegramBadRequest):
-        return False
-    except Exception as e:
-        logger.error(f"Неизвестная ошибка при отправке сообщения для пользователя {tg_id}: {e}")
-        return False
+    cached_id = await get_cached_media_id(photo_path)
+    if cached_id:
+        try:
+            await bot.send_photo(tg_id, cached_id, caption=caption, **kwargs)
+            return
+        except TelegramBadRequest as e:
+            if not is_bad_file_id_error(e):
+                raise
+            logger.warning(f"[Media] file_id для {photo_path} больше не принимается, загружаем заново")
+            await forget_cached_media_id(photo_path)
+
+    async with aiofiles.open(photo_path, "rb") as image_file:
+        image_data = await image_file.read()
+    buffered_photo = BufferedInputFile(image_data, filename=image_filename)
+    message = await bot.send_photo(tg_id, buffered_photo, caption=caption, **kwargs)
+    file_id = extract_media_file_id(message)
+    if file_id:
+        await remember_media_id(photo_path, file_id, "photo")
 
 
 async def prepare_key_expiry_data(key, session: AsyncSession, current_time: int) -> dict:
@@ -0,0 +1,164 @@
+import asyncio
+import time
+
+from datetime import datetime, timedelta
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from aiogram.types import InlineKeyboardMarkup
+
+from bot import bot
+from database import (
+    OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_PRIORITY_BULK,
+    async_session_maker,
+    claim_outbox_messages,
+    flush_blocked_users,
+    get_outbox_latency_stats,
+    mark_outbox_failed,
+    mark_outbox_sent,
+    mark_user_blocked,
+    purge_outbox,
+    reset_stale_outbox_messages,
+)
+from database.models import OutboxMessage
+from logger import logger
+from utils.update_sharding import is_primary_worker
+
+from .notify_utils import (
+    acquire_global_send_slot,
+    hold_bulk_traffic,
+    release_bulk_traffic,
+    send_notification_photo,
+    wait_chat_slot,
+)
+
+
+OUTBOX_BATCH_SIZE = 50
+OUTBOX_WORKERS = 10
+OUTBOX_POLL_INTERVAL = 1.0
+OUTBOX_RETRY_DELAY = 30
+OUTBOX_STATS_INTERVAL = 600
+OUTBOX_RETENTION = timedelta(days=7)
+
+_dispatcher_task: asyncio.Task | None = None
+
+
+async def _deliver(message: OutboxMessage):
+    """Отправляет сообщение; photo — имя картинки из img/, она уходит по закэшированному file_id."""
+    kwargs = {}
+    if message.keyboard:
+        kwargs["reply_markup"] = InlineKeyboardMarkup.model_validate(message.keyboard)
+    if message.parse_mode:
+        kwargs["parse_mode"] = message.parse_mode
+    if message.photo:
+        await send_notification_photo(bot, message.chat_id, message.photo, message.text, **kwargs)
+    else:
+        await bot.send_message(message.chat_id, message.text, **kwargs)
+
+
+async def _dispatch_batch(messages: list[OutboxMessage]):
+    """Отправляет пачку в порядке приоритета; на время отправки приоритетных сообщений массовые рассылки ждут."""
+    priority_count = sum(1 for message in messages if message.priority < OUTBOX_PRIORITY_BULK)
+    hold_bulk_traffic(priority_count)
+
+    queue: asyncio.Queue[OutboxMessage] = asyncio.Queue()
+    for message in messages:
+        queue.put_nowait(message)
+
+    sent_ids: list[int] = []
+    failures: list[tuple[int, str, float | None]] = []
+    released = 0
+
+    async def worker():
+        nonlocal released
+        while not queue.empty():
+            message = queue.get_nowait()
+            try:
+                await wait_chat_slot(message.chat_id)
+                await acquire_global_send_slot(bulk=message.priority >= OUTBOX_PRIORITY_BULK)
+                await _deliver(message)
+                sent_ids.append(message.id)
+            except TelegramRetryAfter as e:
+                failures.append((message.id, str(e), int(e.retry_after) + 1))
+            except TelegramForbiddenError as e:
+                failures.append((message.id, str(e), None))
+                mark_user_blocked(message.chat_id)
+            except TelegramBadRequest as e:
+                failures.append((message.id, str(e), None))
+            except Exception as e:
+                retry_in = OUTBOX_RETRY_DELAY if message.attempts < OUTBOX_MAX_ATTEMPTS else None
+                failures.append((message.id, str(e), retry_in))
+                logger.error(f"[Outbox] Ошибка отправки сообщения #{message.id} в чат {message.chat_id}: {e}")
+            finally:
+                if message.priority < OUTBOX_PRIORITY_BULK:
+                    released += 1
+                    release_bulk_traffic()
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(min(OUTBOX_WORKERS, len(messages)))))
+    finally:
+        release_bulk_traffic(priority_count - released)
+        async with async_session_maker() as session:
+            await mark_outbox_sent(session, sent_ids)
+            for message_id, error, retry_in in failures:
+                await mark_outbox_failed(session, message_id, error, retry_in)
+            await flush_blocked_users(session)
+
+
+async def _log_outbox_stats():
+    async with async_session_maker() as session:
+        stats = await get_outbox_latency_stats(session, datetime.utcnow() - timedelta(seconds=OUTBOX_STATS_INTERVAL))
+        purged = await purge_outbox(session, datetime.utcnow() - OUTBOX_RETENTION)
+    for row in stats:
+        logger.info(
+            f"[Outbox] {row['message_class']}: отправлено {row['sent']}, в очереди {row['pending']}, "
+            f"задержка ср. {row['avg_latency']:.1f} с, макс. {row['max_latency']:.1f} с"
+        )
+    if purged:
+        logger.info(f"[Outbox] Удалено старых записей: {purged}")
+
+
+async def run_outbox_dispatcher():
+    """Единственный цикл доставки сообщений из outbox_messages."""
+    async with async_session_maker() as session:
+        restored = await reset_stale_outbox_messages(session)
+    if restored:
+        logger.warning(f"[Outbox] Возвращено в очередь зависших сообщений: {restored}")
+
+    last_stats = time.monotonic()
+    while True:
+        try:
+            async with async_session_maker() as session:
+                messages = await claim_outbox_messages(session, OUTBOX_BATCH_SIZE)
+            if messages:
+                await _dispatch_batch(messages)
+            else:
+                await asyncio.sleep(OUTBOX_POLL_INTERVAL)
+
+            if time.monotonic() - last_stats >= OUTBOX_STATS_INTERVAL:
+                last_stats = time.monotonic()
+                await _log_outbox_stats()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"[Outbox] Ошибка диспетчера: {e}")
+            await asyncio.sleep(OUTBOX_POLL_INTERVAL)
+
+
+async def start_outbox_dispatcher():
+    global _dispatcher_task
+    if not is_primary_worker():
+        return
+    if _dispatcher_task and not _dispatcher_task.done():
+        return
+    _dispatcher_task = asyncio.create_task(run_outbox_dispatcher())
+    logger.info("[Outbox] Диспетчер запущен")
+
+
+async def stop_outbox_dispatcher():
+    global _dispatcher_task
+    if not _dispatcher_task:
+        return
+    _dispatcher_task.cancel()
+    await asyncio.gather(_dispatcher_task, return_exceptions=True)
+    _dispatcher_task = None
@@ -5,12 +5,11 @@ from typing import Any
 from aiogram import F, Router
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
-from aiogram.types import CallbackQuery, InlineKeyboardButton, Message
+from aiogram.types import CallbackQuery, ChatMemberUpdated, InlineKeyboardButton, Message
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from bot import bot
 from config import (
     CAPTCHA_ENABLE,
     CHANNEL_EXISTS,
@@ -54,6 +53,7 @@ from handlers.texts import (
 from hooks.hook_buttons import insert_hook_buttons
 from hooks.hooks import run_hooks
 from logger import logger
+from utils.channel_membership import check_channel_membership, is_member_status, remember_channel_membership
 
 from .admin.panel.keyboard import AdminPanelCallback
 from .refferal import handle_referral_link
@@ -84,8 +84,7 @@ async def start_entry(
 async def check_subscription_callback(callback: CallbackQuery, state: FSMContext, session: Any, admin: bool):
     user_id = callback.from_user.id
     try:
-        member = await bot.get_chat_member(CHANNEL_ID, user_id)
-        if member.status not in ["member", "administrator", "creator"]:
+        if not await check_channel_membership(user_id, force=True):
             await prompt_subscription(callback)
             return
         await callback.answer(SUBSCRIPTION_CONFIRMED_MSG)
@@ -99,6 +98,12 @@ async def check_subscription_callback(callback: CallbackQuery, state: FSMContext
         await callback.answer(SUBSCRIPTION_CHECK_ERROR_MSG, show_alert=True)
 
 
+@router.chat_member(F.chat.id == CHANNEL_ID)
+async def channel_member_updated(event: ChatMemberUpdated):
+    """Вступление и выход из канала сразу обновляют кэш подписки, без запросов к Telegram."""
+    await remember_channel_membership(event.new_chat_member.user.id, is_member_status(event.new_chat_member))
+
+
 async def process_start_logic(
     message: Message,
     state: FSMContext,
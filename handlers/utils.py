@@ -10,6 +10,7 @@ from datetime import datetime, timedelta
 
 import aiofiles
 
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import (
     BufferedInputFile,
     InlineKeyboardMarkup,
@@ -18,12 +19,21 @@ from aiogram.types import (
     InputMediaVideo,
     Message,
 )
-from sqlalchemy import func, select
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from bot import bot
 from config import ADMIN_ID
-from database import get_servers
+from database import (
+    OUTBOX_PRIORITY_ALERT,
+    async_session_maker,
+    enqueue_outbox_message,
+    forget_media_file_id,
+    get_key_counts,
+    get_media_file_id,
+    get_server_topology,
+    save_media_file_id,
+)
 from database.models import Key, Notification, Server
 from hooks.hooks import run_hooks
 from logger import logger
@@ -49,7 +59,7 @@ async def generate_random_email(
 
 
 async def get_least_loaded_cluster(session: AsyncSession) -> str:
-    servers = await get_servers(session)
+    servers = (await get_server_topology(session))["by_cluster_enabled"]
     server_to_cluster = {}
     cluster_loads = {}
 
@@ -58,14 +68,12 @@ async def get_least_loaded_cluster(session: AsyncSession) -> str:
         for server in cluster_servers:
             server_to_cluster[server["server_name"]] = cluster_name
 
-    result = await session.execute(select(Key))
-    keys = result.scalars().all()
+    key_counts = await get_key_counts(session)
 
-    for key in keys:
-        server_id = key.server_id
+    for server_id, count in key_counts.items():
         cluster_id = server_to_cluster.get(server_id, server_id)
         if cluster_id in cluster_loads:
-            cluster_loads[cluster_id] += 1
+            cluster_loads[cluster_id] += count
 
     available_clusters = {}
     for cluster_name, cluster_servers in servers.items():
@@ -109,8 +117,8 @@ async def check_server_key_limit(server_info: dict, session: AsyncSession) -> bo
 
     identifier = cluster_name if cluster_name else server_name
 
-    result = await session.execute(select(func.count()).select_from(Key).where(Key.server_id == identifier))
-    total_keys = result.scalar() or 0
+    key_counts = await get_key_counts(session)
+    total_keys = key_counts.get(identifier, 0)
 
     if total_keys >= max_keys:
         logger.warning(f"[Key Limit] Сервер {server_name} достиг лимита: {total_keys}/{max_keys}")
@@ -128,14 +136,15 @@ async def check_server_key_limit(server_info: dict, session: AsyncSession) -> bo
 
         if not already_sent:
             for admin_id in ADMIN_ID:
-                try:
-                    await bot.send_message(
-                        admin_id,
-                        f"⚠️ Сервер <b>{server_name}</b> почти заполнен ({int(usage_percent * 100)}%)."
-                        f"\nРекомендуется создать новый для балансировки.",
-                    )
-                except Exception:
-                    pass
+                await enqueue_outbox_message(
+                    session,
+                    admin_id,
+                    f"⚠️ Сервер <b>{server_name}</b> почти заполнен ({int(usage_percent * 100)}%)."
+                    f"\nРекомендуется создать новый для балансировки.",
+                    priority=OUTBOX_PRIORITY_ALERT,
+                    message_class="server_alert",
+                    dedup_key=f"{notif_key}:{admin_id}",
+                )
 
             session.add(Notification(tg_id=0, notification_type=notif_key))
             await session.commit()
@@ -216,6 +225,64 @@ def get_media_type(media_path: str) -> str:
     return "photo"
 
 
+def get_media_mtime_ns(media_path: str) -> int | None:
+    try:
+        return os.stat(media_path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def extract_media_file_id(msg) -> str | None:
+    """Достаёт file_id медиа из отправленного сообщения."""
+    if getattr(msg, "photo", None):
+        return msg.photo[-1].file_id
+    if getattr(msg, "video", None):
+        return msg.video.file_id
+    if getattr(msg, "animation", None):
+        return msg.animation.file_id
+    return None
+
+
+async def get_cached_media_id(media_path: str) -> str | None:
+    """file_id из реестра media_files, если файл не менялся с момента загрузки."""
+    mtime_ns = get_media_mtime_ns(media_path)
+    if mtime_ns is None:
+        return None
+    try:
+        async with async_session_maker() as session:
+            return await get_media_file_id(session, media_path, mtime_ns)
+    except Exception as e:
+        logger.warning(f"[Media] Не удалось получить file_id для {media_path}: {e}")
+        return None
+
+
+async def remember_media_id(media_path: str, file_id: str, media_type: str):
+    mtime_ns = get_media_mtime_ns(media_path)
+    if mtime_ns is None:
+        return
+    try:
+        async with async_session_maker() as session:
+            await save_media_file_id(session, media_path, mtime_ns, file_id, media_type)
+    except Exception as e:
+        logger.warning(f"[Media] Не удалось сохранить file_id для {media_path}: {e}")
+
+
+def is_bad_file_id_error(error: Exception) -> bool:
+    """Telegram отклонил сохранённый file_id — только тогда его нужно забыть и загрузить файл заново."""
+    if not isinstance(error, TelegramBadRequest):
+        return False
+    text = str(error).lower()
+    return "file identifier" in text or "file_id" in text
+
+
+async def forget_cached_media_id(media_path: str):
+    try:
+        async with async_session_maker() as session:
+            await forget_media_file_id(session, media_path)
+    except Exception as e:
+        logger.warning(f"[Media] Не удалось удалить file_id для {media_path}: {e}")
+
+
 async def edit_or_send_message(
     target_message: Message,
     text: str,
@@ -225,15 +292,6 @@ async def edit_or_send_message(
     force_text: bool = False,
     disable_cache: bool = False,
 ):
-    if not hasattr(edit_or_send_message, "cache"):
-        import asyncio
-
-        from collections import OrderedDict
-
-        edit_or_send_message.cache = OrderedDict()
-        edit_or_send_message.lock = asyncio.Lock()
-        edit_or_send_message.max = 256
-
     def find_media_file(original_path: str) -> str | None:
         if not original_path:
             return None
@@ -258,10 +316,7 @@ async def edit_or_send_message(
 
             cached_id = None
             if not disable_cache:
-                async with edit_or_send_message.lock:
-                    cached_id = edit_or_send_message.cache.get(actual_media_path)
-                    if cached_id:
-                        edit_or_send_message.cache.move_to_end(actual_media_path)
+                cached_id = await get_cached_media_id(actual_media_path)
 
             if cached_id:
                 try:
@@ -302,8 +357,10 @@ async def edit_or_send_message(
                                 disable_web_page_preview=disable_web_page_preview,
                             )
                         return
-                    except Exception:
-                        pass
+                    except Exception as e:
+                        if not is_bad_file_id_error(e):
+                            raise
+                        await forget_cached_media_id(actual_media_path)
 
             async with aiofiles.open(actual_media_path, "rb") as f:
                 data = await f.read()
@@ -345,20 +402,9 @@ async def edit_or_send_message(
                         disable_web_page_preview=disable_web_page_preview,
                     )
 
-            file_id = None
-            if hasattr(msg, "photo") and msg.photo:
-                file_id = msg.photo[-1].file_id
-            elif hasattr(msg, "video") and msg.video:
-                file_id = msg.video.file_id
-            elif hasattr(msg, "animation") and msg.animation:
-                file_id = msg.animation.file_id
-
+            file_id = extract_media_file_id(msg)
             if file_id and not disable_cache:
-                async with edit_or_send_message.lock:
-                    if actual_media_path not in edit_or_send_message.cache:
-                        edit_or_send_message.cache[actual_media_path] = file_id
-                        if len(edit_or_send_message.cache) > edit_or_send_message.max:
-                            edit_or_send_message.cache.popitem(last=False)
+                await remember_media_id(actual_media_path, file_id, media_type)
             return
 
     if not force_text and target_message.caption is not None:
@@ -39,6 +39,10 @@ def unregister_module_hooks(module_name: str):
             _hooks.pop(k, None)
 
 
+def has_hooks(name: str) -> bool:
+    return bool(_hooks.get(name))
+
+
 async def run_hooks(name: str, require_enabled: bool = True, **kwargs) -> list[Any]:
     results: list[Any] = []
     for func, owner in _hooks.get(name, []):
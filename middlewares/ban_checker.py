@@ -11,11 +11,21 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from config import SUPPORT_CHAT_URL
 from database.models import ManualBan
 from logger import logger
+from utils.shared_storage import get_shared_cache
 
 
 TZ = timezone("Europe/Moscow")
 _BAN_CACHE_TTL = 30
-_ban_cache: dict[int, tuple[float, dict | None]] = {}
+_BAN_CACHE_MAXSIZE = 50_000
+_ban_cache = get_shared_cache("ban", _BAN_CACHE_MAXSIZE)
+
+
+async def invalidate_ban_cache(*tg_ids: int):
+    """Сбрасывает закэшированный статус бана указанных пользователей, без аргументов — всех."""
+    if tg_ids:
+        await _ban_cache.delete(*(str(tg_id) for tg_id in tg_ids))
+    else:
+        await _ban_cache.clear()
 
 
 class BanCheckerMiddleware(BaseMiddleware):
@@ -45,10 +55,9 @@ class BanCheckerMiddleware(BaseMiddleware):
         if tg_id is None:
             return await handler(event, data)
 
-        now_ts = datetime.utcnow().timestamp()
-        cached = _ban_cache.get(tg_id)
-        if cached and cached[0] > now_ts:
-            ban_info = cached[1]
+        cached = await _ban_cache.get(str(tg_id))
+        if cached is not None:
+            ban_info = cached.get("ban")
         else:
             session: AsyncSession | None = (
                 data.get("session") if isinstance(data.get("session"), AsyncSession) else None
@@ -76,7 +85,7 @@ class BanCheckerMiddleware(BaseMiddleware):
             finally:
                 if created_here:
                     await session.close()
-            _ban_cache[tg_id] = (now_ts + _BAN_CACHE_TTL, ban_info)
+            await _ban_cache.set(str(tg_id), {"ban": ban_info}, _BAN_CACHE_TTL)
 
         if not ban_info:
             return await handler(event, data)
@@ -8,12 +8,12 @@ from aiogram.fsm.context import FSMContext
 from aiogram.types import InlineKeyboardButton, Message, Update
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-from bot import bot
-from config import CHANNEL_EXISTS, CHANNEL_ID, CHANNEL_REQUIRED, CHANNEL_URL
+from config import CHANNEL_EXISTS, CHANNEL_REQUIRED, CHANNEL_URL
 from handlers.buttons import SUB_CHANELL, SUB_CHANELL_DONE
 from handlers.texts import SUBSCRIPTION_REQUIRED_MSG
 from handlers.utils import edit_or_send_message
 from logger import logger
+from utils.channel_membership import check_channel_membership
 
 
 class SubscriptionMiddleware(BaseMiddleware):
@@ -48,6 +48,8 @@ class SubscriptionMiddleware(BaseMiddleware):
                 return await handler(event, data)
             if event.callback_query.from_user.is_bot:
                 return await handler(event, data)
+            if event.callback_query.data == "check_subscription":
+                return await handler(event, data)
 
             tg_id = event.callback_query.from_user.id
             message = event.callback_query.message
@@ -56,8 +58,7 @@ class SubscriptionMiddleware(BaseMiddleware):
             return await handler(event, data)
 
         try:
-            member = await bot.get_chat_member(CHANNEL_ID, tg_id)
-            if member.status not in ("member", "administrator", "creator"):
+            if not await check_channel_membership(tg_id):
                 logger.info(f"[SubMiddleware] Пользователь {tg_id} не подписан")
                 await self._store_user_state(data, message, from_user)
                 return await self._ask_to_subscribe(message)
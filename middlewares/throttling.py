@@ -1,23 +1,23 @@
 from aiogram import BaseMiddleware, Bot
 from aiogram.types import CallbackQuery
-from cachetools import TTLCache
+
+from utils.shared_storage import get_shared_cache
 
 
 class ThrottlingMiddleware(BaseMiddleware):
     def __init__(self) -> None:
-        self.cache = TTLCache(maxsize=10_000, ttl=1.0)
-        self.throttle_notice_cache = TTLCache(maxsize=10_000, ttl=1.0)
+        self.cache = get_shared_cache("throttle")
+        self.throttle_notice_cache = get_shared_cache("throttle_notice")
 
     async def __call__(self, handler, event, data):
         user_id = event.from_user.id if event.from_user else None
         if user_id is None:
             return await handler(event, data)
 
-        current_count = self.cache.get(user_id, 0)
+        current_count = await self.cache.incr(str(user_id), 1.0)
 
-        if current_count >= 3:
-            if isinstance(event, CallbackQuery) and user_id not in self.throttle_notice_cache:
-                self.throttle_notice_cache[user_id] = None
+        if current_count > 3:
+            if isinstance(event, CallbackQuery) and await self.throttle_notice_cache.incr(str(user_id), 1.0) == 1:
                 bot: Bot = data["bot"]
                 await bot.answer_callback_query(
                     callback_query_id=event.id,
@@ -25,7 +25,5 @@ class ThrottlingMiddleware(BaseMiddleware):
                     show_alert=False,
                 )
             return None
-        else:
-            self.cache[user_id] = current_count + 1
 
         return await handler(event, data)
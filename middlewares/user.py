@@ -1,5 +1,4 @@
 from collections.abc import Awaitable, Callable
-from time import monotonic
 from typing import Any
 
 from aiogram import BaseMiddleware
@@ -7,12 +6,22 @@ from aiogram.types import TelegramObject, User
 
 from database import upsert_user
 from logger import logger
+from utils.shared_storage import get_shared_cache
+
+
+USER_CACHE_MAXSIZE = 50_000
+
+
+async def invalidate_user_cache(*tg_ids: int):
+    """Сбрасывает закэшированные данные пользователей, чтобы следующее обновление перечитало их из БД."""
+    if tg_ids:
+        await get_shared_cache("user", USER_CACHE_MAXSIZE).delete(*(str(tg_id) for tg_id in tg_ids))
 
 
 class UserMiddleware(BaseMiddleware):
     def __init__(self, debounce_sec: float = 60.0) -> None:
         self._debounce = float(debounce_sec)
-        self._cache: dict[int, tuple[str, float, dict | None]] = {}
+        self._cache = get_shared_cache("user", USER_CACHE_MAXSIZE)
 
     async def __call__(
         self,
@@ -34,12 +43,11 @@ class UserMiddleware(BaseMiddleware):
     async def _process_user(self, user: User, session: Any = None) -> dict | None:
         uid = user.id
         fp = self._fingerprint(user)
-        now = monotonic()
 
-        cached = self._cache.get(uid)
+        cached = await self._cache.get(str(uid))
         if cached:
-            cached_fp, ts, cached_db_user = cached
-            if fp == cached_fp and now - ts < self._debounce:
+            cached_fp, cached_db_user = cached
+            if fp == cached_fp:
                 return cached_db_user
 
         logger.debug(f"Обработка пользователя: {uid}")
@@ -53,7 +61,9 @@ class UserMiddleware(BaseMiddleware):
             session=session,
             only_if_exists=True,
         )
-        self._cache[uid] = (fp, now, db_user)
+        if db_user:
+            db_user = {key: value for key, value in db_user.items() if not key.startswith("_")}
+        await self._cache.set(str(uid), [fp, db_user], self._debounce)
         if db_user:
             logger.debug(f"Получены данные пользователя из БД: {uid}")
         return db_user
@@ -1,3 +1,4 @@
+import asyncio
 import time
 
 from dataclasses import dataclass
@@ -31,6 +32,12 @@ class ClientConfig:
 _xui_instance_cache: dict[str, tuple[AsyncApi, float]] = {}
 SESSION_TTL = 1800
 
+_inbound_snapshots: dict[tuple[str, int], tuple[dict, float]] = {}
+INBOUND_SNAPSHOT_TTL = 30
+INBOUND_MISS_REFRESH_INTERVAL = 5
+BULK_CHUNK_SIZE = 500
+BULK_UPDATE_CONCURRENCY = 10
+
 
 async def get_xui_instance(api_url: str) -> AsyncApi:
     key = f"{api_url}|{ADMIN_USERNAME}"
@@ -59,6 +66,94 @@ async def get_xui_instance(api_url: str) -> AsyncApi:
     return xui
 
 
+def _xui_host(xui: AsyncApi) -> str:
+    return getattr(xui.client, "host", None) or str(id(xui))
+
+
+def invalidate_inbound_snapshot(xui: AsyncApi, inbound_id: int):
+    _inbound_snapshots.pop((_xui_host(xui), int(inbound_id)), None)
+
+
+def _drop_snapshot_client(snapshot: dict, email: str | None = None, client_id: str | None = None):
+    by_email = snapshot["by_email"].pop(email, None) if email else None
+    by_id = snapshot["by_id"].pop(str(client_id), None) if client_id else None
+    if by_email is not None and by_email.id:
+        snapshot["by_id"].pop(str(by_email.id), None)
+    if by_id is not None and by_id.email:
+        snapshot["by_email"].pop(by_id.email, None)
+
+
+def store_snapshot_client(xui: AsyncApi, inbound_id: int, client: py3xui.Client):
+    """Записывает клиента в кэшированный снимок после успешной записи в панель, не скачивая inbound заново."""
+    entry = _inbound_snapshots.get((_xui_host(xui), int(inbound_id)))
+    if not entry:
+        return
+    snapshot = entry[0]
+    _drop_snapshot_client(snapshot, client.email, client.id)
+    stored = client.model_copy()
+    if stored.email:
+        snapshot["by_email"][stored.email] = stored
+    if stored.id:
+        snapshot["by_id"][str(stored.id)] = stored
+
+
+def drop_snapshot_client(xui: AsyncApi, inbound_id: int, email: str | None = None, client_id: str | None = None):
+    """Убирает удалённого из панели клиента из кэшированного снимка."""
+    entry = _inbound_snapshots.get((_xui_host(xui), int(inbound_id)))
+    if entry:
+        _drop_snapshot_client(entry[0], email, client_id)
+
+
+async def get_inbound_snapshot(xui: AsyncApi, inbound_id: int, force: bool = False) -> dict | None:
+    """
+    Снимок inbound'а: один inbound.get_by_id на INBOUND_SNAPSHOT_TTL секунд.
+    Записи бота поправляют снимок на месте (store_snapshot_client, drop_snapshot_client),
+    поэтому inbound["settings"] в нём может отставать — актуальны by_email и by_id.
+    Возвращает {"inbound", "by_email", "by_id"} или None, если inbound не найден.
+    """
+    key = (_xui_host(xui), int(inbound_id))
+    entry = _inbound_snapshots.get(key)
+    if entry and not force and time.time() - entry[1] < INBOUND_SNAPSHOT_TTL:
+        return entry[0]
+
+    inbound = await xui.inbound.get_by_id(int(inbound_id))
+    if not inbound:
+        _inbound_snapshots.pop(key, None)
+        return None
+
+    clients = []
+    if getattr(inbound, "settings", None) and getattr(inbound.settings, "clients", None):
+        clients = inbound.settings.clients
+
+    snapshot = {
+        "inbound": inbound,
+        "by_email": {c.email: c for c in clients if getattr(c, "email", None)},
+        "by_id": {str(c.id): c for c in clients if getattr(c, "id", None)},
+    }
+    _inbound_snapshots[key] = (snapshot, time.time())
+    return snapshot
+
+
+async def find_inbound_client(xui: AsyncApi, inbound_id: int, email: str) -> py3xui.Client | None:
+    """
+    Ищет клиента в снимке inbound'а. При промахе снимок перечитывается один раз,
+    если он старше INBOUND_MISS_REFRESH_INTERVAL секунд. Возвращает копию.
+    """
+    snapshot = await get_inbound_snapshot(xui, inbound_id)
+    if not snapshot:
+        return None
+    client = snapshot["by_email"].get(email)
+    if client:
+        return client.model_copy()
+
+    entry = _inbound_snapshots.get((_xui_host(xui), int(inbound_id)))
+    if entry and time.time() - entry[1] < INBOUND_MISS_REFRESH_INTERVAL:
+        return None
+    snapshot = await get_inbound_snapshot(xui, inbound_id, force=True)
+    client = snapshot["by_email"].get(email) if snapshot else None
+    return client.model_copy() if client else None
+
+
 async def add_client(xui: py3xui.AsyncApi, config: ClientConfig) -> dict[str, Any]:
     try:
         client = py3xui.Client(
@@ -74,6 +169,7 @@ async def add_client(xui: py3xui.AsyncApi, config: ClientConfig) -> dict[str, An
         )
 
         response = await xui.client.add(config.inbound_id, [client])
+        store_snapshot_client(xui, config.inbound_id, client)
         logger.info(f"Клиент {config.email} успешно добавлен с ID {config.client_id}")
         return response if response else {"status": "failed"}
 
@@ -103,7 +199,7 @@ async def extend_client_key(
     limit_ip: int = 0,
 ) -> bool | None:
     try:
-        client = await xui.client.get_by_email(email)
+        client = await find_inbound_client(xui, inbound_id, email) or await xui.client.get_by_email(email)
         if not client or not client.id:
             logger.warning(f"Клиент с email {email} не найден или не имеет ID.")
             return None
@@ -121,6 +217,7 @@ async def extend_client_key(
         client.tg_id = tg_id
 
         await xui.client.update(client.id, client)
+        store_snapshot_client(xui, inbound_id, client)
         await xui.client.reset_stats(inbound_id, email)
         logger.info(f"Ключ клиента {email} успешно продлён до {new_expiry_time}")
         return True
@@ -134,6 +231,93 @@ async def extend_client_key(
         return False
 
 
+async def update_client(xui: py3xui.AsyncApi, inbound_id: int, client: py3xui.Client) -> bool:
+    """Записывает клиента в inbound как есть, без поиска и сброса статистики."""
+    try:
+        client.inbound_id = inbound_id
+        await xui.client.update(str(client.id), client)
+        store_snapshot_client(xui, inbound_id, client)
+        return True
+    except Exception as e:
+        logger.error(f"Ошибка при обновлении клиента {client.email}: {e}")
+        return False
+
+
+async def add_clients_bulk(
+    xui: py3xui.AsyncApi, inbound_id: int, clients: list[py3xui.Client]
+) -> list[tuple[str, str]]:
+    """
+    Добавляет клиентов в inbound пачками по BULK_CHUNK_SIZE, один addClient на пачку.
+    Панель отклоняет пачку целиком (например, из-за одного дубля email), поэтому отклонённая
+    пачка досылается по одному клиенту. Возвращает (email, ошибка) неудачных.
+    """
+    failed = []
+    for i in range(0, len(clients), BULK_CHUNK_SIZE):
+        chunk = clients[i : i + BULK_CHUNK_SIZE]
+        try:
+            await xui.client.add(inbound_id, chunk)
+            continue
+        except Exception as e:
+            if len(chunk) == 1:
+                failed.append((chunk[0].email, str(e)))
+                continue
+            logger.warning(f"Пачка из {len(chunk)} клиентов отклонена inbound {inbound_id}, добавляем по одному: {e}")
+        for client in chunk:
+            try:
+                await xui.client.add(inbound_id, [client])
+            except Exception as e:
+                failed.append((client.email, str(e)))
+    failed_emails = {email for email, _ in failed}
+    for client in clients:
+        if client.email not in failed_emails:
+            store_snapshot_client(xui, inbound_id, client)
+    if failed:
+        logger.error(f"Inbound {inbound_id}: не удалось добавить клиентов {len(failed)} из {len(clients)}")
+    return failed
+
+
+async def update_clients_bulk(
+    xui: py3xui.AsyncApi, inbound_id: int, changes: dict[str, dict[str, Any]]
+) -> list[tuple[str, str]]:
+    """
+    Меняет поля многих клиентов inbound'а: changes — email → {поле Client: значение}.
+    Текущие записи читаются одним свежим снимком, затем каждый клиент пишется своим updateClient,
+    не больше BULK_UPDATE_CONCURRENCY одновременно — остальные клиенты inbound'а не перезаписываются.
+    Возвращает (email, ошибка) неудачных.
+    """
+    try:
+        snapshot = await get_inbound_snapshot(xui, inbound_id, force=True)
+    except Exception as e:
+        return [(email, str(e)) for email in changes]
+    if not snapshot:
+        return [(email, "inbound не найден") for email in changes]
+
+    by_email = {email.lower(): client for email, client in snapshot["by_email"].items()}
+    semaphore = asyncio.Semaphore(BULK_UPDATE_CONCURRENCY)
+    failed = []
+
+    async def push(email: str, fields: dict[str, Any]):
+        current = by_email.get(email.lower())
+        if not current:
+            failed.append((email, "клиент не найден"))
+            return
+        client = current.model_copy()
+        for name, value in fields.items():
+            setattr(client, name, value)
+        client.inbound_id = inbound_id
+        async with semaphore:
+            try:
+                await xui.client.update(str(current.id), client)
+            except Exception as e:
+                failed.append((email, str(e)))
+                return
+        store_snapshot_client(xui, inbound_id, client)
+
+    await asyncio.gather(*(push(email, fields) for email, fields in changes.items()))
+    logger.info(f"Inbound {inbound_id}: обновлено клиентов {len(changes) - len(failed)} из {len(changes)}")
+    return failed
+
+
 async def delete_client(
     xui: py3xui.AsyncApi,
     inbound_id: int,
@@ -143,16 +327,18 @@ async def delete_client(
     try:
         if SUPERNODE:
             await xui.client.delete(inbound_id, client_id)
+            drop_snapshot_client(xui, inbound_id, email, client_id)
             logger.info(f"Клиент с ID {client_id} был удален успешно (SUPERNODE)")
             return True
 
-        client = await xui.client.get_by_email(email)
+        client = await find_inbound_client(xui, inbound_id, email) or await xui.client.get_by_email(email)
         if not client:
             logger.warning(f"Клиент с email {email} и ID {client_id} не найден")
             return False
 
         client.id = client_id
         await xui.client.delete(inbound_id, client.id)
+        drop_snapshot_client(xui, inbound_id, email, client_id)
         logger.info(f"Клиент с ID {client_id} был удален успешно")
         return True
 
@@ -192,7 +378,7 @@ async def toggle_client(
     enable: bool = True,
 ) -> bool:
     try:
-        client = await xui.client.get_by_email(email)
+        client = await find_inbound_client(xui, inbound_id, email) or await xui.client.get_by_email(email)
         if not client:
             logger.warning(f"Клиент с email {email} и ID {client_id} не найден.")
             return False
@@ -205,6 +391,7 @@ async def toggle_client(
         client.inbound_id = inbound_id
 
         await xui.client.update(client.id, client)
+        store_snapshot_client(xui, inbound_id, client)
         status = "включен" if enable else "отключен"
         logger.info(f"Клиент с email {email} и ID {client_id} успешно {status}.")
         return True
@@ -293,19 +480,15 @@ async def get_vless_link_for_client(
     remark: str | None = None,
 ) -> str | None:
     try:
-        inbound = await xui.inbound.get_by_id(inbound_id)
-        if not inbound:
+        client = await find_inbound_client(xui, inbound_id, email)
+        snapshot = await get_inbound_snapshot(xui, inbound_id)
+        if not snapshot:
             logger.warning(f"Не удалось собрать VLESS ссылку: inbound_id={inbound_id}, email={email}")
             return None
 
-        true_uuid = None
-        client_flow = None
-        if getattr(inbound, "settings", None) and getattr(inbound.settings, "clients", None):
-            for c in inbound.settings.clients:
-                if getattr(c, "email", None) == email:
-                    true_uuid = getattr(c, "id", None)
-                    client_flow = getattr(c, "flow", None)
-                    break
+        inbound = snapshot["inbound"]
+        true_uuid = getattr(client, "id", None) if client else None
+        client_flow = getattr(client, "flow", None) if client else None
 
         if not true_uuid:
             logger.warning(f"Не удалось получить UUID клиента: inbound_id={inbound_id}, email={email}")
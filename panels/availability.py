@@ -0,0 +1,85 @@
+import asyncio
+import time
+
+from config import REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD
+from logger import logger
+from panels._3xui import get_inbound_snapshot, get_xui_instance
+from panels.remnawave_clients import get_remnawave_client
+
+
+AVAILABILITY_CACHE_TTL = 10
+AVAILABILITY_TIMEOUT = 20
+
+_availability_cache: dict[str, tuple[tuple, list[dict], float]] = {}
+
+
+async def _xui_online(api_url: str) -> set[str]:
+    xui = await get_xui_instance(api_url)
+    return {email.lower() for email in await xui.client.online() or []}
+
+
+async def _collect_xui(server: dict, online_by_url: dict[str, asyncio.Task]) -> dict:
+    xui = await get_xui_instance(server["api_url"])
+    online, snapshot = await asyncio.gather(
+        asyncio.shield(online_by_url[server["api_url"]]), get_inbound_snapshot(xui, int(server["inbound_id"]))
+    )
+    if snapshot is None:
+        raise Exception(f"Inbound {server['inbound_id']} не найден")
+    inbound_emails = {email.lower() for email in snapshot["by_email"]}
+    return {"online": len(online & inbound_emails), "nodes": []}
+
+
+async def _collect_remnawave(server: dict) -> dict:
+    if not server.get("inbound_id"):
+        raise Exception("Не указан inbound_id сервера")
+    remna = await get_remnawave_client(server["api_url"])
+    if not remna:
+        raise Exception("Не удалось авторизоваться в Remnawave")
+    nodes_data = await remna.get_all_nodes_with_online(
+        username=REMNAWAVE_LOGIN, password=REMNAWAVE_PASSWORD, inbound_id=server["inbound_id"]
+    )
+    if nodes_data.get("error"):
+        raise Exception(nodes_data["error"])
+    return {"online": nodes_data["total_online"], "nodes": nodes_data["nodes"]}
+
+
+async def collect_cluster_online(cluster_name: str, cluster_servers: list, force: bool = False) -> list[dict]:
+    """
+    Онлайн по серверам кластера: все серверы опрашиваются параллельно, для 3x-ui — один client.online()
+    на панель и снимок inbound'а вместо запроса на каждого клиента. Результат кэшируется на AVAILABILITY_CACHE_TTL.
+    Возвращает по серверу {"server_name", "panel_type", "online", "nodes", "error"} в порядке cluster_servers.
+    Кэш хранится по имени кластера и сбрасывается, если поменялся состав серверов.
+    """
+    signature = tuple((s["server_name"], s["api_url"], s.get("inbound_id")) for s in cluster_servers)
+    entry = _availability_cache.get(cluster_name)
+    if entry and not force and entry[0] == signature and time.monotonic() - entry[2] < AVAILABILITY_CACHE_TTL:
+        return entry[1]
+
+    xui_urls = {s["api_url"] for s in cluster_servers if s.get("panel_type", "3x-ui").lower() == "3x-ui"}
+    online_by_url = {url: asyncio.ensure_future(_xui_online(url)) for url in xui_urls}
+
+    async def collect(server: dict) -> dict:
+        panel_type = server.get("panel_type", "3x-ui").lower()
+        row = {"server_name": server["server_name"], "panel_type": panel_type, "online": 0, "nodes": [], "error": None}
+        try:
+            if panel_type == "3x-ui":
+                row.update(await asyncio.wait_for(_collect_xui(server, online_by_url), AVAILABILITY_TIMEOUT))
+            elif panel_type == "remnawave":
+                row.update(await asyncio.wait_for(_collect_remnawave(server), AVAILABILITY_TIMEOUT))
+        except TimeoutError:
+            row["error"] = "Превышено время ожидания"
+        except Exception as e:
+            row["error"] = str(e) or "Сервер недоступен"
+        if row["error"]:
+            logger.warning(f"[Availability] {server['server_name']}: {row['error']}")
+        return row
+
+    try:
+        rows = await asyncio.gather(*(collect(server) for server in cluster_servers))
+    finally:
+        for task in online_by_url.values():
+            task.cancel()
+        await asyncio.gather(*online_by_url.values(), return_exceptions=True)
+
+    _availability_cache[cluster_name] = (signature, rows, time.monotonic())
+    return rows
@@ -0,0 +1,123 @@
+import asyncio
+import base64
+import json
+import time
+
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from config import REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD
+from logger import logger
+from panels.remnawave import RemnawaveAPI
+
+
+REMNAWAVE_TOKEN_TTL = 1800
+REMNAWAVE_TOKEN_REFRESH_MARGIN = 60
+REMNAWAVE_BULK_CONCURRENCY = 10
+
+_remna_clients: dict[str, tuple[RemnawaveAPI, float]] = {}
+_remna_locks: dict[str, asyncio.Lock] = {}
+
+
+def _token_expires_at(token: str | None) -> float:
+    """Достаёт exp из JWT. Если токен не JWT — считаем его живым REMNAWAVE_TOKEN_TTL секунд."""
+    fallback = time.time() + REMNAWAVE_TOKEN_TTL
+    if not token or token.count(".") != 2:
+        return fallback
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        exp = json.loads(base64.urlsafe_b64decode(payload)).get("exp")
+        return min(float(exp), fallback) if exp else fallback
+    except Exception:
+        return fallback
+
+
+def _is_alive(api: RemnawaveAPI, expires_at: float) -> bool:
+    session = getattr(api, "session", None)
+    if session is not None and getattr(session, "closed", False):
+        return False
+    return time.time() < expires_at - REMNAWAVE_TOKEN_REFRESH_MARGIN
+
+
+async def get_remnawave_client(api_url: str) -> RemnawaveAPI | None:
+    """
+    Авторизованный клиент Remnawave, общий для всех вызовов с этим api_url.
+    Токен переиспользуется до истечения, повторный логин выполняется один раз под блокировкой.
+    Возвращает None, если авторизоваться не удалось.
+    """
+    entry = _remna_clients.get(api_url)
+    if entry and _is_alive(*entry):
+        return entry[0]
+
+    lock = _remna_locks.setdefault(api_url, asyncio.Lock())
+    async with lock:
+        entry = _remna_clients.get(api_url)
+        if entry and _is_alive(*entry):
+            return entry[0]
+
+        api = entry[0] if entry else None
+        if api is not None and getattr(getattr(api, "session", None), "closed", False):
+            await _close_client(api)
+            api = None
+        if api is None:
+            api = RemnawaveAPI(api_url)
+
+        if not await api.login(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD):
+            _remna_clients.pop(api_url, None)
+            await _close_client(api)
+            return None
+
+        _remna_clients[api_url] = (api, _token_expires_at(getattr(api, "token", None)))
+        return api
+
+
+async def pipeline_remnawave_calls(
+    api_url: str,
+    items: list,
+    call: Callable[[RemnawaveAPI, Any], Awaitable[Any]],
+    concurrency: int = REMNAWAVE_BULK_CONCURRENCY,
+) -> list[tuple[Any, Any]]:
+    """
+    Выполняет call(api, item) для каждого элемента, держа в полёте не больше concurrency запросов.
+    У Remnawave нет пакетных методов для наших полей, поэтому пакет — это конвейер одиночных запросов
+    через один авторизованный клиент. Возвращает (item, результат или исключение) в исходном порядке.
+    """
+    api = await get_remnawave_client(api_url)
+    if not api:
+        error = RuntimeError("Не удалось авторизоваться в Remnawave")
+        return [(item, error) for item in items]
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(item):
+        async with semaphore:
+            try:
+                return item, await call(api, item)
+            except Exception as e:
+                return item, e
+
+    return list(await asyncio.gather(*(run(item) for item in items)))
+
+
+def drop_remnawave_client(api_url: str):
+    """Помечает клиента устаревшим — следующий get_remnawave_client выполнит повторный логин."""
+    entry = _remna_clients.get(api_url)
+    if entry:
+        _remna_clients[api_url] = (entry[0], 0.0)
+
+
+async def _close_client(api: RemnawaveAPI):
+    try:
+        await api.aclose()
+    except Exception as e:
+        logger.debug(f"[Remnawave] Ошибка при закрытии клиента {getattr(api, 'base_url', '')}: {e}")
+
+
+async def close_remnawave_clients():
+    clients = [api for api, _ in _remna_clients.values()]
+    _remna_clients.clear()
+    for api in clients:
+        await _close_client(api)
+    if clients:
+        logger.info(f"[Remnawave] Закрыто {len(clients)} клиентов")
@@ -1,56 +1,86 @@
 import asyncio
 import re
 import ssl
+import time
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from functools import partial
 
 from aiogram.types import InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from ping3 import ping
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from bot import bot
+import config as cfg
+
 from config import ADMIN_ID, PING_TIME
-from database import get_servers
+from database import OUTBOX_PRIORITY_ALERT, async_session_maker, enqueue_outbox_message, get_servers
 from handlers.admin.servers.keyboard import AdminServerCallback
 from logger import logger
 
 
+PING_CONCURRENCY = getattr(cfg, "PING_CONCURRENCY", 10)
+PING_TIMEOUT = getattr(cfg, "PING_TIMEOUT", 3)
+LATENCY_HISTORY_SIZE = 30
+
 last_ping_times = {}
 last_down_times = {}
 notified_servers = set()
-PING_SEMAPHORE = asyncio.Semaphore(3)
+latency_history: dict[str, deque] = {}
+PING_SEMAPHORE = asyncio.Semaphore(PING_CONCURRENCY)
+_ping_executor = ThreadPoolExecutor(max_workers=PING_CONCURRENCY, thread_name_prefix="ping")
 
 
-async def ping_server(server_ip: str) -> bool:
-    """Пингует сервер через ICMP или TCP 443, если ICMP недоступен."""
+async def probe_server(server_ip: str) -> float | None:
+    """
+    Возвращает задержку до сервера в секундах или None, если сервер недоступен.
+    ICMP выполняется в отдельном пуле потоков и не блокирует event loop, при неудаче — TCP/TLS 443.
+    """
     async with PING_SEMAPHORE:
+        loop = asyncio.get_running_loop()
         try:
-            response = ping(server_ip, timeout=3)
+            response = await loop.run_in_executor(_ping_executor, partial(ping, server_ip, timeout=PING_TIMEOUT))
             if response is not None and response is not False:
-                return True
-            return await check_tcp_connection(server_ip, 443)
+                return float(response)
         except Exception:
-            return await check_tcp_connection(server_ip, 443)
+            pass
+        return await measure_tcp_connection(server_ip, 443)
 
 
-async def check_tcp_connection(host: str, port: int) -> bool:
-    """Проверяет доступность сервера через TCP с попыткой SSL-соединения."""
+async def measure_tcp_connection(host: str, port: int) -> float | None:
+    """Замеряет время TCP/TLS-подключения. None — сервер недоступен."""
+    started = time.monotonic()
     try:
         ssl_context = ssl.create_default_context()
-        _reader, writer = await asyncio.open_connection(host, port, ssl=ssl_context)
+        _reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=ssl_context), timeout=PING_TIMEOUT * 2
+        )
         writer.close()
         await writer.wait_closed()
-        return True
+        return time.monotonic() - started
     except ssl.SSLError as e:
         err_text = str(e).lower()
         if "certificate has expired" in err_text:
             logger.warning(f"[SSL Error] Сертификат сервера {host} просрочен: {e}")
             await notify_ssl_error(host, str(e))
-            return False
-        return True
+            return None
+        return time.monotonic() - started
     except Exception:
-        return False
+        return None
+
+
+def record_latency(server_name: str, latency: float | None):
+    history = latency_history.get(server_name)
+    if history is None:
+        history = latency_history[server_name] = deque(maxlen=LATENCY_HISTORY_SIZE)
+    history.append((datetime.now(), latency))
+
+
+def get_latency_history(server_name: str) -> list[tuple[datetime, float | None]]:
+    """История последних замеров задержки сервера: (время, секунды или None при недоступности)."""
+    return list(latency_history.get(server_name, ()))
 
 
 async def notify_ssl_error(server_host: str, error_text: str):
@@ -59,12 +89,16 @@ async def notify_ssl_error(server_host: str, error_text: str):
         f"<b>Описание:</b> {error_text}\n"
         "Проверьте корректность сертификата или конфигурации HTTPS."
     )
-    for admin_id in ADMIN_ID:
-        await bot.send_message(admin_id, message)
+    async with async_session_maker() as session:
+        for admin_id in ADMIN_ID:
+            await enqueue_outbox_message(
+                session, admin_id, message, priority=OUTBOX_PRIORITY_ALERT, message_class="server_alert"
+            )
+        await session.commit()
 
 
-async def notify_admin(server_name: str, status: str, down_duration: timedelta = None):
-    """Отправляет уведомление администратору."""
+async def notify_admin(server_name: str, status: str, event_time: datetime, down_duration: timedelta = None):
+    """Отправляет уведомление администратору. event_time — момент падения сервера, по нему гасятся повторы."""
     builder = InlineKeyboardBuilder()
     builder.row(
         InlineKeyboardButton(
@@ -82,9 +116,20 @@ async def notify_admin(server_name: str, status: str, down_duration: timedelta =
         downtime = str(down_duration).split(".")[0]
         message = f"✅ <b>Сервер '{server_name}' снова в сети!</b>\n\n⏳ Время простоя: {downtime}."
 
-    for admin_id in ADMIN_ID:
-        logger.info(f"📨 Отправляем уведомление '{status}' администратору {admin_id} о сервере {server_name}")
-        await bot.send_message(admin_id, message, reply_markup=builder.as_markup())
+    keyboard = builder.as_markup().model_dump()
+    async with async_session_maker() as session:
+        for admin_id in ADMIN_ID:
+            logger.info(f"📨 Отправляем уведомление '{status}' администратору {admin_id} о сервере {server_name}")
+            await enqueue_outbox_message(
+                session,
+                admin_id,
+                message,
+                priority=OUTBOX_PRIORITY_ALERT,
+                message_class="server_alert",
+                dedup_key=f"server_{status}:{server_name}:{event_time.isoformat()}:{admin_id}",
+                keyboard=keyboard,
+            )
+        await session.commit()
 
 
 async def check_servers(session: AsyncSession):
@@ -106,7 +151,7 @@ async def check_servers(session: AsyncSession):
                 server_host = extract_host(original_api_url)
 
                 server_info_list.append((server_name, server_host))
-                tasks.append(ping_server(server_host))
+                tasks.append(probe_server(server_host))
 
         logger.info(f"Начинаем проверку {len(server_info_list)} серверов...")
 
@@ -117,7 +162,9 @@ async def check_servers(session: AsyncSession):
         online_servers = set()
 
         for (server_name, server_host), result in zip(server_info_list, results, strict=False):
-            is_online = bool(result) if not isinstance(result, Exception) else False
+            latency = result if not isinstance(result, Exception) else None
+            is_online = latency is not None
+            record_latency(server_name, latency)
 
             if is_online:
                 last_ping_times[server_name] = current_time
@@ -126,7 +173,7 @@ async def check_servers(session: AsyncSession):
                 if server_name in notified_servers:
                     down_time = last_down_times.pop(server_name, current_time)
                     down_duration = current_time - down_time
-                    await notify_admin(server_name, "up", down_duration)
+                    await notify_admin(server_name, "up", down_time, down_duration)
 
                     notified_servers.remove(server_name)
                     restored_servers.add(server_name)
@@ -143,9 +190,9 @@ async def check_servers(session: AsyncSession):
                         logger.warning(
                             f"🚨 Уведомление: сервер {server_name} не отвечает более {PING_TIME * 3} секунд!"
                         )
-                        await notify_admin(server_name, "down")
-                        notified_servers.add(server_name)
                         last_down_times[server_name] = current_time
+                        await notify_admin(server_name, "down", current_time)
+                        notified_servers.add(server_name)
                     offline_servers.add(server_name)
 
         all_servers = {name for name, _ in server_info_list}
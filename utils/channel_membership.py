@@ -0,0 +1,103 @@
+import asyncio
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from aiogram.types import ChatMember
+from sqlalchemy import select
+
+import config as cfg
+
+from bot import bot
+from database import async_session_maker
+from database.models import User
+from logger import logger
+from utils.shared_storage import get_shared_cache
+from utils.update_sharding import is_primary_worker
+
+
+CHANNEL_MEMBER_CACHE_TTL = getattr(cfg, "CHANNEL_MEMBER_CACHE_TTL", 3600)
+CHANNEL_NOT_MEMBER_CACHE_TTL = getattr(cfg, "CHANNEL_NOT_MEMBER_CACHE_TTL", 600)
+CHANNEL_MEMBER_WARMUP_LIMIT = getattr(cfg, "CHANNEL_MEMBER_WARMUP_LIMIT", 0)
+CHANNEL_MEMBER_WARMUP_CONCURRENCY = 5
+
+MEMBER_STATUSES = ("member", "administrator", "creator")
+
+_membership_cache = get_shared_cache("channel_member")
+_warmup_task: asyncio.Task | None = None
+
+
+def is_member_status(member: ChatMember) -> bool:
+    return member.status in MEMBER_STATUSES
+
+
+async def remember_channel_membership(tg_id: int, is_member: bool):
+    ttl = CHANNEL_MEMBER_CACHE_TTL if is_member else CHANNEL_NOT_MEMBER_CACHE_TTL
+    await _membership_cache.set(str(tg_id), is_member, ttl)
+
+
+async def forget_channel_membership(tg_id: int):
+    await _membership_cache.delete(str(tg_id))
+
+
+async def check_channel_membership(tg_id: int, force: bool = False) -> bool:
+    """
+    Подписан ли пользователь на CHANNEL_ID.
+    Результат кэшируется; обновления chat_member из канала меняют кэш сразу,
+    поэтому повторный запрос к Telegram нужен только при force (кнопка «Я подписался») или по истечении TTL.
+    Ошибки Telegram пробрасываются и не кэшируются.
+    """
+    if not force:
+        cached = await _membership_cache.get(str(tg_id))
+        if cached is not None:
+            return cached
+
+    member = await bot.get_chat_member(cfg.CHANNEL_ID, tg_id)
+    is_member = is_member_status(member)
+    await remember_channel_membership(tg_id, is_member)
+    return is_member
+
+
+async def _warm_up_channel_members(limit: int):
+    async with async_session_maker() as session:
+        result = await session.execute(
+            select(User.tg_id)
+            .where(User.is_bot.is_not(True))
+            .order_by(User.updated_at.desc().nulls_last())
+            .limit(limit)
+        )
+        tg_ids = result.scalars().all()
+
+    semaphore = asyncio.Semaphore(CHANNEL_MEMBER_WARMUP_CONCURRENCY)
+    members = 0
+
+    async def check(tg_id: int):
+        nonlocal members
+        async with semaphore:
+            try:
+                if await check_channel_membership(tg_id, force=True):
+                    members += 1
+            except TelegramRetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+            except (TelegramBadRequest, TelegramForbiddenError):
+                pass
+
+    await asyncio.gather(*(check(tg_id) for tg_id in tg_ids))
+    logger.info(f"[Subscription] Прогрев кэша подписки: проверено {len(tg_ids)}, подписаны {members}")
+
+
+async def start_channel_membership_warmup():
+    """Фоновая проверка подписки последних активных пользователей, если задан CHANNEL_MEMBER_WARMUP_LIMIT."""
+    global _warmup_task
+    if not (cfg.CHANNEL_EXISTS and cfg.CHANNEL_REQUIRED and CHANNEL_MEMBER_WARMUP_LIMIT):
+        return
+    if not is_primary_worker() or (_warmup_task and not _warmup_task.done()):
+        return
+    _warmup_task = asyncio.create_task(_warm_up_channel_members(CHANNEL_MEMBER_WARMUP_LIMIT))
+
+
+async def stop_channel_membership_warmup():
+    global _warmup_task
+    if not _warmup_task:
+        return
+    _warmup_task.cancel()
+    await asyncio.gather(_warmup_task, return_exceptions=True)
+    _warmup_task = None
@@ -0,0 +1,265 @@
+import asyncio
+import json
+import time
+import uuid
+
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any
+
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.memory import MemoryStorage
+from cachetools import TLRUCache
+
+import config as cfg
+
+from logger import logger
+
+
+REDIS_URL = getattr(cfg, "REDIS_URL", None)
+SHARED_CACHE_PREFIX = getattr(cfg, "SHARED_CACHE_PREFIX", "solobot")
+MEMORY_CACHE_MAXSIZE = 100_000
+INVALIDATION_CHECK_INTERVAL = getattr(cfg, "INVALIDATION_CHECK_INTERVAL", 1.0)
+INVALIDATION_TOKEN_TTL = 30 * 24 * 3600
+
+_INCR_WITH_TTL = """
+local value = redis.call("INCR", KEYS[1])
+if value == 1 then
+    redis.call("PEXPIRE", KEYS[1], ARGV[1])
+end
+return value
+"""
+
+
+def _encode(value: Any) -> str:
+    def default(obj):
+        if isinstance(obj, datetime):
+            return {"__dt__": obj.isoformat()}
+        raise TypeError(f"Тип {type(obj).__name__} не сериализуется")
+
+    return json.dumps(value, default=default, ensure_ascii=False)
+
+
+def _decode(raw: str | bytes | None) -> Any:
+    if raw is None:
+        return None
+
+    def hook(obj):
+        if len(obj) == 1 and "__dt__" in obj:
+            return datetime.fromisoformat(obj["__dt__"])
+        return obj
+
+    return json.loads(raw, object_hook=hook)
+
+
+class SharedCache(ABC):
+    """Кэш «ключ — значение» с TTL. Значения должны сериализоваться в JSON (datetime поддерживается)."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _count(self, value: Any) -> Any:
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def stats(self) -> dict[str, Any]:
+        return {"size": None, "maxsize": None, "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    @abstractmethod
+    async def get(self, key: str) -> Any: ...
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl: float): ...
+
+    @abstractmethod
+    async def delete(self, *keys: str): ...
+
+    @abstractmethod
+    async def incr(self, key: str, ttl: float) -> int:
+        """Увеличивает счётчик; TTL выставляется при создании ключа."""
+
+    @abstractmethod
+    async def clear(self): ...
+
+
+class MemoryCache(SharedCache):
+    """
+    LRU-кэш в памяти процесса — поведение по умолчанию, когда REDIS_URL не задан.
+    Срок жизни у каждой записи свой (TLRUCache держит их в куче), при переполнении
+    сначала уходят просроченные записи, затем давно не использованные.
+    """
+
+    def __init__(self, maxsize: int = MEMORY_CACHE_MAXSIZE):
+        super().__init__()
+        self.maxsize = maxsize
+        self._data: TLRUCache = TLRUCache(maxsize, ttu=lambda _key, entry, _now: entry[0], timer=time.monotonic)
+
+    def _store(self, key: str, expires_at: float, value: Any):
+        self.evictions += len(self._data.expire())
+        if key not in self._data and len(self._data) >= self.maxsize:
+            self.evictions += 1
+        self._data[key] = (expires_at, value)
+
+    def stats(self) -> dict[str, Any]:
+        return {**super().stats(), "size": len(self._data), "maxsize": self.maxsize}
+
+    async def get(self, key: str) -> Any:
+        entry = self._data.get(key)
+        return self._count(entry[1] if entry else None)
+
+    async def set(self, key: str, value: Any, ttl: float):
+        self._store(key, time.monotonic() + ttl, value)
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self._data.pop(key, None)
+
+    async def incr(self, key: str, ttl: float) -> int:
+        entry = self._data.get(key)
+        if entry:
+            value = entry[1] + 1
+            self._data[key] = (entry[0], value)
+        else:
+            value = 1
+            self._store(key, time.monotonic() + ttl, value)
+        return value
+
+    async def clear(self):
+        self._data.clear()
+
+
+class RedisCache(SharedCache):
+    """Кэш в Redis (или любом сервере с протоколом Redis), общий для всех процессов бота."""
+
+    def __init__(self, client, prefix: str):
+        super().__init__()
+        self.client = client
+        self.prefix = prefix
+        self._incr_with_ttl = client.register_script(_INCR_WITH_TTL)
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    async def get(self, key: str) -> Any:
+        return self._count(_decode(await self.client.get(self._key(key))))
+
+    async def set(self, key: str, value: Any, ttl: float):
+        await self.client.set(self._key(key), _encode(value), px=max(int(ttl * 1000), 1))
+
+    async def delete(self, *keys: str):
+        if keys:
+            await self.client.delete(*(self._key(key) for key in keys))
+
+    async def incr(self, key: str, ttl: float) -> int:
+        """INCR и PEXPIRE выполняются одним Lua-скриптом, чтобы счётчик не остался без TTL."""
+        value = await self._incr_with_ttl(keys=[self._key(key)], args=[max(int(ttl * 1000), 1)])
+        return int(value)
+
+    async def clear(self):
+        keys = [key async for key in self.client.scan_iter(match=self._key("*"), count=1000)]
+        for i in range(0, len(keys), 1000):
+            await self.client.delete(*keys[i : i + 1000])
+
+
+_redis_client = None
+_caches: dict[str, SharedCache] = {}
+
+
+def _get_redis_client():
+    global _redis_client
+    if _redis_client is None:
+        from redis.asyncio import Redis
+
+        _redis_client = Redis.from_url(REDIS_URL)
+        logger.info("[Storage] Используется общий Redis для FSM и кэшей")
+    return _redis_client
+
+
+def get_shared_cache(namespace: str, maxsize: int = MEMORY_CACHE_MAXSIZE) -> SharedCache:
+    """
+    Кэш для пространства имён: Redis при заданном REDIS_URL, иначе LRU в памяти процесса на maxsize записей.
+    В Redis размер ограничивают TTL записей и maxmemory-policy сервера.
+    """
+    cache = _caches.get(namespace)
+    if cache is None:
+        if REDIS_URL:
+            cache = RedisCache(_get_redis_client(), f"{SHARED_CACHE_PREFIX}:{namespace}")
+        else:
+            cache = MemoryCache(maxsize)
+        _caches[namespace] = cache
+    return cache
+
+
+def get_cache_stats() -> dict[str, dict[str, Any]]:
+    """Размер и счётчики попаданий, промахов и вытеснений по пространствам имён (с момента запуска процесса)."""
+    return {namespace: cache.stats() for namespace, cache in sorted(_caches.items())}
+
+
+_invalidation_tokens: dict[str, tuple[str | None, float]] = {}
+_invalidation_tasks: set[asyncio.Task] = set()
+
+
+def publish_invalidation(name: str):
+    """
+    Сообщает другим процессам, что кэш name в их памяти устарел: в Redis записывается новый токен.
+    Без REDIS_URL процесс один и достаточно локального сброса, поэтому ничего не делает.
+    """
+    if not REDIS_URL:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+
+    async def publish():
+        try:
+            await get_shared_cache("invalidation").set(name, uuid.uuid4().hex, INVALIDATION_TOKEN_TTL)
+        except Exception as e:
+            logger.warning(f"[Storage] Не удалось опубликовать сброс кэша {name}: {e}")
+
+    task = loop.create_task(publish())
+    _invalidation_tasks.add(task)
+    task.add_done_callback(_invalidation_tasks.discard)
+
+
+async def get_invalidation_token(name: str) -> str | None:
+    """
+    Текущий токен сброса кэша name. Процесс перезагружает свой кэш, если токен отличается от того,
+    с которым кэш был загружен. Redis опрашивается не чаще INVALIDATION_CHECK_INTERVAL; без REDIS_URL — всегда None.
+    """
+    if not REDIS_URL:
+        return None
+    token, checked_at = _invalidation_tokens.get(name, (None, float("-inf")))
+    if time.monotonic() - checked_at >= INVALIDATION_CHECK_INTERVAL:
+        try:
+            token = await get_shared_cache("invalidation").get(name)
+        except Exception as e:
+            logger.warning(f"[Storage] Не удалось прочитать токен сброса кэша {name}: {e}")
+        _invalidation_tokens[name] = (token, time.monotonic())
+    return token
+
+
+def create_fsm_storage() -> BaseStorage:
+    if REDIS_URL:
+        from aiogram.fsm.storage.redis import DefaultKeyBuilder, RedisStorage
+
+        return RedisStorage(
+            _get_redis_client(),
+            key_builder=DefaultKeyBuilder(prefix=f"{SHARED_CACHE_PREFIX}:fsm"),
+        )
+    return MemoryStorage()
+
+
+async def close_shared_storage():
+    global _redis_client
+    if _invalidation_tasks:
+        await asyncio.gather(*_invalidation_tasks, return_exceptions=True)
+    _caches.clear()
+    if _redis_client is not None:
+        await _redis_client.aclose()
+        _redis_client = None
@@ -0,0 +1,304 @@
+"""
+Приём вебхуков Telegram с распределением обновлений по нескольким процессам.
+
+Процесс-супервизор принимает POST от Telegram и отправляет каждое обновление в воркер
+по from_user.id (или chat.id), поэтому обновления одного пользователя всегда
+обрабатываются одним процессом и по порядку. Упавший воркер перезапускается,
+накопившиеся для него обновления дожидаются его в очереди.
+
+Запуск: python -m utils.update_sharding — вместо обычного запуска бота, не параллельно с ним.
+Диспетчер воркера собирает bot.create_worker_dispatcher: те же роутеры и middleware, что и при обычном запуске.
+Вебхук в Telegram регистрирует только супервизор (SHARDED_WEBHOOK_URL), фоновые и периодические задачи
+(outbox, рассылки, уведомления, проверка серверов, бэкапы) работают только в воркере №0.
+Ограничение: HTTP-маршруты обычного запуска — вебхуки платёжных систем и API — здесь не обслуживаются,
+поэтому при включённых PROVIDERS_ENABLED с вебхуками или API_ENABLE запуск отклоняется (см. check_sharding_supported).
+Оплата Telegram Stars работает через обновления бота и поддерживается.
+FSM и кэши должны жить в общем хранилище (REDIS_URL): без него состояние пользователя остаётся в памяти
+его воркера, а кэши тарифов, топологии, счётчиков ключей и заблокировавших не сбрасываются в других воркерах.
+"""
+
+import asyncio
+import importlib
+import multiprocessing as mp
+import os
+import queue
+import signal
+import time
+
+from typing import Any
+
+from aiohttp import web
+
+import config as cfg
+
+from logger import logger
+
+
+# Шардированный режим не обслуживает вебхуки платёжных систем и API — см. docstring модуля.
+SHARDED_WEBHOOK_HOST = getattr(cfg, "SHARDED_WEBHOOK_HOST", "0.0.0.0")
+SHARDED_WEBHOOK_PORT = getattr(cfg, "SHARDED_WEBHOOK_PORT", 3001)
+SHARDED_WEBHOOK_PATH = getattr(cfg, "SHARDED_WEBHOOK_PATH", "/webhook")
+SHARDED_WEBHOOK_SECRET = getattr(cfg, "SHARDED_WEBHOOK_SECRET", None)
+SHARDED_WEBHOOK_WORKERS = getattr(cfg, "SHARDED_WEBHOOK_WORKERS", os.cpu_count() or 1)
+SHARDED_WEBHOOK_URL = getattr(cfg, "SHARDED_WEBHOOK_URL", None)
+SHARDED_DISPATCHER_FACTORY = getattr(cfg, "SHARDED_DISPATCHER_FACTORY", "bot:create_worker_dispatcher")
+
+WEBHOOK_FREE_PROVIDERS = {"STARS"}
+
+WORKER_INDEX_ENV = "SOLOBOT_WORKER_INDEX"
+WORKER_QUEUE_SIZE = 10_000
+WORKER_RESTART_DELAY = 1.0
+WORKER_RESTART_MAX_DELAY = 30.0
+WORKER_STABLE_UPTIME = 60.0
+
+_USER_EVENT_FIELDS = (
+    "message",
+    "edited_message",
+    "callback_query",
+    "inline_query",
+    "chosen_inline_result",
+    "shipping_query",
+    "pre_checkout_query",
+    "poll_answer",
+    "my_chat_member",
+    "chat_member",
+    "chat_join_request",
+    "message_reaction",
+)
+
+
+def is_primary_worker() -> bool:
+    """True в обычном однопроцессном запуске и в воркере №0 — фоновые задачи должны работать только там."""
+    return os.environ.get(WORKER_INDEX_ENV, "0") == "0"
+
+
+def check_sharding_supported():
+    """
+    Отклоняет запуск, если включено то, что шардированный режим не обслуживает:
+    платёжные системы с HTTP-вебхуками или API. Иначе оплаты молча перестали бы зачисляться.
+    """
+    unsupported = [
+        name
+        for name, enabled in (getattr(cfg, "PROVIDERS_ENABLED", None) or {}).items()
+        if enabled and name not in WEBHOOK_FREE_PROVIDERS
+    ]
+    if getattr(cfg, "API_ENABLE", False):
+        unsupported.append("API_ENABLE")
+    if unsupported:
+        raise RuntimeError(
+            "Шардированный приём вебхуков не обслуживает вебхуки платёжных систем и API, "
+            f"отключите их или используйте обычный запуск: {', '.join(unsupported)}"
+        )
+
+
+def get_shard_key(update: dict) -> int:
+    """Ключ шардирования: id пользователя, иначе id чата, иначе update_id."""
+    for field in _USER_EVENT_FIELDS:
+        event = update.get(field)
+        if not event:
+            continue
+        user = event.get("from") or event.get("user")
+        if user and "id" in user:
+            return int(user["id"])
+        chat = event.get("chat") or (event.get("message") or {}).get("chat")
+        if chat and "id" in chat:
+            return int(chat["id"])
+    return int(update.get("update_id", 0))
+
+
+def get_shard(update: dict, workers: int) -> int:
+    return get_shard_key(update) % workers
+
+
+def _load_dispatcher(factory_path: str):
+    """
+    SHARDED_DISPATCHER_FACTORY — "модуль:имя" функции, возвращающей полностью настроенные (dispatcher, bot).
+    Готовый Dispatcher тоже принимается (с bot из bot.py), но он должен уже содержать все роутеры и middleware.
+    """
+    from aiogram import Dispatcher
+
+    module_name, _, attr = factory_path.partition(":")
+    target = getattr(importlib.import_module(module_name), attr or "dp")
+    if isinstance(target, Dispatcher):
+        from bot import bot
+
+        return target, bot
+    return target()
+
+
+async def _worker_loop(index: int, updates: mp.Queue, factory_path: str):
+    dp, bot = _load_dispatcher(factory_path)
+    loop = asyncio.get_running_loop()
+    user_locks: dict[int, list] = {}
+    tasks: set[asyncio.Task] = set()
+
+    async def process(key: int, update: dict):
+        entry = user_locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await dp.feed_raw_update(bot, update)
+        except Exception as e:
+            logger.error(f"[Shard {index}] Ошибка обработки обновления {update.get('update_id')}: {e}")
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                user_locks.pop(key, None)
+
+    await dp.emit_startup(bot=bot, dispatcher=dp, worker_index=index)
+    logger.info(f"[Shard {index}] Воркер запущен, pid {os.getpid()}")
+    try:
+        while True:
+            update = await loop.run_in_executor(None, updates.get)
+            if update is None:
+                break
+            task = asyncio.create_task(process(get_shard_key(update), update))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    finally:
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        await dp.emit_shutdown(bot=bot, dispatcher=dp, worker_index=index)
+        await bot.session.close()
+
+
+def _worker_main(index: int, updates: mp.Queue, factory_path: str):
+    os.environ[WORKER_INDEX_ENV] = str(index)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_worker_loop(index, updates, factory_path))
+
+
+class ShardSupervisor:
+    """Держит N процессов-воркеров и перезапускает упавшие с экспоненциальной задержкой."""
+
+    def __init__(self, workers: int, factory_path: str):
+        self.workers = max(int(workers), 1)
+        self.factory_path = factory_path
+        self.ctx = mp.get_context("spawn")
+        self.queues: list[mp.Queue] = [self.ctx.Queue(WORKER_QUEUE_SIZE) for _ in range(self.workers)]
+        self.processes: list[Any] = [None] * self.workers
+        self.started_at = [0.0] * self.workers
+        self.restart_delay = [WORKER_RESTART_DELAY] * self.workers
+        self._stopping = False
+
+    def _spawn(self, index: int):
+        process = self.ctx.Process(
+            target=_worker_main,
+            args=(index, self.queues[index], self.factory_path),
+            name=f"solobot-shard-{index}",
+            daemon=True,
+        )
+        process.start()
+        self.processes[index] = process
+        self.started_at[index] = time.monotonic()
+
+    def start(self):
+        for index in range(self.workers):
+            self._spawn(index)
+
+    def dispatch(self, update: dict) -> bool:
+        index = get_shard(update, self.workers)
+        try:
+            self.queues[index].put_nowait(update)
+            return True
+        except queue.Full:
+            logger.error(f"[Shard {index}] Очередь переполнена, обновление {update.get('update_id')} отклонено")
+            return False
+
+    async def watch(self):
+        while not self._stopping:
+            for index, process in enumerate(self.processes):
+                if process is None or process.is_alive():
+                    continue
+                uptime = time.monotonic() - self.started_at[index]
+                if uptime >= WORKER_STABLE_UPTIME:
+                    self.restart_delay[index] = WORKER_RESTART_DELAY
+                delay = self.restart_delay[index]
+                logger.error(
+                    f"[Shard {index}] Воркер завершился с кодом {process.exitcode}, перезапуск через {delay:.0f} с"
+                )
+                self.processes[index] = None
+                self.restart_delay[index] = min(delay * 2, WORKER_RESTART_MAX_DELAY)
+                asyncio.get_running_loop().call_later(delay, self._respawn, index)
+            await asyncio.sleep(1)
+
+    def _respawn(self, index: int):
+        if not self._stopping and self.processes[index] is None:
+            self._spawn(index)
+
+    def stop(self, timeout: float = 30.0):
+        self._stopping = True
+        for updates in self.queues:
+            updates.put(None)
+        deadline = time.monotonic() + timeout
+        for process in self.processes:
+            if process is not None:
+                process.join(max(deadline - time.monotonic(), 0))
+                if process.is_alive():
+                    process.terminate()
+
+
+def build_ingress_app(supervisor: ShardSupervisor) -> web.Application:
+    async def handle_update(request: web.Request) -> web.Response:
+        if SHARDED_WEBHOOK_SECRET and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != SHARDED_WEBHOOK_SECRET:
+            return web.Response(status=401)
+        try:
+            update = await request.json()
+        except Exception:
+            return web.Response(status=400)
+        if not supervisor.dispatch(update):
+            return web.Response(status=503)
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(SHARDED_WEBHOOK_PATH, handle_update)
+    return app
+
+
+async def _register_webhook():
+    """Регистрирует вебхук один раз в процессе-супервизоре; воркеры webhook не трогают."""
+    if not SHARDED_WEBHOOK_URL:
+        logger.warning("[Shard] SHARDED_WEBHOOK_URL не задан, вебхук Telegram должен быть настроен вручную")
+        return
+    from aiogram import Bot
+
+    from config import API_TOKEN
+
+    bot = Bot(token=API_TOKEN)
+    try:
+        await bot.set_webhook(url=SHARDED_WEBHOOK_URL, secret_token=SHARDED_WEBHOOK_SECRET)
+        logger.info(f"[Shard] Вебхук Telegram установлен на {SHARDED_WEBHOOK_URL}")
+    finally:
+        await bot.session.close()
+
+
+async def run_sharded_webhook():
+    check_sharding_supported()
+    await _register_webhook()
+    supervisor = ShardSupervisor(SHARDED_WEBHOOK_WORKERS, SHARDED_DISPATCHER_FACTORY)
+    supervisor.start()
+    watcher = asyncio.create_task(supervisor.watch())
+
+    runner = web.AppRunner(build_ingress_app(supervisor))
+    await runner.setup()
+    site = web.TCPSite(runner, SHARDED_WEBHOOK_HOST, SHARDED_WEBHOOK_PORT)
+    await site.start()
+    logger.info(
+        f"[Shard] Приём вебхуков на {SHARDED_WEBHOOK_HOST}:{SHARDED_WEBHOOK_PORT}{SHARDED_WEBHOOK_PATH}, "
+        f"воркеров: {supervisor.workers}"
+    )
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+    try:
+        await stop_event.wait()
+    finally:
+        watcher.cancel()
+        await runner.cleanup()
+        await loop.run_in_executor(None, supervisor.stop)
+
+
+if __name__ == "__main__":
+    asyncio.run(run_sharded_webhook())